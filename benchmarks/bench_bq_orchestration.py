@@ -0,0 +1,71 @@
+import argparse
+import logging
+import os
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "process_tiktok_data"))
+
+import batch_loader
+import bq_jobs
+import records
+import schemas
+from google.cloud import bigquery
+from local_gcp import LocalBigQueryClient, LocalStorageClient
+
+# Compares serial and concurrent BigQuery job orchestration for batch flushes.
+# The sqlite-backed BigQuery is given a per-job run time and a per-call round
+# trip, so the numbers show how the profile, video and (with
+# VIDEO_LOAD_MODE=both) snapshot pipelines overlap, not how fast sqlite is.
+#
+#   python benchmarks/bench_bq_orchestration.py --job-latency 1.0 --api-latency 0.1
+#   VIDEO_LOAD_MODE=both python benchmarks/bench_bq_orchestration.py
+
+def stage_batch(storage_client, flush_index, profiles, videos_per_profile):
+    timestamp = f"2024-01-01T00:{flush_index:02d}:00Z"
+    for index in range(profiles):
+        username = f"bench_bq_{index}"
+        profile = {"username": username, "follower_count": flush_index, "scrape_timestamp": timestamp}
+        videos = [
+            {"url": f"https://www.tiktok.com/@{username}/video/{video}", "views": flush_index * 100 + video,
+             "like_count": video, "comment_count": 0, "share_count": 0}
+            for video in range(videos_per_profile)
+        ]
+        batch_loader.stage_processed(storage_client, profile, records.VideoBatch.from_rows(videos),
+                                     username=username, scrape_timestamp=timestamp)
+
+def run(mode, args):
+    bq_jobs.BQ_PIPELINE_MODE = mode
+    batch_loader.forget_tables()
+    storage_client = LocalStorageClient()
+    bq_client = LocalBigQueryClient(storage_client, job_latency_seconds=args.job_latency, api_latency_seconds=args.api_latency)
+    for table_id, fields in ((batch_loader.PROFILE_TABLE_ID, schemas.PROFILE_FIELDS), (batch_loader.VIDEO_TABLE_ID, schemas.VIDEO_FIELDS)):
+        bq_client.create_table(bigquery.Table(table_id, schema=schemas.to_schema(fields)))
+    bq_client.jobs.clear()
+
+    timings = []
+    for flush_index in range(args.flushes):
+        stage_batch(storage_client, flush_index, args.profiles, args.videos)
+        started = time.perf_counter()
+        batch_loader.flush_all(storage_client, bq_client)
+        timings.append(time.perf_counter() - started)
+    created = sum(1 for job in bq_client.jobs if job[0] == "create_table")
+    return timings, created
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark serial vs concurrent BigQuery pipelines.")
+    parser.add_argument("--job-latency", type=float, default=0.5, help="Simulated seconds per load/query job")
+    parser.add_argument("--api-latency", type=float, default=0.05, help="Simulated seconds per API round trip")
+    parser.add_argument("--flushes", type=int, default=3, help="Flushes per mode (one warm instance)")
+    parser.add_argument("--profiles", type=int, default=20, help="Profiles per batch")
+    parser.add_argument("--videos", type=int, default=30, help="Videos per profile")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    print(f"VIDEO_LOAD_MODE={batch_loader.VIDEO_LOAD_MODE}, job {args.job_latency}s, round trip {args.api_latency}s")
+    print(f"{'mode':<12}{'first flush s':>14}{'warm flush s':>14}{'create_table calls':>20}")
+    for mode in ("serial", "concurrent"):
+        timings, created = run(mode, args)
+        warm = sum(timings[1:]) / len(timings[1:]) if len(timings) > 1 else timings[0]
+        print(f"{mode:<12}{timings[0]:>14.2f}{warm:>14.2f}{created:>20}")
@@ -0,0 +1,92 @@
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "process_tiktok_data"))
+
+import columnar
+import schemas
+
+# Compares the NDJSON staging files the loader used to write with the typed
+# Parquet it writes now: encode time and bytes that have to go through GCS.
+#
+#   python benchmarks/bench_columnar.py --rows 100000
+
+def synthetic_videos(count):
+    return [
+        {
+            "url": f"https://www.tiktok.com/@creator{index % 500}/video/{7000000000000000000 + index}",
+            "views": 1000 + index * 7 if index % 50 else "N/A",
+            "thumbnail": f"https://p16-sign.tiktokcdn.com/obj/{index:016x}.jpeg",
+            "description": f"video {index} #fyp #creator{index % 500}",
+            "create_time": str(1700000000 + index),
+            "like_count": index * 3,
+            "comment_count": index % 97,
+            "share_count": index % 13,
+            "scrape_timestamp": "2024-12-01T10:00:00.000Z",
+        }
+        for index in range(count)
+    ]
+
+def synthetic_profiles(count):
+    return [
+        {
+            "username": f"creator{index}",
+            "user_id": str(6800000000000000000 + index),
+            "actual_name": f"Creator {index}",
+            "following_count": index % 1000,
+            "follower_count": index * 11,
+            "total_like_count": index * 101,
+            "caption": "N/A",
+            "bio_link": "N/A",
+            "bio": f"bio of creator {index}",
+            "profile_pic_url": f"https://p16-sign.tiktokcdn.com/avatar/{index:016x}.jpeg",
+            "is_verified": index % 10 == 0,
+            "scrape_timestamp": "2024-12-01T10:00:00.000Z",
+        }
+        for index in range(count)
+    ]
+
+def _timed(encode, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        data = encode()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return data, best
+
+def bench(name, rows, fields, repeat):
+    encoders = {
+        "ndjson": lambda: "\n".join(json.dumps(row) for row in rows).encode("utf-8"),
+        "ndjson.gz": lambda: gzip.compress("\n".join(json.dumps(row) for row in rows).encode("utf-8"), compresslevel=6),
+        "parquet": lambda: columnar.encode_parquet(rows, fields),
+    }
+    results = []
+    for fmt, encode in encoders.items():
+        data, seconds = _timed(encode, repeat)
+        results.append({
+            "table": name,
+            "format": fmt,
+            "rows": len(rows),
+            "bytes": len(data),
+            "encode_seconds": round(seconds, 4),
+            "rows_per_second": round(len(rows) / seconds) if seconds else None,
+        })
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark NDJSON vs Parquet staging files.")
+    parser.add_argument("--rows", type=int, default=50000, help="Video rows to encode")
+    parser.add_argument("--repeat", type=int, default=3, help="Best of N runs")
+    args = parser.parse_args()
+
+    results = bench("videos", synthetic_videos(args.rows), schemas.VIDEO_RECORD_FIELDS, args.repeat)
+    results += bench("profiles", synthetic_profiles(max(1, args.rows // 10)), schemas.PROFILE_FIELDS, args.repeat)
+    print(f"{'table':<10}{'format':<11}{'rows':>9}{'bytes':>13}{'encode s':>11}{'rows/s':>12}")
+    for result in results:
+        print(f"{result['table']:<10}{result['format']:<11}{result['rows']:>9}{result['bytes']:>13}"
+              f"{result['encode_seconds']:>11}{result['rows_per_second']:>12}")
@@ -0,0 +1,63 @@
+import argparse
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "scrape_tiktok"))
+
+import fetch_tiers
+import requests
+from local_scrapingbee import LocalScrapingBee
+
+# Compares the old single render_js fetch with tiered fetching against the
+# local ScrapingBee stand-in. A fraction of profiles only carry the payload
+# once rendered, and only with a long enough wait; each round scrapes every
+# profile once, so later rounds show what remembering the tier saves.
+#
+#   python benchmarks/bench_fetch_tiers.py --profiles 100 --js-only 0.3 --ready-ms 2500
+
+def run(mode, args):
+    fetch_tiers.SCRAPE_FETCH_MODE = mode
+    store = fetch_tiers.MemoryTierStore()
+    rounds = []
+    with LocalScrapingBee(js_only_fraction=args.js_only, render_ready_ms=args.ready_ms,
+                          render_time_scale=args.time_scale) as stand_in:
+        session = requests.Session()
+        urls = [f"https://www.tiktok.com/@bench_tier_{index}" for index in range(args.profiles)]
+        for _ in range(args.rounds):
+            credits_before, requests_before = stand_in.credits, len(stand_in.requests)
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+                summaries = list(executor.map(
+                    lambda url: fetch_tiers.fetch_profile(session, stand_in.url, "bench", url, store=store)[1], urls
+                ))
+            rounds.append({
+                "seconds": time.perf_counter() - started,
+                "credits": stand_in.credits - credits_before,
+                "requests": len(stand_in.requests) - requests_before,
+                "payload": sum(1 for summary in summaries if summary["payload"]),
+                "plain": sum(1 for summary in summaries if summary["tier"] == "plain"),
+            })
+    return rounds
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark tiered vs render-only ScrapingBee fetching.")
+    parser.add_argument("--profiles", type=int, default=100)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--js-only", type=float, default=0.3, help="Fraction of profiles that need render_js")
+    parser.add_argument("--ready-ms", type=int, default=2500, help="Render wait before their payload appears")
+    parser.add_argument("--time-scale", type=float, default=0.01, help="Seconds of simulated rendering per second of wait")
+    parser.add_argument("--concurrency", type=int, default=10)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    print(f"{args.profiles} profiles, {args.js_only:.0%} render-only (ready after {args.ready_ms}ms), "
+          f"rendering at {args.time_scale}s per second of wait")
+    print(f"{'mode':<8}{'round':>6}{'credits':>9}{'requests':>10}{'plain':>7}{'payload':>9}{'seconds':>9}")
+    for mode in ("render", "tiered"):
+        for index, result in enumerate(run(mode, args), 1):
+            print(f"{mode:<8}{index:>6}{result['credits']:>9}{result['requests']:>10}{result['plain']:>7}"
+                  f"{result['payload']:>9}{result['seconds']:>9.2f}")
@@ -0,0 +1,61 @@
+import argparse
+import logging
+import os
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "process_tiktok_data"))
+
+import html_extract
+import main
+
+import synthetic_pages
+
+# Compares the original find()-based HTML fallback with the single-pass
+# html_extract engine on HTML-only profile pages, parse included, and checks
+# that both produce the same records.
+#
+#   python benchmarks/bench_html_fallback.py --sizes 100,1000,5000
+
+def legacy(html_content, username):
+    soup = main.build_soup(html_content)
+    return main.extract_profile_data_from_html(soup), main.extract_video_data_from_html(soup, username)
+
+def indexed(parser):
+    def run(html_content, username):
+        page = html_extract.index_page(html_content, parser)
+        return page.profile_data(), page.videos_data(username)
+    return run
+
+def best_of(run, html_content, username, repeat):
+    best = None
+    output = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        output = run(html_content, username)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return output, best
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the HTML fallback extractors.")
+    parser.add_argument("--sizes", default="10,100,1000,5000", help="Comma-separated post counts")
+    parser.add_argument("--repeat", type=int, default=3, help="Best of N runs")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    engines = {"soup (original)": legacy, "indexed html.parser": indexed("html.parser")}
+    if html_extract.resolve_parser("auto") == "lxml":
+        engines["indexed lxml"] = indexed("lxml")
+
+    print(f"{'posts':>6}  {'engine':<22}{'ms':>10}{'speedup':>9}  same output")
+    for posts in [int(size) for size in args.sizes.split(",")]:
+        username = f"bench_html_{posts}"
+        html_content = synthetic_pages.html_page(username, posts).encode("utf-8")
+        baseline_output = baseline_seconds = None
+        for name, run in engines.items():
+            output, seconds = best_of(run, html_content, username, args.repeat)
+            if baseline_seconds is None:
+                baseline_output, baseline_seconds = output, seconds
+            print(f"{posts:>6}  {name:<22}{seconds * 1000:>10.1f}{baseline_seconds / seconds:>8.1f}x  {output == baseline_output}")
@@ -0,0 +1,268 @@
+import argparse
+import gc
+import io
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "process_tiktok_data"))
+
+# Every handler run flushes its own batch, so the load and MERGE are part of
+# the measurement; change detection is off so reruns of a page do full work.
+os.environ.setdefault("BATCH_MAX_FILES", "1")
+os.environ.setdefault("DIGEST_STORE", "none")
+
+import batch_loader
+import clients
+import main
+import raw_pages
+import schemas
+from local_gcp import LocalBigQueryClient, LocalStorageClient
+
+import synthetic_pages
+
+# Benchmarks the parse/extract stages and the whole process_tiktok_data
+# handler on synthetic pages, with in-memory GCS and a sqlite-backed BigQuery.
+#
+#   python benchmarks/bench_pipeline.py                      # full matrix
+#   python benchmarks/bench_pipeline.py --sizes 10,100 --repeat 3
+#   python benchmarks/bench_pipeline.py --compare benchmarks/results/<earlier>.json
+#
+# Each stage is timed over --repeat runs (latency percentiles, pages/s and
+# posts/s), then run once more under tracemalloc for its peak allocation.
+# Results are written to benchmarks/results/<timestamp>-<commit>.json.
+
+DEFAULT_SIZES = (10, 100, 1000, 5000)
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+RAW_BUCKET = "tiktok-raw-data"
+
+# --- Stages ---
+# Each stage takes the prepared case and returns a callable for one run.
+def _stage_fast_path(case):
+    return lambda: main.extract_rehydration_json(case["page_bytes"])
+
+def _stage_stream_scan(case):
+    return lambda: raw_pages.extract_rehydration_json_from_stream(io.BytesIO(case["page_bytes"]))
+
+def _stage_extract_profile_json(case):
+    return lambda: main.extract_profile_data_from_json(case["json_data"])
+
+def _stage_extract_videos_json(case):
+    return lambda: main.extract_video_data_from_json(case["json_data"], case["username"])
+
+def _stage_build_soup(case):
+    return lambda: main.build_soup(case["page_bytes"])
+
+def _stage_extract_profile_html(case):
+    return lambda: main.extract_profile_data_from_html(case["soup"])
+
+def _stage_extract_videos_html(case):
+    return lambda: main.extract_video_data_from_html(case["soup"], case["username"])
+
+def _stage_extract_page(case):
+    return lambda: main.extract_page_data(case["page_bytes"], case["username"])
+
+def _stage_handler(case):
+    runs = iter(range(10**9))
+
+    def run():
+        # A fresh object per run, as every scrape lands under a new name
+        name = f"profiles/{case['username']}/{next(runs):08d}.html"
+        blob = case["storage"].bucket(RAW_BUCKET).blob(name)
+        blob.upload_from_string(case["page_bytes"], content_type="text/html")
+        event = FakeCloudEvent({
+            "bucket": RAW_BUCKET,
+            "name": name,
+            "size": str(len(case["page_bytes"])),
+            "timeCreated": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
+        })
+        main.process_tiktok_data(event)
+
+    return run
+
+JSON_STAGES = {
+    "fast_path_json": _stage_fast_path,
+    "stream_scan_json": _stage_stream_scan,
+    "extract_profile_json": _stage_extract_profile_json,
+    "extract_videos_json": _stage_extract_videos_json,
+    "extract_page": _stage_extract_page,
+    "handler": _stage_handler,
+}
+HTML_STAGES = {
+    "build_soup": _stage_build_soup,
+    "extract_profile_html": _stage_extract_profile_html,
+    "extract_videos_html": _stage_extract_videos_html,
+    "extract_page": _stage_extract_page,
+    "handler": _stage_handler,
+}
+
+
+class FakeCloudEvent:
+    def __init__(self, data):
+        self.data = data
+
+
+# --- Fakes ---
+def install_fakes():
+    storage = LocalStorageClient()
+    bq = LocalBigQueryClient(storage)
+    from google.cloud import bigquery
+
+    bq.create_table(bigquery.Table(batch_loader.PROFILE_TABLE_ID, schema=schemas.to_schema(schemas.PROFILE_FIELDS)))
+    bq.create_table(bigquery.Table(batch_loader.VIDEO_TABLE_ID, schema=schemas.to_schema(schemas.VIDEO_FIELDS)))
+    clients.set_clients(storage_client=storage, bigquery_client=bq)
+    return storage, bq
+
+# --- Measurement ---
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+def measure(run, repeat, warmup=1):
+    for _ in range(warmup):
+        run()
+    latencies = []
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        run()
+        latencies.append(time.perf_counter() - started)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return latencies, peak
+
+def prepare_case(storage, variant, posts):
+    username = f"bench_{variant.lower()}_{posts}"
+    page = synthetic_pages.synthetic_page(username, posts, variant)
+    case = {"variant": variant, "posts": posts, "username": username, "storage": storage}
+    case["page_bytes"] = page.encode("utf-8")
+    if variant == "html":
+        case["soup"] = main.build_soup(case["page_bytes"])
+    else:
+        case["json_data"] = main.extract_rehydration_json(case["page_bytes"])
+    return case
+
+def _repeat_for(posts, repeat):
+    # Keep the big HTML cases from dominating the run time
+    if posts >= 5000:
+        return max(3, repeat // 4)
+    if posts >= 1000:
+        return max(3, repeat // 2)
+    return repeat
+
+def run_suite(sizes, variants, repeat, stages=None):
+    storage, _ = install_fakes()
+    results = []
+    for variant in variants:
+        for posts in sizes:
+            case = prepare_case(storage, variant, posts)
+            stage_table = HTML_STAGES if variant == "html" else JSON_STAGES
+            for stage, make_run in stage_table.items():
+                if stages and stage not in stages:
+                    continue
+                runs = _repeat_for(posts, repeat)
+                latencies, peak = measure(make_run(case), runs)
+                total = sum(latencies)
+                result = {
+                    "variant": variant,
+                    "posts": posts,
+                    "stage": stage,
+                    "page_bytes": len(case["page_bytes"]),
+                    "runs": runs,
+                    "p50_ms": round(percentile(latencies, 0.5) * 1000, 3),
+                    "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+                    "max_ms": round(max(latencies) * 1000, 3),
+                    "pages_per_second": round(runs / total, 2) if total else None,
+                    "posts_per_second": round(runs * posts / total) if total else None,
+                    "peak_alloc_bytes": peak,
+                }
+                results.append(result)
+                print(format_row(result), flush=True)
+            case.clear()
+    return results
+
+# --- Reporting ---
+HEADER = f"{'variant':<11}{'posts':>6}  {'stage':<22}{'p50 ms':>10}{'p95 ms':>10}{'posts/s':>11}{'peak MB':>9}"
+
+def format_row(result, baseline=None):
+    row = (
+        f"{result['variant']:<11}{result['posts']:>6}  {result['stage']:<22}"
+        f"{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}{result['posts_per_second'] or 0:>11}"
+        f"{result['peak_alloc_bytes'] / 1e6:>9.2f}"
+    )
+    if baseline:
+        change = (result["p50_ms"] - baseline["p50_ms"]) / baseline["p50_ms"] * 100 if baseline["p50_ms"] else 0.0
+        memory = result["peak_alloc_bytes"] / baseline["peak_alloc_bytes"] if baseline["peak_alloc_bytes"] else 1.0
+        row += f"  p50 {change:+6.1f}%  peak x{memory:.2f}"
+    return row
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def save_results(results, results_dir=RESULTS_DIR):
+    commit = git_commit()
+    started = datetime.now(timezone.utc)
+    os.makedirs(results_dir, exist_ok=True)
+    path = os.path.join(results_dir, f"{started.strftime('%Y%m%d-%H%M%S')}-{commit}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({
+            "commit": commit,
+            "created": started.isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "results": results,
+        }, f, indent=2)
+    return path
+
+def compare(results, baseline_path):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    by_key = {(r["variant"], r["posts"], r["stage"]): r for r in baseline["results"]}
+    print(f"\nCompared with {baseline['commit']} ({baseline['created']}):")
+    print(HEADER)
+    for result in results:
+        print(format_row(result, by_key.get((result["variant"], result["posts"], result["stage"]))))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark parsing, extraction and the process_tiktok_data handler.")
+    parser.add_argument("--sizes", default=",".join(str(size) for size in DEFAULT_SIZES), help="Comma-separated post counts")
+    parser.add_argument("--variants", default=",".join(synthetic_pages.VARIANTS), help="Comma-separated page variants")
+    parser.add_argument("--stages", default=None, help="Only run these comma-separated stages")
+    parser.add_argument("--repeat", type=int, default=10, help="Timed runs per stage for small pages")
+    parser.add_argument("--compare", default=None, help="Earlier results file to compare against")
+    parser.add_argument("--no-save", action="store_true", help="Do not write a results file")
+    args = parser.parse_args()
+
+    # The handler logs at INFO; keep the formatting cost but not the terminal I/O
+    logging.getLogger().setLevel(logging.WARNING)
+
+    print(HEADER)
+    results = run_suite(
+        [int(size) for size in args.sizes.split(",")],
+        args.variants.split(","),
+        args.repeat,
+        set(args.stages.split(",")) if args.stages else None,
+    )
+    if not args.no_save:
+        print(f"\nSaved results to {save_results(results)}")
+    if args.compare:
+        compare(results, args.compare)
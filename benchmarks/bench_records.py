@@ -0,0 +1,143 @@
+import argparse
+import gc
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "process_tiktok_data"))
+
+import batch_loader
+import columnar
+import fingerprints
+import main
+import records
+import schemas
+
+import synthetic_pages
+
+# Compares the per-video dict records process_tiktok_data used to build with
+# records.VideoBatch, per 1,000 videos of a synthetic profile: extraction from
+# the rehydration JSON, the NDJSON archive, the staged batch file, change
+# detection digests and the Parquet load file, plus the memory the extracted
+# records take. Both paths produce the same archive and staged bytes.
+#
+#   python benchmarks/bench_records.py --videos 1000,10000
+
+# --- Dict Records (as before records.py) ---
+def legacy_videos(posts, username):
+    videos_data = []
+    for post in posts:
+        video_id = post.get("id")
+        if not video_id:
+            continue
+        create_time = post.get("createTime", "N/A")
+        if create_time != "N/A":
+            create_time = datetime.fromtimestamp(int(create_time)).isoformat()
+        videos_data.append({
+            "url": f"https://www.tiktok.com/@{username}/video/{video_id}",
+            "views": post.get("stats", {}).get("playCount", 0),
+            "thumbnail": post.get("video", {}).get("cover", "N/A"),
+            "description": post.get("desc", "N/A"),
+            "create_time": create_time,
+            "like_count": post.get("stats", {}).get("diggCount", 0),
+            "comment_count": post.get("stats", {}).get("commentCount", 0),
+            "share_count": post.get("stats", {}).get("shareCount", 0),
+        })
+    return videos_data
+
+LEGACY = {
+    "extract": legacy_videos,
+    "archive": lambda videos: "\n".join(json.dumps(video) for video in videos),
+    "stage": lambda profile, videos: json.dumps({"profile": profile, "videos": videos, "username": profile["username"],
+                                                 "scrape_timestamp": profile["scrape_timestamp"]}),
+    "digests": lambda videos: [fingerprints.record_digest(video) for video in videos],
+    "load": lambda rows: columnar.encode_parquet(rows, schemas.VIDEO_RECORD_FIELDS),
+}
+
+BATCH = {
+    "extract": lambda posts, username: main.extract_video_data_from_json(
+        {"__DEFAULT_SCOPE__": {"webapp.user-detail": {"itemList": posts}}}, username),
+    "archive": lambda videos: videos.to_ndjson(),
+    "stage": lambda profile, videos: batch_loader.encode_staged(profile, videos, profile["username"], profile["scrape_timestamp"]),
+    "digests": lambda videos: videos.digests(),
+    "load": lambda rows: columnar.encode_parquet(records.VideoBatch.from_rows(rows), schemas.VIDEO_RECORD_FIELDS),
+}
+
+# One processed file: extract, archive, stage and digest, then the flush that
+# reads the staged rows back and encodes the load file
+def run(path, posts, profile):
+    timings = {}
+
+    def timed(stage, *args):
+        started = time.process_time()
+        result = path[stage](*args)
+        timings[stage] = time.process_time() - started
+        return result
+
+    videos = timed("extract", posts, profile["username"])
+    timed("archive", videos)
+    staged = timed("stage", profile, videos)
+    timed("digests", videos)
+    timed("load", json.loads(staged)["videos"])
+    return videos, staged, timings
+
+def retained_bytes(path, posts, username):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    videos = path["extract"](posts, username)
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del videos
+    return retained
+
+def peak_bytes(path, posts, profile):
+    gc.collect()
+    tracemalloc.start()
+    run(path, posts, profile)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+def best_timings(path, posts, profile, repeat):
+    best = {}
+    for _ in range(repeat):
+        _, _, timings = run(path, posts, profile)
+        for stage, seconds in timings.items():
+            best[stage] = min(best.get(stage, seconds), seconds)
+    return best
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark dict records vs records.VideoBatch.")
+    parser.add_argument("--videos", default="1000,10000", help="Comma-separated video counts")
+    parser.add_argument("--repeat", type=int, default=5, help="Best of N runs, per stage")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    stages = list(LEGACY)
+    print("CPU ms and KB per 1,000 videos")
+    print(f"{'videos':>7}  {'path':<8}" + "".join(f"{stage:>9}" for stage in stages)
+          + f"{'total':>9}{'records KB':>12}{'peak KB':>10}  same output")
+    for count in [int(size) for size in args.videos.split(",")]:
+        username = f"bench_records_{count}"
+        data = synthetic_pages.rehydration_data(username, count)
+        posts = data["__DEFAULT_SCOPE__"]["webapp.user-detail"]["itemList"]
+        profile = main.extract_profile_data_from_json(data)
+        profile["scrape_timestamp"] = "2024-12-01T10:00:00.000Z"
+        per_thousand = 1000 / count
+        outputs = {}
+        for name, path in (("dicts", LEGACY), ("batch", BATCH)):
+            _, staged, _ = run(path, posts, profile)
+            outputs[name] = staged
+            timings = best_timings(path, posts, profile, args.repeat)
+            retained = retained_bytes(path, posts, username)
+            peak = peak_bytes(path, posts, profile)
+            same = "" if name == "dicts" else str(outputs["dicts"] == staged)
+            print(f"{count:>7}  {name:<8}" + "".join(f"{timings[stage] * 1000 * per_thousand:>9.2f}" for stage in stages)
+                  + f"{sum(timings.values()) * 1000 * per_thousand:>9.2f}{retained / 1024 * per_thousand:>12.1f}"
+                  + f"{peak / 1024 * per_thousand:>10.1f}  {same}")
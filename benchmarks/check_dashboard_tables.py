@@ -0,0 +1,161 @@
+import argparse
+import logging
+import os
+import random
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "process_tiktok_data"))
+
+import batch_loader
+import dashboard
+import records
+import schemas
+from google.cloud import bigquery
+from local_gcp import LocalBigQueryClient, LocalStorageClient
+
+# Checks that the incrementally maintained dashboard tables match what they
+# would be if rebuilt from profiles and videos, against the sqlite-backed
+# BigQuery. Creators are rescraped over several rounds (some scrapes are
+# staged after a newer one of the same creator, as when flushes run out of
+# order) and every round is flushed as batches; the tables are then compared
+# with aggregates computed here from the raw tables, and the reconciliation
+# must find nothing to correct. --drop-views then lowers the views of some
+# top videos, which the per-batch updates cannot see past, and checks that
+# the reconciliation corrects it.
+#
+#   python benchmarks/check_dashboard_tables.py                  # exits 1 on any mismatch
+#   VIDEO_LOAD_MODE=snapshots python benchmarks/check_dashboard_tables.py --drop-views 5
+
+def scrape(rng, username, round_index, state):
+    creator = state.setdefault(username, {"followers": rng.randrange(1000, 10 ** 7), "verified": rng.random() < 0.5,
+                                          "videos": {}})
+    creator["followers"] += rng.randrange(0, 5000)
+    if rng.random() < 0.05:
+        creator["verified"] = not creator["verified"]
+    for index in range(rng.randrange(1, 4)):
+        creator["videos"][f"https://www.tiktok.com/@{username}/video/{round_index}{index}"] = rng.randrange(0, 10 ** 6)
+    videos = []
+    for url in creator["videos"]:
+        creator["videos"][url] += rng.randrange(0, 10 ** 5)
+        # Some videos come without counts, as on the HTML fallback path
+        views = None if rng.random() < 0.02 else creator["videos"][url]
+        videos.append({"url": url, "views": views, "like_count": (views or 0) // 10, "comment_count": 0, "share_count": 0})
+    timestamp = f"2024-01-{round_index + 1:02d}T00:00:00Z"
+    profile = {
+        "username": username,
+        "actual_name": username.title(),
+        "follower_count": creator["followers"],
+        "total_like_count": creator["followers"] * 3,
+        "is_verified": None if rng.random() < 0.05 else creator["verified"],
+        "scrape_timestamp": timestamp,
+    }
+    return profile, videos, timestamp
+
+# profile is None for a rescrape whose profile did not change
+def stage(storage_client, profile, videos, timestamp, username=None):
+    batch_loader.stage_processed(storage_client, profile, records.VideoBatch.from_rows(videos),
+                                 username=username or profile["username"], scrape_timestamp=timestamp)
+
+# --- Aggregates Computed Here ---
+def expected_tables(bq_client, limit):
+    profiles = bq_client.rows(batch_loader.PROFILE_TABLE_ID)
+    videos_table_id = batch_loader.VIDEO_CURRENT_VIEW_ID if batch_loader.VIDEO_LOAD_MODE == "snapshots" else batch_loader.VIDEO_TABLE_ID
+    videos = bq_client.rows(videos_table_id)
+    creators = [{name: profile[name] for name, _, _ in dashboard.CREATOR_FIELDS} for profile in profiles]
+    verified_share = []
+    for flag in (True, False):
+        members = [creator for creator in creators if bool(creator["is_verified"]) == flag]
+        verified_share.append({"is_verified": flag, "creators": len(members),
+                               "follower_count": sum(creator["follower_count"] or 0 for creator in members)})
+    ranked = sorted((video for video in videos if video["views"] is not None), key=lambda video: (-video["views"], video["url"]))
+    top_videos = [{name: video[name] for name, _, _ in dashboard.TOP_VIDEO_FIELDS} for video in ranked[:limit]]
+    return {"creators": creators, "verified_share": verified_share, "top_videos": top_videos}
+
+def compare(bq_client, limit):
+    expected = expected_tables(bq_client, limit)
+    mismatches = []
+    for name, table_id in batch_loader.DASHBOARD_TABLE_IDS.items():
+        key = dashboard.TABLE_FIELDS[name][0][0]
+        actual = sorted(bq_client.rows(table_id), key=lambda row: row[key])
+        wanted = sorted(expected[name], key=lambda row: row[key])
+        if [dict(row) for row in actual] != wanted:
+            mismatches.append(name)
+    return mismatches
+
+def reconcile(bq_client):
+    started = time.perf_counter()
+    corrected = batch_loader.reconcile_dashboard(bq_client)
+    return corrected, time.perf_counter() - started
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check incremental dashboard tables against a full rebuild.")
+    parser.add_argument("--creators", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=6, help="Rescrape rounds, each flushed in batches")
+    parser.add_argument("--scraped", type=float, default=0.6, help="Fraction of creators scraped per round")
+    parser.add_argument("--out-of-order", type=float, default=0.1, help="Fraction of scrapes staged after a newer one")
+    parser.add_argument("--top-videos", type=int, default=50)
+    parser.add_argument("--drop-views", type=int, default=0, help="Top videos whose views then drop")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    dashboard.DASHBOARD_TOP_VIDEOS = args.top_videos
+    batch_loader.BATCH_MAX_FILES = 25
+    rng = random.Random(args.seed)
+    storage_client = LocalStorageClient()
+    bq_client = LocalBigQueryClient(storage_client)
+    for table_id, fields in ((batch_loader.PROFILE_TABLE_ID, schemas.PROFILE_FIELDS), (batch_loader.VIDEO_TABLE_ID, schemas.VIDEO_FIELDS)):
+        bq_client.create_table(bigquery.Table(table_id, schema=schemas.to_schema(fields)))
+
+    state = {}
+    usernames = [f"check_dashboard_{index}" for index in range(args.creators)]
+    batches = 0
+    held_back = []
+    for round_index in range(args.rounds):
+        for username in rng.sample(usernames, int(len(usernames) * args.scraped)):
+            scraped = scrape(rng, username, round_index, state)
+            if rng.random() < args.out_of_order:
+                held_back.append(scraped)
+            else:
+                stage(storage_client, *scraped)
+        batches += len(batch_loader.flush_all(storage_client, bq_client))
+        # Older scrapes arrive a round late
+        for scraped in held_back:
+            stage(storage_client, *scraped)
+        held_back = []
+    batches += len(batch_loader.flush_all(storage_client, bq_client))
+
+    print(f"VIDEO_LOAD_MODE={batch_loader.VIDEO_LOAD_MODE}: {args.creators} creators, {args.rounds} rounds, {batches} batches")
+    if dashboard.enabled():
+        mismatches = compare(bq_client, args.top_videos)
+        corrected, seconds = reconcile(bq_client)
+        print(f"incremental tables {'match' if not mismatches else 'differ in ' + ', '.join(mismatches)}; "
+              f"reconciliation corrected {corrected} in {seconds:.2f}s")
+        failed = bool(mismatches) or any(corrected.values())
+    else:
+        # DASHBOARD_TABLES=off: the reconciliation alone builds the tables
+        corrected, seconds = reconcile(bq_client)
+        mismatches = compare(bq_client, args.top_videos)
+        print(f"reconciliation built {corrected} rows in {seconds:.2f}s; tables "
+              f"{'match' if not mismatches else 'differ in ' + ', '.join(mismatches)}")
+        failed = bool(mismatches)
+
+    if args.drop_views:
+        dropped = sorted(bq_client.rows(batch_loader.DASHBOARD_TABLE_IDS["top_videos"]), key=lambda row: -row["views"])
+        for video in dropped[:args.drop_views]:
+            stage(storage_client, None, [dict(video, views=0)], "2024-02-01T00:00:00Z",
+                  username=video["url"].split("@")[1].split("/")[0])
+        batch_loader.flush_all(storage_client, bq_client)
+        stale = compare(bq_client, args.top_videos)
+        corrected, seconds = reconcile(bq_client)
+        after = compare(bq_client, args.top_videos)
+        again, _ = reconcile(bq_client)
+        print(f"after dropping {args.drop_views} top videos to 0 views: incremental tables "
+              f"{'match' if not stale else 'differ in ' + ', '.join(stale)}; reconciliation corrected {corrected} "
+              f"in {seconds:.2f}s, then {'match' if not after else 'still differ in ' + ', '.join(after)}; "
+              f"a second reconciliation corrected {again}")
+        failed = failed or bool(after) or any(again.values())
+
+    sys.exit(1 if failed else 0)
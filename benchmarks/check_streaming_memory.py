@@ -0,0 +1,138 @@
+import argparse
+import json
+import logging
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+FUNCTION_DIR = os.path.join(BENCH_DIR, "..", "process_tiktok_data")
+
+import synthetic_pages
+
+# Checks that streaming mode (STREAM_MODE) keeps process_tiktok_data's peak
+# RSS flat as profiles grow. Each page size is processed by the handler in a
+# fresh subprocess, with disk-backed local GCS so the raw page itself does not
+# count towards the process; the peak RSS over the process baseline (after
+# imports) must level off: the two largest pages, past the point where the
+# chunk buffers and caches stop growing, may differ by --tolerance-mb at most,
+# so even a leak of a few hundred bytes per post fails.
+#
+#   python benchmarks/check_streaming_memory.py                  # exits 1 if memory grows
+#   python benchmarks/check_streaming_memory.py --regular        # also show STREAM_MODE=never
+#
+# Batches are left pending, so this covers reading, extraction, archive
+# writes and staging; the BigQuery load happens later, one batch at a time.
+
+DEFAULT_SIZES = (2000, 8000, 32000, 64000, 128000)
+RAW_BUCKET = "tiktok-raw-data"
+
+# --- Child: process one page and report memory ---
+# VmHWM starts afresh at exec; ru_maxrss can carry over the parent's peak on Linux
+def _peak_rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def run_child(page_path, storage_dir):
+    sys.path.insert(0, FUNCTION_DIR)
+    import clients
+    import main
+    from local_gcp import LocalStorageClient
+
+    logging.disable(logging.INFO)
+    storage_client = LocalStorageClient(directory=storage_dir)
+    clients.set_clients(storage_client=storage_client)
+    name = f"raw/{os.path.basename(page_path).split('-')[0]}/page.html"
+    blob = storage_client.bucket(RAW_BUCKET).blob(name)
+    with open(page_path, "rb") as source, blob.open("wb") as target:
+        shutil.copyfileobj(source, target)
+    baseline = _peak_rss_mb()
+
+    class CloudEvent:
+        data = {"bucket": RAW_BUCKET, "name": name, "timeCreated": "2024-01-01T00:00:00.000Z", "size": os.path.getsize(page_path)}
+
+    main.process_tiktok_data(CloudEvent())
+    print(json.dumps({
+        "baseline_mb": round(baseline, 1),
+        "peak_mb": round(_peak_rss_mb(), 1),
+        "streamed": main.parse_path_counts["streamed"],
+    }))
+
+# --- Parent: one subprocess per page size ---
+def measure(page_path, storage_dir, stream_mode, memory_limit_mb):
+    env = dict(os.environ)
+    env.update({
+        "STREAM_MODE": stream_mode,
+        "STREAM_MEMORY_LIMIT_MB": str(memory_limit_mb),
+        "DIGEST_STORE": "none",
+        "BATCH_MAX_FILES": "1000000",
+        "BATCH_MAX_AGE_SECONDS": "1000000",
+        "METRICS_MODE": "off",
+    })
+    output = subprocess.run(
+        [sys.executable, __file__, "--child", page_path, storage_dir],
+        env=env, check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that streaming mode keeps peak RSS flat.")
+    parser.add_argument("--sizes", default=",".join(str(size) for size in DEFAULT_SIZES), help="Comma-separated post counts")
+    parser.add_argument("--memory-limit-mb", type=float, default=32, help="STREAM_MEMORY_LIMIT_MB for the runs")
+    parser.add_argument("--tolerance-mb", type=float, default=4,
+                        help="Allowed growth of the peak between the two largest pages")
+    parser.add_argument("--regular", action="store_true", help="Also measure STREAM_MODE=never for comparison")
+    parser.add_argument("--child", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(*args.child)
+        sys.exit(0)
+
+    sizes = sorted(int(size) for size in args.sizes.split(","))
+    if len(sizes) < 2:
+        parser.error("--sizes needs at least two page sizes")
+    tolerance = args.tolerance_mb
+    modes = ["always"] + (["never"] if args.regular else [])
+    workdir = tempfile.mkdtemp(prefix="streaming-memory-")
+    try:
+        growth = {}
+        print(f"{'posts':>7}  {'page MB':>8}  {'mode':<7}{'baseline MB':>12}{'peak MB':>9}{'over base':>10}")
+        for posts in sizes:
+            page_path = os.path.join(workdir, f"bench_stream_{posts}-page.html")
+            with open(page_path, "w", encoding="utf-8") as f:
+                f.write(synthetic_pages.synthetic_page(f"bench_stream_{posts}", posts))
+            page_mb = os.path.getsize(page_path) / (1024 * 1024)
+            for mode in modes:
+                storage_dir = os.path.join(workdir, f"gcs-{posts}-{mode}")
+                result = measure(page_path, storage_dir, mode, args.memory_limit_mb)
+                if mode == "always" and not result["streamed"]:
+                    print(f"FAIL: the {posts}-post page was not processed in streaming mode")
+                    sys.exit(1)
+                over = result["peak_mb"] - result["baseline_mb"]
+                growth.setdefault(mode, []).append(over)
+                print(f"{posts:>7}  {page_mb:>8.1f}  {mode:<7}{result['baseline_mb']:>12.1f}{result['peak_mb']:>9.1f}{over:>10.1f}")
+                shutil.rmtree(storage_dir, ignore_errors=True)
+            os.remove(page_path)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    streamed = growth["always"]
+    increase = streamed[-1] - streamed[-2]
+    summary = (f"streaming peak grew by {increase:.1f} MB from {sizes[-2]} to {sizes[-1]} posts "
+               f"(allowed {tolerance:.1f} MB; {streamed[-1]:.1f} MB over base at {sizes[-1]})")
+    if increase > tolerance:
+        print(f"FAIL: {summary}")
+        sys.exit(1)
+    print(f"OK: {summary}")
@@ -0,0 +1,517 @@
+import argparse
+import base64
+import collections
+import importlib
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRAPE_DIR = os.path.join(BENCH_DIR, "..", "scrape_tiktok")
+PROCESS_DIR = os.path.join(BENCH_DIR, "..", "process_tiktok_data")
+sys.path.extend([os.path.join(BENCH_DIR, "..", "recrawl_scheduler"), SCRAPE_DIR, PROCESS_DIR])
+
+import schemas
+import synthetic_pages
+from cloudevents.http import CloudEvent
+from google.cloud import bigquery
+from local_gcp import LocalBigQueryClient, LocalStorageClient
+from local_pubsub import LocalPublisherClient
+from local_scrapingbee import LocalScrapingBee
+
+# Runs the whole chain on one machine, with no cloud resources or ScrapingBee
+# credits: messages published to an in-memory scrape-tiktok-topic push to
+# scrape_tiktok, its raw pages in local GCS raise finalize events that push to
+# process_tiktok_data, and batches are merged into the sqlite-backed BigQuery.
+# Both handlers are the real functions_framework functions, run in-process
+# and given CloudEvents shaped like the ones Cloud Functions delivers.
+#
+# Each function gets at most --scrape-instances / --process-instances
+# concurrent invocations (threads standing in for instances); events beyond
+# that wait in the subscription's queue. ScrapingBee is the local stand-in,
+# serving synthetic pages (or recorded ones from --pages-dir) with simulated
+# latency, throttling and render-only profiles; BigQuery jobs can be given a
+# simulated run time. flush_tiktok_batches runs every --flush-interval
+# seconds, like the Cloud Scheduler job.
+#
+# Each offered rate is one run: profiles are published at that rate for
+# --duration seconds, then the pipeline is drained. Reported per run:
+# profiles/s delivered end to end (published until merged into BigQuery, or
+# until processed for rescrapes change detection stopped), queue lag before
+# each function and before the merge, and per-stage latency from the
+# functions' own metrics traces. Sweeping rates shows the saturation point,
+# where delivered throughput stops following the offered rate and queue lag
+# keeps growing:
+#
+#   python benchmarks/emulate_pipeline.py --rates 2,5,10,20 --duration 30
+#   python benchmarks/emulate_pipeline.py --rates 10 --posts 200 --scrapingbee-latency 1.5 --bq-job-latency 2
+#
+# Instances are threads of one process, so CPU-bound stages (parsing) share
+# the GIL: the saturation point found is that of one process per function.
+# Environment variables of either function (BATCH_MAX_FILES, STREAM_MODE,
+# SCRAPE_MAX_RETRIES, ...) apply as usual.
+
+RAW_BUCKET = "tiktok-raw-data"
+PROCESSED_BUCKET = "tiktok-processed-data"
+PENDING_PREFIX = "staging/pending/"
+TOPIC = "projects/emulator/topics/scrape-tiktok-topic"
+# Module names both function directories define
+SHARED_MODULES = ("main", "clients", "metrics")
+
+# --- Loading Both Functions ---
+# Each function directory imports its siblings as top-level modules, and both
+# have a main, clients and metrics. Each main is imported on its own and the
+# shared names are then taken out of sys.modules; the modules keep their
+# references to the siblings they were imported with.
+def load_function(directory):
+    saved = {name: sys.modules.pop(name) for name in SHARED_MODULES if name in sys.modules}
+    sys.path.insert(0, directory)
+    try:
+        main = importlib.import_module("main")
+    finally:
+        sys.path.remove(directory)
+        for name in SHARED_MODULES:
+            sys.modules.pop(name, None)
+        sys.modules.update(saved)
+    return main
+
+def iso(epoch):
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+def pubsub_event(message):
+    return CloudEvent(
+        {"type": "google.cloud.pubsub.topic.v1.messagePublished", "source": f"//pubsub.googleapis.com/{TOPIC}"},
+        {"message": {"data": base64.b64encode(message.data).decode("ascii"), "messageId": message.message_id,
+                     "publishTime": iso(message.publish_time), "attributes": message.attributes}},
+    )
+
+def finalize_event(data):
+    return CloudEvent(
+        {"type": "google.cloud.storage.object.v1.finalized",
+         "source": f"//storage.googleapis.com/projects/_/buckets/{data['bucket']}", "subject": f"objects/{data['name']}"},
+        data,
+    )
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+# --- Subscriptions ---
+# A push subscription in front of a function capped at `instances`
+# concurrent invocations. Lag is the time from publish to invocation.
+class Subscription:
+    def __init__(self, name, handler, instances):
+        self.name = name
+        self.handler = handler
+        self.lags = []
+        self.latencies = []
+        self.errors = 0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._threads = [threading.Thread(target=self._work, name=f"{name}-{index}", daemon=True) for index in range(instances)]
+        for thread in self._threads:
+            thread.start()
+
+    def push(self, event, published):
+        self._queue.put((event, published))
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            event, published = item
+            started = time.time()
+            failed = False
+            try:
+                self.handler(event)
+            except Exception:
+                failed = True
+            finished = time.time()
+            with self._lock:
+                self.lags.append(started - published)
+                self.latencies.append(finished - started)
+                self.errors += failed
+            self._queue.task_done()
+
+    def backlog(self):
+        return self._queue.qsize()
+
+    def join(self):
+        self._queue.join()
+
+    def stop(self):
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+
+
+# --- Metrics Traces ---
+# Both functions log one JSON line per trace through their "metrics" logger
+class TraceCollector(logging.Handler):
+    def __init__(self):
+        super().__init__(logging.INFO)
+        self.traces = []
+        self._lock = threading.Lock()
+
+    def emit(self, record):
+        message = record.getMessage()
+        if not message.startswith("{"):
+            return
+        entry = json.loads(message)
+        if entry.get("metric") in ("trace", "scrape_url"):
+            with self._lock:
+                self.traces.append(entry)
+
+    def take(self):
+        with self._lock:
+            traces, self.traces = self.traces, []
+        return traces
+
+
+# --- One Profile's Way Through ---
+# Scrapes are matched to their message by username (oldest first), raw pages
+# to the processed files they were staged as, and staged files to the flush
+# that deleted them after merging.
+class Timeline:
+    def __init__(self):
+        self.published = collections.defaultdict(collections.deque)
+        self.raw_published = {}
+        self.staged = collections.defaultdict(set)
+        self.merged = set()
+        self.staged_at = {}
+        self.pending_raw = {}
+        self.processed = {}
+        self.done = {}
+        self.merge_lags = []
+        self.failed = {"scrape": 0, "process": 0}
+        self.first_published = None
+        self.current = threading.local()
+        self._lock = threading.Lock()
+
+    def publish(self, urls, published):
+        with self._lock:
+            if self.first_published is None:
+                self.first_published = published
+            for url in urls:
+                self.published[url.rstrip("/").split("@")[-1]].append(published)
+
+    def raw_written(self, name):
+        username = name.split("/")[1]
+        with self._lock:
+            if self.published[username]:
+                self.raw_published[name] = self.published[username].popleft()
+
+    def scrape_failed(self, url):
+        with self._lock:
+            self.failed["scrape"] += 1
+            pending = self.published[url.rstrip("/").split("@")[-1]]
+            if pending:
+                pending.popleft()
+
+    def file_staged(self, name):
+        raw_name = getattr(self.current, "raw_name", None)
+        if raw_name is None:
+            return
+        with self._lock:
+            self.staged[raw_name].add(name)
+            self.merged.add(raw_name)
+            self.pending_raw[name] = raw_name
+            self.staged_at[name] = time.time()
+
+    def file_merged(self, name):
+        now = time.time()
+        with self._lock:
+            raw_name = self.pending_raw.pop(name, None)
+            if raw_name is None:
+                return
+            self.merge_lags.append(now - self.staged_at.pop(name))
+            self.staged[raw_name].discard(name)
+            if not self.staged[raw_name] and raw_name in self.processed:
+                self._finish(raw_name, now)
+
+    def process_finished(self, raw_name, failed):
+        now = time.time()
+        with self._lock:
+            if failed:
+                self.failed["process"] += 1
+                self.raw_published.pop(raw_name, None)
+                return
+            self.processed[raw_name] = now
+            # Nothing staged (change detection found no change) or already merged inline
+            if not self.staged[raw_name]:
+                self._finish(raw_name, now)
+
+    def _finish(self, raw_name, now):
+        published = self.raw_published.pop(raw_name, None)
+        if published is not None:
+            self.done[raw_name] = (published, now)
+
+
+# --- Emulator ---
+class Emulator:
+    def __init__(self, args, scrape_main, process_main):
+        self.args = args
+        self.scrape_main = scrape_main
+        self.process_main = process_main
+        self.timeline = Timeline()
+        self.collector = TraceCollector()
+        self.rng = random.Random(args.seed)
+        self._pages = {}
+        self._seeds = collections.Counter()
+        self._pages_lock = threading.Lock()
+
+    # Rescrapes serve new counts --change-rate of the time, so change detection has something to find
+    def page_for(self, profile_url, params):
+        username = profile_url.rstrip("/").split("@")[-1]
+        with self._pages_lock:
+            if username not in self._seeds or self.rng.random() < self.args.change_rate:
+                self._seeds[username] += 1
+            key = (username, self._seeds[username])
+            page = self._pages.get(key)
+            if page is None:
+                if len(self._pages) >= 1000:
+                    self._pages.clear()
+                page = synthetic_pages.synthetic_page(username, self.args.posts, self.args.variant, seed=key[1])
+                self._pages[key] = page
+        return page
+
+    def _on_storage_event(self, event_type, data):
+        if data["bucket"] == RAW_BUCKET and event_type == "finalized":
+            self.timeline.raw_written(data["name"])
+            self.process_subscription.push(finalize_event(data), time.time())
+        elif data["bucket"] == PROCESSED_BUCKET and data["name"].startswith(PENDING_PREFIX):
+            if event_type == "finalized":
+                self.timeline.file_staged(data["name"])
+            else:
+                self.timeline.file_merged(data["name"])
+
+    def _scrape(self, event):
+        self.scrape_main.scrape_tiktok(event)
+
+    def _process(self, event):
+        raw_name = event.data["name"]
+        self.timeline.current.raw_name = raw_name
+        failed = True
+        try:
+            self.process_main.process_tiktok_data(event)
+            failed = False
+        finally:
+            self.timeline.current.raw_name = None
+            self.timeline.process_finished(raw_name, failed)
+
+    def _flush(self):
+        self.process_main.flush_tiktok_batches(None)
+
+    def _flush_periodically(self, stop):
+        while not stop.wait(self.args.flush_interval):
+            try:
+                self._flush()
+            except Exception as e:
+                logging.getLogger(__name__).warning(f"Scheduled flush failed: {e}")
+
+    def _install(self):
+        args = self.args
+        storage_client = LocalStorageClient(directory=args.disk)
+        storage_client.add_listener(self._on_storage_event)
+        bq_client = LocalBigQueryClient(storage_client, job_latency_seconds=args.bq_job_latency,
+                                        api_latency_seconds=args.bq_api_latency)
+        batch_loader = self.process_main.batch_loader
+        for table_id, fields in ((batch_loader.PROFILE_TABLE_ID, schemas.PROFILE_FIELDS), (batch_loader.VIDEO_TABLE_ID, schemas.VIDEO_FIELDS)):
+            bq_client.create_table(bigquery.Table(table_id, schema=schemas.to_schema(fields)))
+        batch_loader.forget_tables()
+        self.process_main.clients.set_clients(storage_client=storage_client, bigquery_client=bq_client)
+        self.scrape_main.clients.reset_clients()
+        self.scrape_main.clients.set_clients(storage_client=storage_client)
+        self.scrape_main._tier_store.clear()
+        self.scrape_main.rate_limiter = self.scrape_main.batch_scraper.TokenBucket(args.scrape_rate, args.scrape_burst)
+        return storage_client, bq_client
+
+    def run(self, rate):
+        args = self.args
+        storage_client, bq_client = self._install()
+        self.timeline = Timeline()
+        publisher = LocalPublisherClient()
+        self.scrape_subscription = Subscription("scrape_tiktok", self._scrape, args.scrape_instances)
+        self.process_subscription = Subscription("process_tiktok_data", self._process, args.process_instances)
+        publisher.subscribe(TOPIC, lambda message: self.scrape_subscription.push(pubsub_event(message), message.publish_time))
+
+        stand_in = LocalScrapingBee(
+            page_for=None if args.pages_dir else self.page_for, pages_dir=args.pages_dir,
+            latency_seconds=args.scrapingbee_latency, throttle_first=args.throttle_first, error_rate=args.error_rate,
+            js_only_fraction=args.js_only, render_ready_ms=args.render_ready_ms, render_time_scale=args.render_time_scale,
+        )
+        self.scrape_main.SCRAPINGBEE_URL = stand_in.url
+        self.collector.take()
+        stop_flushing = threading.Event()
+        flusher = threading.Thread(target=self._flush_periodically, args=(stop_flushing,), daemon=True)
+        backlog_samples = []
+
+        with stand_in:
+            flusher.start()
+            interval = args.urls_per_message / rate
+            messages = max(1, int(rate * args.duration / args.urls_per_message))
+            started = time.time()
+            next_creator = 0
+            for index in range(messages):
+                # Paced against the start, so a slow publish does not lower the rate
+                delay = started + index * interval - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+                urls = []
+                for _ in range(args.urls_per_message):
+                    urls.append(f"https://www.tiktok.com/@emulator_{next_creator % args.creators}")
+                    next_creator += 1
+                self.timeline.publish(urls, time.time())
+                publisher.publish(TOPIC, json.dumps(urls).encode("utf-8"))
+                backlog_samples.append((self.scrape_subscription.backlog(), self.process_subscription.backlog()))
+            published_for = time.time() - started
+
+            # Drain: both functions idle, then what is still pending is flushed
+            self.scrape_subscription.join()
+            self.process_subscription.join()
+            stop_flushing.set()
+            flusher.join()
+            self._flush()
+            drained = time.time() - started
+        self.scrape_subscription.stop()
+        self.process_subscription.stop()
+
+        traces = self.collector.take()
+        for entry in traces:
+            if entry["metric"] == "scrape_url" and not entry.get("ok"):
+                self.timeline.scrape_failed(entry["url"])
+        return self._report(rate, messages, published_for, drained, traces, backlog_samples, stand_in, bq_client)
+
+    def _report(self, rate, messages, published_for, drained, traces, backlog_samples, stand_in, bq_client):
+        timeline = self.timeline
+        done = list(timeline.done.values())
+        e2e = [finished - published for published, finished in done]
+        last_done = max((finished for _, finished in done), default=timeline.first_published)
+        delivered_for = (last_done - timeline.first_published) if done else None
+        return {
+            "offered_per_second": rate,
+            "published": messages * self.args.urls_per_message,
+            "published_seconds": published_for,
+            "drained_seconds": drained,
+            "completed": len(done),
+            "merged": sum(1 for name in timeline.done if name in timeline.merged),
+            "failed": dict(timeline.failed),
+            "handler_errors": {"scrape_tiktok": self.scrape_subscription.errors, "process_tiktok_data": self.process_subscription.errors},
+            "profiles_per_second": len(done) / delivered_for if delivered_for else None,
+            "e2e_seconds": {"p50": percentile(e2e, 0.5), "p95": percentile(e2e, 0.95), "max": percentile(e2e, 1.0)},
+            "queue_lag_seconds": {
+                "scrape_tiktok": _summary(self.scrape_subscription.lags),
+                "process_tiktok_data": _summary(self.process_subscription.lags),
+                "merge": _summary(timeline.merge_lags),
+            },
+            "max_backlog": {"scrape_tiktok": max((sample[0] for sample in backlog_samples), default=0),
+                            "process_tiktok_data": max((sample[1] for sample in backlog_samples), default=0)},
+            "handler_seconds": {
+                "scrape_tiktok": _summary(self.scrape_subscription.latencies),
+                "process_tiktok_data": _summary(self.process_subscription.latencies),
+            },
+            "spans_ms": _span_summary(traces),
+            "scrapingbee": {"requests": len(stand_in.requests), "credits": stand_in.credits},
+            "bigquery_jobs": collections.Counter(job[0] for job in bq_client.jobs),
+        }
+
+
+def _summary(values):
+    return {"p50": percentile(values, 0.5), "p95": percentile(values, 0.95), "max": percentile(values, 1.0), "count": len(values)}
+
+def _span_summary(traces):
+    spans = collections.defaultdict(list)
+    for entry in traces:
+        stage = "scrape_url" if entry["metric"] == "scrape_url" else entry["function"]
+        spans[(stage, "total")].append(entry["total_ms"])
+        for name, milliseconds in entry.get("spans_ms", {}).items():
+            spans[(stage, name)].append(milliseconds)
+    return {key: _summary(values) for key, values in spans.items()}
+
+def _seconds(value):
+    return f"{value:.2f}" if value is not None else "-"
+
+def print_run(result):
+    print(f"\noffered {result['offered_per_second']}/s: {result['published']} profiles published in "
+          f"{result['published_seconds']:.1f}s, drained after {result['drained_seconds']:.1f}s; "
+          f"{result['completed']} completed ({result['merged']} merged, the rest unchanged), "
+          f"failed {result['failed']}, handler errors {result['handler_errors']}")
+    print(f"ScrapingBee {result['scrapingbee']}, BigQuery jobs {dict(result['bigquery_jobs'])}")
+    print(f"{'stage':<48}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}{'count':>8}")
+    rows = [(f"queue lag {name}", summary) for name, summary in result["queue_lag_seconds"].items()]
+    rows += [(f"handler {name}", summary) for name, summary in result["handler_seconds"].items()]
+    for label, summary in rows:
+        if summary["count"]:
+            print(f"{label:<48}{summary['p50'] * 1000:>10.1f}{summary['p95'] * 1000:>10.1f}{summary['max'] * 1000:>10.1f}{summary['count']:>8}")
+    for (stage, name), summary in sorted(result["spans_ms"].items(), key=lambda item: (item[0][0], -item[1]["p95"])):
+        print(f"{stage + ' ' + name:<48}{summary['p50']:>10.1f}{summary['p95']:>10.1f}{summary['max']:>10.1f}{summary['count']:>8}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Emulate Pub/Sub -> scrape_tiktok -> GCS -> process_tiktok_data -> BigQuery locally.")
+    parser.add_argument("--rates", default="2,5,10", help="Comma-separated offered rates, profiles per second")
+    parser.add_argument("--duration", type=float, default=20, help="Seconds of publishing per rate")
+    parser.add_argument("--urls-per-message", type=int, default=1)
+    parser.add_argument("--creators", type=int, default=100000, help="Distinct profiles; fewer means rescrapes")
+    parser.add_argument("--scrape-instances", type=int, default=10, help="Concurrent scrape_tiktok invocations")
+    parser.add_argument("--process-instances", type=int, default=10, help="Concurrent process_tiktok_data invocations")
+    parser.add_argument("--scrape-rate", type=float, default=0, help="ScrapingBee requests per second, all instances together (0: unlimited)")
+    parser.add_argument("--scrape-burst", type=int, default=5)
+    parser.add_argument("--flush-interval", type=float, default=5, help="Seconds between scheduled flush_tiktok_batches runs")
+    parser.add_argument("--posts", type=int, default=30, help="Posts per synthetic profile page")
+    parser.add_argument("--variant", default="itemList", choices=synthetic_pages.VARIANTS)
+    parser.add_argument("--change-rate", type=float, default=1.0, help="Chance a rescrape serves changed counts")
+    parser.add_argument("--pages-dir", default=None, help="Serve recorded <username>.html pages instead")
+    parser.add_argument("--scrapingbee-latency", type=float, default=0.2, help="Seconds per ScrapingBee request")
+    parser.add_argument("--throttle-first", type=int, default=0, help="Answer the first N requests per URL with 429")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of ScrapingBee requests answered with 503")
+    parser.add_argument("--js-only", type=float, default=0.0, help="Fraction of profiles that need render_js")
+    parser.add_argument("--render-ready-ms", type=int, default=0)
+    parser.add_argument("--render-time-scale", type=float, default=0.0, help="Seconds of rendering per second of wait")
+    parser.add_argument("--bq-job-latency", type=float, default=0.0, help="Simulated seconds per BigQuery job")
+    parser.add_argument("--bq-api-latency", type=float, default=0.0, help="Simulated seconds per BigQuery API call")
+    parser.add_argument("--disk", default=None, help="Keep GCS objects under this directory instead of in memory")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", default=None, help="Also write the results to this file")
+    args = parser.parse_args()
+
+    os.environ.setdefault("SCRAPINGBEE_API_KEY", "emulator")
+    os.environ.setdefault("SCRAPE_BACKOFF_BASE_SECONDS", "0.1")
+    scrape_main = load_function(SCRAPE_DIR)
+    process_main = load_function(PROCESS_DIR)
+
+    emulator = Emulator(args, scrape_main, process_main)
+    logging.getLogger().setLevel(logging.WARNING)
+    metrics_logger = logging.getLogger("metrics")
+    metrics_logger.setLevel(logging.INFO)
+    metrics_logger.propagate = False
+    metrics_logger.addHandler(emulator.collector)
+
+    results = []
+    for rate in [float(value) for value in args.rates.split(",")]:
+        result = emulator.run(rate)
+        results.append(result)
+        print_run(result)
+
+    print(f"\n{'offered/s':>10}{'delivered/s':>13}{'completed':>11}{'scrape lag p95':>16}{'process lag p95':>17}"
+          f"{'merge lag p95':>15}{'e2e p50 s':>11}{'e2e p95 s':>11}")
+    for result in results:
+        lags = result["queue_lag_seconds"]
+        print(f"{result['offered_per_second']:>10g}{_seconds(result['profiles_per_second']):>13}"
+              f"{result['completed']:>5}/{result['published']:<5}"
+              f"{_seconds(lags['scrape_tiktok']['p95']):>16}{_seconds(lags['process_tiktok_data']['p95']):>17}"
+              f"{_seconds(lags['merge']['p95']):>15}{_seconds(result['e2e_seconds']['p50']):>11}{_seconds(result['e2e_seconds']['p95']):>11}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump([dict(result, spans_ms={f"{stage} {name}": summary for (stage, name), summary in result["spans_ms"].items()})
+                       for result in results], f, indent=2)
@@ -0,0 +1,140 @@
+import argparse
+import json
+import logging
+import math
+import os
+import random
+import sys
+from datetime import datetime, timezone
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "recrawl_scheduler"))
+
+import scheduler
+from local_pubsub import LocalPublisherClient
+
+# Simulates the recrawl scheduler against a synthetic creator population and
+# compares adaptive intervals with a uniform interval that spends the same
+# credits. Creators upload at very different rates (log-normal) and gain
+# followers and likes accordingly; every published URL is "scraped" at once
+# and its observation comes back on the next run, as from process_tiktok_data,
+# with the credits the scrape cost: 1 for a plain fetch, 5 for the --js-only
+# share of creators that need render_js.
+#
+#   python benchmarks/sim_recrawl.py --creators 500 --days 7 --budget 500
+#
+# Reported per policy: credits spent, change captured per credit, share of
+# scrapes that found RECRAWL_USEFUL_CHANGE or more, and how long new videos waited to be seen.
+
+def iso(epoch):
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+class Creator:
+    def __init__(self, index, rng, start, horizon, js_only):
+        self.url = f"https://www.tiktok.com/@sim_creator_{index}"
+        self.uploads_per_day = math.exp(rng.gauss(math.log(0.3), 1.5))
+        self.followers = int(math.exp(rng.gauss(math.log(20000), 1.5)))
+        self.likes = self.followers * 20
+        # Audience growth follows activity, loosely
+        self.growth_per_day = 0.002 * self.uploads_per_day
+        self.credits = 5 if rng.random() < js_only else 1
+        self.upload_times = []
+        t = start
+        while True:
+            t += rng.expovariate(self.uploads_per_day) * scheduler.DAY
+            if t >= horizon:
+                break
+            self.upload_times.append(t)
+
+    def observe(self, now, start):
+        days = (now - start) / scheduler.DAY
+        uploaded = [t for t in self.upload_times if t <= now]
+        return {
+            "username": scheduler.username_for(self.url),
+            "profile_url": self.url,
+            "scrape_timestamp": iso(now),
+            "follower_count": int(self.followers * (1 + self.growth_per_day) ** days),
+            "total_like_count": int(self.likes * (1 + self.growth_per_day) ** days),
+            "recent_video_times": [datetime.fromtimestamp(t, timezone.utc).isoformat() for t in reversed(uploaded[-50:])],
+            "credits": self.credits,
+        }
+
+def simulate(args, uniform_hours=None):
+    if uniform_hours is not None:
+        scheduler.RECRAWL_MIN_INTERVAL_HOURS = scheduler.RECRAWL_MAX_INTERVAL_HOURS = uniform_hours
+        scheduler.RECRAWL_DEFAULT_INTERVAL_HOURS = uniform_hours
+    else:
+        scheduler.RECRAWL_MIN_INTERVAL_HOURS, scheduler.RECRAWL_MAX_INTERVAL_HOURS = 1.0, 168.0
+        scheduler.RECRAWL_DEFAULT_INTERVAL_HOURS = 24.0
+    scheduler.RECRAWL_CREDIT_BUDGET_PER_HOUR = args.budget
+    scheduler.RECRAWL_TARGET_CHANGE = args.target_change
+
+    rng = random.Random(args.seed)
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc).timestamp()
+    horizon = start + args.days * scheduler.DAY
+    creators = {}
+    for index in range(args.creators):
+        creator = Creator(index, rng, start, horizon, args.js_only)
+        creators[scheduler.username_for(creator.url)] = creator
+
+    store = scheduler.MemoryStateStore()
+    source = scheduler.MemoryObservationSource()
+    publisher = LocalPublisherClient()
+    topic = publisher.topic_path("sim", "scrape-tiktok-topic")
+    clock = {"now": start}
+    # Upload time of each video to the time a scrape first saw it
+    seen = {username: 0 for username in creators}
+    lags = []
+
+    def scrape(message):
+        for url in json.loads(message.data):
+            username = scheduler.username_for(url)
+            creator = creators[username]
+            uploads = creator.upload_times
+            while seen[username] < len(uploads) and uploads[seen[username]] <= clock["now"]:
+                lags.append(clock["now"] - uploads[seen[username]])
+                seen[username] += 1
+            source.observations.append(creator.observe(clock["now"], start))
+
+    publisher.subscribe(topic, scrape)
+    first = True
+    while clock["now"] < horizon:
+        add_urls = [creator.url for creator in creators.values()] if first else ()
+        result = scheduler.run_scheduler(store, source, publisher, topic, now=clock["now"], add_urls=add_urls)
+        first = False
+        clock["now"] += args.run_minutes * 60
+    # The first sweep of every creator sees its back catalogue, not new uploads
+    uploaded = sum(len(creator.upload_times) for creator in creators.values())
+    missed = uploaded - sum(seen.values())
+    # What a scrape of an arbitrary creator costs on average
+    mean_credits = sum(creator.credits for creator in creators.values()) / len(creators)
+    return result["report"], lags, missed, mean_credits
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate adaptive vs uniform recrawl scheduling.")
+    parser.add_argument("--creators", type=int, default=500)
+    parser.add_argument("--days", type=float, default=7)
+    parser.add_argument("--budget", type=float, default=500, help="Credits per hour")
+    parser.add_argument("--run-minutes", type=float, default=15, help="Minutes between scheduler runs")
+    parser.add_argument("--target-change", type=float, default=scheduler.RECRAWL_TARGET_CHANGE,
+                        help="Expected change per adaptive scrape (RECRAWL_TARGET_CHANGE)")
+    parser.add_argument("--js-only", type=float, default=0.2, help="Share of creators whose scrapes need render_js")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    print(f"{args.creators} creators, {args.days} days, {args.budget:g} credits/hour, "
+          f"{args.js_only:.0%} of creators render-only (5 credits/scrape, 1 otherwise)")
+    print(f"{'policy':<10}{'credits':>10}{'change':>10}{'change/credit':>15}{'useful scrapes':>16}"
+          f"{'median lag h':>14}{'p90 lag h':>11}{'unseen':>8}")
+    adaptive = simulate(args)
+    # The uniform interval that spends what the adaptive run spent
+    scrapes = adaptive[0]["credits_spent"] / adaptive[3]
+    uniform = simulate(args, uniform_hours=args.creators * args.days * 24 / max(scrapes, 1))
+    for policy, (report, lags, missed, _) in (("uniform", uniform), ("adaptive", adaptive)):
+        lags.sort()
+        median = lags[len(lags) // 2] / scheduler.HOUR if lags else 0
+        p90 = lags[int(len(lags) * 0.9)] / scheduler.HOUR if lags else 0
+        print(f"{policy:<10}{report['credits_spent']:>10g}{report['change_captured']:>10.1f}"
+              f"{report['change_per_credit']:>15.4f}{report['useful_scrape_ratio']:>16.2%}"
+              f"{median:>14.1f}{p90:>11.1f}{missed:>8}")
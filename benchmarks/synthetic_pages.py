@@ -0,0 +1,188 @@
+import json
+import random
+import zlib
+
+# Synthetic TikTok profile pages for benchmarks. Posts carry roughly the
+# fields a real itemList entry has (video, music, author, challenges), so page
+# sizes stay close to what ScrapingBee returns: about 2.5 KB per post.
+#
+# Variants:
+#   posts      __DEFAULT_SCOPE__["webapp.user-detail"]["posts"]
+#   itemList   __DEFAULT_SCOPE__["webapp.user-detail"]["itemList"]
+#   ItemModule top-level ItemModule dict keyed by video id, as older pages had
+#   html       no rehydration JSON at all, only the rendered markup the HTML
+#              fallback reads
+
+VARIANTS = ("posts", "itemList", "ItemModule", "html")
+
+def _user_id(username):
+    return str(6800000000000000000 + zlib.crc32(username.encode("utf-8")))
+
+def synthetic_user(username, rng):
+    return {
+        "id": _user_id(username),
+        "uniqueId": username,
+        "nickname": username.replace("_", " ").title(),
+        "signature": "Daily videos about cooking, travel and everything in between ✨",
+        "bioLink": {"link": f"https://linktr.ee/{username}", "risk": 0},
+        "bio": "Creator",
+        "avatarLarger": f"https://p16-sign-va.tiktokcdn.com/tos-maliva-avt-0068/{rng.getrandbits(64):016x}~c5_1080x1080.jpeg",
+        "verified": rng.random() < 0.3,
+        "secUid": f"MS4wLjABAAAA{rng.getrandbits(128):032x}",
+        "privateAccount": False,
+        "region": "US",
+        "language": "en",
+    }
+
+def synthetic_stats(rng, posts):
+    return {
+        "followingCount": rng.randint(10, 2000),
+        "followerCount": rng.randint(1000, 50_000_000),
+        "heartCount": rng.randint(10_000, 900_000_000),
+        "videoCount": posts,
+        "diggCount": rng.randint(0, 50000),
+    }
+
+def synthetic_post(username, index, rng):
+    video_id = str(7100000000000000000 + index)
+    play_count = rng.randint(100, 20_000_000)
+    return {
+        "id": video_id,
+        "desc": f"Part {index} of the series #fyp #foryou #{username} #cooking #travel",
+        "createTime": 1700000000 + index * 3600,
+        "video": {
+            "id": video_id,
+            "height": 1024,
+            "width": 576,
+            "duration": rng.randint(5, 180),
+            "ratio": "540p",
+            "cover": f"https://p16-sign-va.tiktokcdn.com/obj/tos-maliva-p-0068/{rng.getrandbits(96):024x}?x-expires=1700000000&x-signature=abc",
+            "originCover": f"https://p16-sign-va.tiktokcdn.com/obj/tos-maliva-p-0068/{rng.getrandbits(96):024x}",
+            "dynamicCover": f"https://p16-sign-va.tiktokcdn.com/obj/tos-maliva-p-0068/{rng.getrandbits(96):024x}",
+            "playAddr": f"https://v16-webapp-prime.tiktok.com/video/tos/useast2a/{rng.getrandbits(128):032x}/?a=1988&bti=ODszNWYuMDE6&ch=0&cr=3&dr=0&lr=all&cd=0%7C0%7C0%7C",
+            "downloadAddr": f"https://v16-webapp-prime.tiktok.com/video/tos/useast2a/{rng.getrandbits(128):032x}/?a=1988&ch=0&cr=3&dr=0&lr=all",
+            "format": "mp4",
+            "bitrate": rng.randint(300000, 1500000),
+            "codecType": "h264",
+        },
+        "author": {"id": _user_id(username), "uniqueId": username, "nickname": username},
+        "music": {
+            "id": str(7000000000000000000 + rng.randint(0, 10**9)),
+            "title": f"original sound - {username}",
+            "playUrl": f"https://sf16-ies-music-va.tiktokcdn.com/obj/musically-maliva-obj/{rng.getrandbits(64):016x}.mp3",
+            "coverLarge": f"https://p16-sign-va.tiktokcdn.com/tos-maliva-avt-0068/{rng.getrandbits(64):016x}~c5_1080x1080.jpeg",
+            "authorName": username,
+            "original": True,
+            "duration": rng.randint(5, 60),
+        },
+        "challenges": [
+            {"id": str(rng.randint(1, 10**9)), "title": tag, "desc": "", "coverLarger": ""}
+            for tag in ("fyp", "foryou", "cooking")
+        ],
+        "stats": {
+            "playCount": play_count,
+            "diggCount": play_count // rng.randint(5, 20),
+            "commentCount": rng.randint(0, 5000),
+            "shareCount": rng.randint(0, 20000),
+            "collectCount": rng.randint(0, 20000),
+        },
+        "isAd": False,
+        "duetEnabled": True,
+        "stitchEnabled": True,
+        "shareEnabled": True,
+    }
+
+def rehydration_data(username, posts, variant="itemList", seed=0):
+    rng = random.Random(f"{username}:{posts}:{seed}")
+    user_detail = {
+        "userInfo": {"user": synthetic_user(username, rng), "stats": synthetic_stats(rng, posts)},
+        "statusCode": 0,
+    }
+    items = [synthetic_post(username, index, rng) for index in range(posts)]
+    data = {"__DEFAULT_SCOPE__": {"webapp.app-context": {"language": "en", "region": "US"}, "webapp.user-detail": user_detail}}
+    if variant == "posts":
+        user_detail["posts"] = items
+    elif variant == "itemList":
+        user_detail["itemList"] = items
+    elif variant == "ItemModule":
+        data["ItemModule"] = {item["id"]: item for item in items}
+    else:
+        raise ValueError(f"Unknown rehydration variant: {variant}")
+    return data
+
+def _html_shell(head, body):
+    return (
+        "<!DOCTYPE html><html lang=\"en\"><head><meta charset=\"utf-8\">"
+        "<title>TikTok</title>"
+        + head
+        + "<link rel=\"stylesheet\" href=\"https://sf16-website-login.neutral.ttwstatic.com/obj/tiktok_web_login_static/tiktok/webapp/main/webapp-desktop/app.css\">"
+        + "</head><body>"
+        + body
+        + "</body></html>"
+    )
+
+def rehydration_page(username, posts, variant="itemList", seed=0):
+    data = rehydration_data(username, posts, variant, seed)
+    head = (
+        "<script id=\"__UNIVERSAL_DATA_FOR_REHYDRATION__\" type=\"application/json\">"
+        + json.dumps(data)
+        + "</script>"
+    )
+    return _html_shell(head, "<div id=\"app\"></div>")
+
+def _profile_markup(user, stats):
+    verified = "<svg data-e2e=\"verify-badge\" width=\"20\" height=\"20\"></svg>" if user["verified"] else ""
+    return (
+        "<div class=\"tiktok-1g04lal-DivShareLayoutHeader-StyledDivShareLayoutHeaderV2\">"
+        f"<img data-e2e=\"user-avatar\" src=\"{user['avatarLarger']}\" alt=\"\">"
+        f"<h1 data-e2e=\"user-title\">{user['nickname']}</h1>{verified}"
+        f"<h2 data-e2e=\"user-subtitle\">{user['uniqueId']}</h2>"
+        "<h3 class=\"tiktok-12ijsk-H3CountInfos\">"
+        f"<div><strong data-e2e=\"user-stats\" title=\"Following\">{stats['followingCount']}</strong><span>Following</span></div>"
+        f"<div><strong data-e2e=\"user-stats\" title=\"Followers\">{stats['followerCount']}</strong><span>Followers</span></div>"
+        f"<div><strong data-e2e=\"user-stats\" title=\"Likes\">{stats['heartCount']}</strong><span>Likes</span></div>"
+        "</h3>"
+        f"<h2 data-e2e=\"user-bio\">{user['signature']}</h2>"
+        f"<a data-e2e=\"user-link\" href=\"{user['bioLink']['link']}\">{user['bioLink']['link']}</a>"
+        "</div>"
+    )
+
+def _post_markup(username, post):
+    stats = post["stats"]
+    return (
+        "<div data-e2e=\"user-post-item\" class=\"tiktok-x6y88p-DivItemContainerV2 e19c29qe7\">"
+        "<div class=\"tiktok-1as5cen-DivWrapper e1cg0wnj1\">"
+        f"<a href=\"https://www.tiktok.com/@{username}/video/{post['id']}\" tabindex=\"-1\">"
+        "<div class=\"tiktok-1jxhpnd-DivContainer e1yey0rl0\">"
+        f"<img alt=\"{post['desc']}\" src=\"{post['video']['cover']}\" class=\"tiktok-1itcwxg-ImgPoster e1yey0rl1\">"
+        "<div class=\"tiktok-11u47i-DivCardFooter e148ts220\">"
+        f"<strong data-e2e=\"video-views\" class=\"video-count tiktok-dirst9-StrongVideoCount e148ts222\">{stats['playCount']}</strong>"
+        "</div></div></a></div>"
+        f"<div class=\"tiktok-1wrhn5c-desc e1aajktk0\">{post['desc']}</div>"
+        "<div class=\"tiktok-5kk2s1-stats e1aajktk1\">"
+        f"<strong data-e2e=\"like-count\">{stats['diggCount']}</strong>"
+        f"<strong data-e2e=\"comment-count\">{stats['commentCount']}</strong>"
+        f"<strong data-e2e=\"share-count\">{stats['shareCount']}</strong>"
+        "</div></div>"
+    )
+
+# The page a scrape yields when the rehydration script is missing: only the
+# rendered profile header and post grid, in the selectors the fallback reads.
+def html_page(username, posts, seed=0):
+    rng = random.Random(f"{username}:{posts}:{seed}")
+    user = synthetic_user(username, rng)
+    stats = synthetic_stats(rng, posts)
+    items = [synthetic_post(username, index, rng) for index in range(posts)]
+    body = (
+        "<div id=\"app\"><div class=\"tiktok-1f3gxw8-DivShareLayoutV2\">"
+        + _profile_markup(user, stats)
+        + "<div data-e2e=\"user-post-item-list\" class=\"tiktok-yvmafn-DivVideoFeedV2\">"
+        + "".join(_post_markup(username, post) for post in items)
+        + "</div></div></div>"
+    )
+    return _html_shell("", body)
+
+def synthetic_page(username, posts, variant="itemList", seed=0):
+    if variant == "html":
+        return html_page(username, posts, seed)
+    return rehydration_page(username, posts, variant, seed)
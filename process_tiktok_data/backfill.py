@@ -0,0 +1,307 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+
+import batch_loader
+import clients
+import columnar
+import main
+import raw_pages
+
+# Re-parses raw profile pages in bulk with the same extract_* functions the
+# process_tiktok_data function uses, e.g. after TikTok changes its layout.
+#
+#   python backfill.py ./raw-pages ./out
+#   python backfill.py gs://tiktok-raw-data/profiles/ ./out --format parquet --workers 8
+#
+# Output goes to <output>/profiles/ and <output>/videos/ as part files that
+# can be bulk loaded with a single wildcard load job per table. Archives hold
+# several scrapes of the same profile, so every video row carries its
+# username and scrape_timestamp (the video_snapshots layout): load them into
+# video_snapshots as they are, or keep the latest row per url for videos.
+# Completed sources are recorded in <output>/_checkpoint.txt, so rerunning the
+# same command resumes where the previous run stopped. Failed sources are not
+# checkpointed and are retried on every run; <output>/_failures.ndjson is
+# rewritten to list those that still fail.
+
+logger = logging.getLogger("backfill")
+
+RAW_SUFFIXES = (".html", ".html.gz", ".html.zst")
+CHECKPOINT_NAME = "_checkpoint.txt"
+FAILURES_NAME = "_failures.ndjson"
+IN_PROGRESS_SUFFIX = ".inprogress"
+VIDEO_ROW_FIELDS = batch_loader.VIDEO_SNAPSHOT_FIELDS
+SCRAPE_TIMESTAMP_FORMAT = "%Y%m%d-%H%M%S"
+
+# --- Discover Raw Pages ---
+# Raw pages are stored as profiles/<username>/<timestamp>.html; the
+# timestamp in the name is the scrape time in UTC.
+def timestamp_from_name(path, fallback=None):
+    stem = os.path.basename(path).split(".", 1)[0]
+    try:
+        scraped = datetime.strptime(stem, SCRAPE_TIMESTAMP_FORMAT).replace(tzinfo=timezone.utc)
+    except ValueError:
+        scraped = fallback
+    return scraped.strftime("%Y-%m-%dT%H:%M:%SZ") if scraped else None
+
+def discover_local(root):
+    for directory, _, file_names in os.walk(root):
+        for file_name in sorted(file_names):
+            if not file_name.endswith(RAW_SUFFIXES):
+                continue
+            path = os.path.join(directory, file_name)
+            modified = datetime.fromtimestamp(os.path.getmtime(path), tz=timezone.utc)
+            yield {
+                "id": os.path.relpath(path, root),
+                "location": path,
+                "username": os.path.basename(directory),
+                "scrape_timestamp": timestamp_from_name(path, modified),
+            }
+
+def discover_gcs(uri):
+    bucket_name, _, prefix = uri[len("gs://"):].partition("/")
+    storage_client = clients.get_storage_client()
+    for blob in storage_client.list_blobs(bucket_name, prefix=prefix):
+        if not blob.name.endswith(RAW_SUFFIXES):
+            continue
+        yield {
+            "id": f"gs://{bucket_name}/{blob.name}",
+            "location": f"gs://{bucket_name}/{blob.name}",
+            "username": blob.name.split("/")[-2],
+            "scrape_timestamp": timestamp_from_name(blob.name, blob.time_created),
+        }
+
+def discover(source):
+    if source.startswith("gs://"):
+        return discover_gcs(source)
+    return discover_local(source)
+
+def read_source(location):
+    if location.startswith("gs://"):
+        bucket_name, _, blob_name = location[len("gs://"):].partition("/")
+        data = clients.get_storage_client().bucket(bucket_name).blob(blob_name).download_as_bytes()
+    else:
+        with open(location, "rb") as f:
+            data = f.read()
+    return raw_pages.decompress(data, raw_pages.codec_for(location))
+
+# --- Parse One Page (runs in the worker processes) ---
+def _init_worker(log_level):
+    logging.getLogger().setLevel(log_level)
+    # Clients inherited through fork share sockets with the parent
+    clients.reset_clients()
+
+def parse_source(source):
+    try:
+        html_content = read_source(source["location"])
+        profile_data, videos_data, parse_path = main.extract_page_data(html_content, source["username"])
+        if not profile_data["username"]:
+            return source["id"], None, None, None, "No username found on the page"
+        profile_data["scrape_timestamp"] = source["scrape_timestamp"]
+        video_rows = [
+            dict(row, username=profile_data["username"], scrape_timestamp=source["scrape_timestamp"]) for row in videos_data
+        ]
+        return source["id"], profile_data, video_rows, parse_path, None
+    except Exception as e:
+        return source["id"], None, None, None, f"{type(e).__name__}: {e}"
+
+# --- Output Writers ---
+# Part files are written under a temporary name and only renamed once
+# committed, so a crashed run never leaves rows behind that the checkpoint
+# does not know about.
+class NdjsonPartWriter:
+    extension = ".ndjson"
+
+    def __init__(self, path, fields):
+        self.path = path
+        self._file = open(path + IN_PROGRESS_SUFFIX, "w", encoding="utf-8")
+
+    def write_rows(self, rows):
+        for line in map(json.dumps, rows):
+            self._file.write(line)
+            self._file.write("\n")
+
+    def commit(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self.path + IN_PROGRESS_SUFFIX, self.path)
+
+class ParquetPartWriter:
+    extension = ".parquet"
+    row_group_size = 50000
+
+    def __init__(self, path, fields):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("Parquet output needs pyarrow: pip install pyarrow")
+        self.path = path
+        self.fields = fields
+        self.schema = columnar.arrow_schema(fields)
+        self._writer = pq.ParquetWriter(path + IN_PROGRESS_SUFFIX, self.schema)
+        # Arrow tables of the rows written since the last row group
+        self._buffer = []
+        self._buffered_rows = 0
+
+    def write_rows(self, rows):
+        self._buffer.append(columnar.to_arrow_table(rows, self.fields, self.schema))
+        self._buffered_rows += len(rows)
+        if self._buffered_rows >= self.row_group_size:
+            self._flush()
+
+    def _flush(self):
+        import pyarrow as pa
+
+        if not self._buffer:
+            return
+        self._writer.write_table(pa.concat_tables(self._buffer), row_group_size=self.row_group_size)
+        self._buffer = []
+        self._buffered_rows = 0
+
+    def commit(self):
+        self._flush()
+        self._writer.close()
+        os.replace(self.path + IN_PROGRESS_SUFFIX, self.path)
+
+WRITERS = {
+    "ndjson": NdjsonPartWriter,
+    "parquet": ParquetPartWriter,
+}
+
+class PartitionedOutput:
+    tables = {
+        "profiles": batch_loader.PROFILE_FIELDS,
+        "videos": VIDEO_ROW_FIELDS,
+    }
+
+    def __init__(self, directory, output_format):
+        self.directory = directory
+        self.writer_class = WRITERS[output_format]
+        self.run_id = f"{datetime.utcnow().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        self.part = 0
+        self._writers = {}
+        for table in self.tables:
+            table_directory = os.path.join(directory, table)
+            os.makedirs(table_directory, exist_ok=True)
+            # Leftovers from a run that died before committing them
+            for file_name in os.listdir(table_directory):
+                if file_name.endswith(IN_PROGRESS_SUFFIX):
+                    os.remove(os.path.join(table_directory, file_name))
+
+    def write(self, table, rows):
+        if not rows:
+            return
+        writer = self._writers.get(table)
+        if writer is None:
+            file_name = f"part-{self.run_id}-{self.part:05d}{self.writer_class.extension}"
+            writer = self.writer_class(os.path.join(self.directory, table, file_name), self.tables[table])
+            self._writers[table] = writer
+        writer.write_rows(rows)
+
+    def commit(self):
+        for writer in self._writers.values():
+            writer.commit()
+        self._writers = {}
+        self.part += 1
+
+class Checkpoint:
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.done = {line.rstrip("\n") for line in f if line.strip()}
+        self._pending = []
+
+    def add(self, source_id):
+        self._pending.append(source_id)
+
+    def commit(self):
+        if not self._pending:
+            return
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.writelines(f"{source_id}\n" for source_id in self._pending)
+            f.flush()
+            os.fsync(f.fileno())
+        self.done.update(self._pending)
+        self._pending = []
+
+# --- Run a Backfill ---
+def run_backfill(source, output_dir, output_format="ndjson", workers=None, commit_every=500,
+                 chunksize=8, progress_interval=10.0):
+    os.makedirs(output_dir, exist_ok=True)
+    checkpoint = Checkpoint(os.path.join(output_dir, CHECKPOINT_NAME))
+    output = PartitionedOutput(output_dir, output_format)
+    sources = [item for item in discover(source) if item["id"] not in checkpoint.done]
+    skipped = len(checkpoint.done)
+    logger.info(f"Found {len(sources)} raw pages to process ({skipped} already done).")
+
+    counts = Counter()
+    started = time.perf_counter()
+    last_progress = started
+    since_commit = 0
+    workers = workers or os.cpu_count() or 1
+    failures_path = os.path.join(output_dir, FAILURES_NAME)
+    with open(failures_path + IN_PROGRESS_SUFFIX, "w", encoding="utf-8") as failures, \
+            multiprocessing.Pool(workers, initializer=_init_worker, initargs=(logging.WARNING,)) as pool:
+        for source_id, profile_data, videos_data, parse_path, error in pool.imap_unordered(parse_source, sources, chunksize=chunksize):
+            if error:
+                counts["failed"] += 1
+                failures.write(json.dumps({"id": source_id, "error": error}) + "\n")
+                continue
+            output.write("profiles", [profile_data])
+            output.write("videos", videos_data)
+            checkpoint.add(source_id)
+            counts["files"] += 1
+            counts["videos"] += len(videos_data)
+            counts[f"profile_{parse_path['profile_path']}"] += 1
+            counts[f"videos_{parse_path['videos_path']}"] += 1
+            since_commit += 1
+            if since_commit >= commit_every:
+                output.commit()
+                checkpoint.commit()
+                since_commit = 0
+            now = time.perf_counter()
+            if now - last_progress >= progress_interval:
+                last_progress = now
+                logger.info(f"{counts['files']}/{len(sources)} files, {counts['files'] / (now - started):.1f} files/sec")
+        output.commit()
+        checkpoint.commit()
+    os.replace(failures_path + IN_PROGRESS_SUFFIX, failures_path)
+
+    elapsed = time.perf_counter() - started
+    summary = dict(counts)
+    summary.update({
+        "skipped": skipped,
+        "elapsed_seconds": round(elapsed, 3),
+        "files_per_sec": round(counts["files"] / elapsed, 2) if elapsed else None,
+        "output": output_dir,
+        "format": output_format,
+    })
+    return summary
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Re-parse raw TikTok profile pages into bulk-loadable files.")
+    parser.add_argument("source", help="Local directory or gs://bucket/prefix holding profiles/<username>/<timestamp>.html")
+    parser.add_argument("output", help="Local output directory")
+    parser.add_argument("--format", choices=sorted(WRITERS), default="ndjson")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--commit-every", type=int, default=500, help="Files per committed part and checkpoint")
+    parser.add_argument("--chunksize", type=int, default=8)
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    logger.setLevel(logging.INFO)
+    summary = run_backfill(args.source, args.output, args.format, args.workers, args.commit_every, args.chunksize)
+    print(json.dumps(summary))
+    sys.exit(1 if summary.get("failed") else 0)
@@ -0,0 +1,535 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from google.api_core.exceptions import NotFound, PreconditionFailed
+
+import bq_jobs
+import columnar
+import dashboard
+import metrics
+import records
+import schemas
+
+logger = logging.getLogger(__name__)
+
+# Processed records are staged as small JSON objects in the processed bucket
+# and merged into BigQuery in micro-batches: one load and one MERGE per table
+# per batch instead of per raw file. Every batch gets its own staging tables,
+# so concurrent flushes never overwrite each other.
+
+PROCESSED_BUCKET = "tiktok-processed-data"
+DATASET_ID = "training-triggering-pipeline.tiktok_dataset"
+PROFILE_TABLE_ID = f"{DATASET_ID}.profiles"
+VIDEO_TABLE_ID = f"{DATASET_ID}.videos"
+VIDEO_SNAPSHOT_TABLE_ID = f"{DATASET_ID}.video_stats_snapshots"
+VIDEO_CURRENT_VIEW_ID = f"{DATASET_ID}.videos_current"
+DASHBOARD_TABLE_IDS = dashboard.table_ids(DATASET_ID)
+
+PENDING_PREFIX = "staging/pending/"
+CLAIMS_PREFIX = "staging/claims/"
+BATCHES_PREFIX = "staging/batches/"
+
+# Flush once this many files are pending, or once the oldest has waited this long
+BATCH_MAX_FILES = int(os.environ.get("BATCH_MAX_FILES", "50"))
+BATCH_MAX_AGE_SECONDS = float(os.environ.get("BATCH_MAX_AGE_SECONDS", "300"))
+# A claim older than this belongs to a flush that died and may be taken over
+BATCH_CLAIM_TIMEOUT_SECONDS = float(os.environ.get("BATCH_CLAIM_TIMEOUT_SECONDS", "900"))
+STAGING_TABLE_TTL = timedelta(hours=1)
+# Batch files are typed Parquet by default; ndjson keeps the old JSON loads
+BATCH_FORMAT = os.environ.get("BATCH_FORMAT", "parquet")
+# How video rows reach BigQuery: "merge" overwrites the videos table in place,
+# "snapshots" appends changed counts to video_stats_snapshots, "both" does both
+VIDEO_LOAD_MODE = os.environ.get("VIDEO_LOAD_MODE", "merge")
+
+PROFILE_FIELDS = schemas.PROFILE_FIELDS
+VIDEO_FIELDS = schemas.VIDEO_FIELDS
+VIDEO_SNAPSHOT_FIELDS = schemas.VIDEO_SNAPSHOT_FIELDS
+
+# Batches can be flushed out of order, so an older profile or video snapshot
+# never overwrites a newer one.
+MERGE_PROFILE_QUERY = """
+MERGE INTO `{target}` AS target
+USING `{source}` AS source
+ON target.username = source.username
+WHEN MATCHED AND (target.scrape_timestamp IS NULL OR source.scrape_timestamp >= target.scrape_timestamp) THEN
+    UPDATE SET
+        user_id = source.user_id,
+        actual_name = source.actual_name,
+        following_count = source.following_count,
+        follower_count = source.follower_count,
+        total_like_count = source.total_like_count,
+        caption = source.caption,
+        bio_link = source.bio_link,
+        bio = source.bio,
+        profile_pic_url = source.profile_pic_url,
+        is_verified = source.is_verified,
+        scrape_timestamp = source.scrape_timestamp
+WHEN NOT MATCHED THEN
+    INSERT (
+        username,
+        user_id,
+        actual_name,
+        following_count,
+        follower_count,
+        total_like_count,
+        caption,
+        bio_link,
+        bio,
+        profile_pic_url,
+        is_verified,
+        scrape_timestamp
+    )
+    VALUES (
+        source.username,
+        source.user_id,
+        source.actual_name,
+        source.following_count,
+        source.follower_count,
+        source.total_like_count,
+        source.caption,
+        source.bio_link,
+        source.bio,
+        source.profile_pic_url,
+        source.is_verified,
+        source.scrape_timestamp
+    )
+"""
+
+MERGE_VIDEO_QUERY = """
+MERGE INTO `{target}` AS target
+USING `{source}` AS source
+ON target.url = source.url
+WHEN MATCHED AND (target.scrape_timestamp IS NULL OR source.scrape_timestamp >= target.scrape_timestamp) THEN
+    UPDATE SET
+        views = source.views,
+        thumbnail = source.thumbnail,
+        description = source.description,
+        create_time = source.create_time,
+        like_count = source.like_count,
+        comment_count = source.comment_count,
+        share_count = source.share_count,
+        scrape_timestamp = source.scrape_timestamp
+WHEN NOT MATCHED THEN
+    INSERT (
+        url,
+        views,
+        thumbnail,
+        description,
+        create_time,
+        like_count,
+        comment_count,
+        share_count,
+        scrape_timestamp
+    )
+    VALUES (
+        source.url,
+        source.views,
+        source.thumbnail,
+        source.description,
+        source.create_time,
+        source.like_count,
+        source.comment_count,
+        source.share_count,
+        source.scrape_timestamp
+    )
+"""
+
+# Video stats history. Each batch appends a snapshot row only for videos that
+# are new or whose counts differ from their latest snapshot. The snapshot
+# table is partitioned by day and clustered by username and url, so the
+# lookup of the latest snapshots only reads the batch's creators.
+INSERT_VIDEO_SNAPSHOTS_QUERY = """
+INSERT INTO `{target}` (
+    url,
+    username,
+    views,
+    like_count,
+    comment_count,
+    share_count,
+    thumbnail,
+    description,
+    create_time,
+    scrape_timestamp
+)
+SELECT
+    source.url,
+    source.username,
+    source.views,
+    source.like_count,
+    source.comment_count,
+    source.share_count,
+    source.thumbnail,
+    source.description,
+    source.create_time,
+    source.scrape_timestamp
+FROM `{source}` AS source
+LEFT JOIN (
+    SELECT
+        url,
+        views,
+        like_count,
+        comment_count,
+        share_count,
+        scrape_timestamp,
+        ROW_NUMBER() OVER (PARTITION BY url ORDER BY scrape_timestamp DESC) AS snapshot_rank
+    FROM `{target}`
+    WHERE username IN (SELECT DISTINCT username FROM `{source}`)
+) AS latest
+ON latest.url = source.url AND latest.snapshot_rank = 1
+WHERE latest.url IS NULL
+    OR (
+        source.scrape_timestamp > latest.scrape_timestamp
+        AND (
+            source.views IS DISTINCT FROM latest.views
+            OR source.like_count IS DISTINCT FROM latest.like_count
+            OR source.comment_count IS DISTINCT FROM latest.comment_count
+            OR source.share_count IS DISTINCT FROM latest.share_count
+        )
+    )
+"""
+
+# Latest snapshot per video; dashboards read this instead of the videos table
+CURRENT_VIDEOS_VIEW_QUERY = """
+SELECT
+    url,
+    username,
+    views,
+    thumbnail,
+    description,
+    create_time,
+    like_count,
+    comment_count,
+    share_count,
+    scrape_timestamp
+FROM (
+    SELECT
+        *,
+        ROW_NUMBER() OVER (PARTITION BY url ORDER BY scrape_timestamp DESC) AS snapshot_rank
+    FROM `{snapshots}`
+)
+WHERE snapshot_rank = 1
+"""
+
+# --- Snapshot Tables ---
+# Tables known to exist, for the lifetime of the instance; the create_table
+# round trips only happen on the first flush after a cold start.
+_known_tables = set()
+_known_tables_lock = threading.Lock()
+
+def forget_tables():
+    with _known_tables_lock:
+        _known_tables.clear()
+
+def ensure_snapshot_tables(bq_client):
+    from google.cloud import bigquery
+
+    with _known_tables_lock:
+        if VIDEO_CURRENT_VIEW_ID in _known_tables:
+            return
+    table = bigquery.Table(VIDEO_SNAPSHOT_TABLE_ID, schema=schemas.to_schema(VIDEO_SNAPSHOT_FIELDS))
+    table.time_partitioning = bigquery.TimePartitioning(type_=bigquery.TimePartitioningType.DAY, field="scrape_timestamp")
+    table.clustering_fields = ["username", "url"]
+    bq_client.create_table(table, exists_ok=True)
+
+    view = bigquery.Table(VIDEO_CURRENT_VIEW_ID)
+    view.view_query = CURRENT_VIDEOS_VIEW_QUERY.format(snapshots=VIDEO_SNAPSHOT_TABLE_ID)
+    bq_client.create_table(view, exists_ok=True)
+    with _known_tables_lock:
+        _known_tables.update((VIDEO_SNAPSHOT_TABLE_ID, VIDEO_CURRENT_VIEW_ID))
+
+# --- Dashboard Tables ---
+def ensure_dashboard_tables(bq_client):
+    from google.cloud import bigquery
+
+    with _known_tables_lock:
+        if all(table_id in _known_tables for table_id in DASHBOARD_TABLE_IDS.values()):
+            return
+    for name, table_id in DASHBOARD_TABLE_IDS.items():
+        bq_client.create_table(bigquery.Table(table_id, schema=schemas.to_schema(dashboard.TABLE_FIELDS[name])), exists_ok=True)
+    with _known_tables_lock:
+        _known_tables.update(DASHBOARD_TABLE_IDS.values())
+
+# Runs after a batch's MERGE, while its staging table still exists. A failure
+# here does not fail the flush: the batch itself is merged, and the next
+# reconciliation catches the dashboard tables up.
+def _update_dashboard(bq_client, statements):
+    try:
+        ensure_dashboard_tables(bq_client)
+        for name, statement in statements:
+            with metrics.span(f"bq_dashboard_{name}"):
+                job = bq_client.query(statement)
+                yield job
+                job.result()
+    except Exception as e:
+        forget_tables()
+        logger.error(f"Could not update the dashboard tables, leaving them to the reconciliation: {e}")
+
+# Rebuilds the dashboard tables from profiles and videos (videos_current when
+# video counts are kept as snapshots) and returns how many rows each needed
+# corrected; after a clean run of incremental updates that is mostly 0.
+def reconcile_dashboard(bq_client):
+    ensure_dashboard_tables(bq_client)
+    videos_table_id = VIDEO_CURRENT_VIEW_ID if VIDEO_LOAD_MODE == "snapshots" else VIDEO_TABLE_ID
+    corrected = {}
+    for name, statement in dashboard.reconcile_statements(DASHBOARD_TABLE_IDS, PROFILE_TABLE_ID, videos_table_id):
+        with metrics.span(f"bq_reconcile_{name}"):
+            job = bq_client.query(statement)
+            job.result()
+        corrected[name] = job.num_dml_affected_rows or 0
+    logger.info(f"Reconciled dashboard tables: {json.dumps(corrected)}")
+    return corrected
+
+# --- Stage Processed Data ---
+# username and scrape_timestamp are kept even when change detection dropped
+# the profile, so video snapshots can still be attributed and ordered.
+def stage_processed(storage_client, profile_data, videos_data, username=None, scrape_timestamp=None):
+    # Names start with the staging time in milliseconds, so listing order is age order
+    blob_name = f"{PENDING_PREFIX}{int(time.time() * 1000):013d}-{uuid.uuid4().hex[:12]}.json"
+    blob = storage_client.bucket(PROCESSED_BUCKET).blob(blob_name)
+    staged = encode_staged(profile_data, videos_data, username, scrape_timestamp)
+    blob.upload_from_string(staged, content_type="application/json", if_generation_match=0)
+    return blob_name
+
+# videos_data is a records.VideoBatch, whose JSON lines are spliced in; the
+# result is the same text as json.dumps() of the staged dict
+def encode_staged(profile_data, videos_data, username=None, scrape_timestamp=None):
+    return '{"profile": %s, "videos": [%s], "username": %s, "scrape_timestamp": %s}' % (
+        json.dumps(profile_data), ", ".join(videos_data.json_lines()), json.dumps(username), json.dumps(scrape_timestamp)
+    )
+
+def _staged_ms(blob_name):
+    return int(blob_name[len(PENDING_PREFIX):].split("-", 1)[0])
+
+def pending_age_seconds(blob_name, now=None):
+    now = time.time() if now is None else now
+    return now - _staged_ms(blob_name) / 1000.0
+
+# Snapshot rows carry who and when; files staged before that was recorded fall
+# back to the profile, then to the video URL and the staging time.
+def _snapshot_rows(staged, blob_name):
+    profile = staged.get("profile") or {}
+    username = staged.get("username") or profile.get("username")
+    scrape_timestamp = staged.get("scrape_timestamp") or profile.get("scrape_timestamp")
+    if not scrape_timestamp:
+        scrape_timestamp = datetime.fromtimestamp(_staged_ms(blob_name) / 1000.0, timezone.utc).isoformat()
+    rows = []
+    for video in staged.get("videos") or []:
+        row = dict(video)
+        row["username"] = username or video["url"].split("@")[-1].split("/")[0]
+        row["scrape_timestamp"] = scrape_timestamp
+        rows.append(row)
+    return rows
+
+def _timestamp_key(value):
+    return columnar.CONVERTERS["TIMESTAMP"](value) or datetime.min.replace(tzinfo=timezone.utc)
+
+# --- Decide Whether a Batch Is Due ---
+def due_batch(storage_client, max_files=None, max_age_seconds=None, force=False):
+    max_files = BATCH_MAX_FILES if max_files is None else max_files
+    max_age_seconds = BATCH_MAX_AGE_SECONDS if max_age_seconds is None else max_age_seconds
+    blobs = storage_client.list_blobs(PROCESSED_BUCKET, prefix=PENDING_PREFIX, max_results=max_files)
+    pending = [blob.name for blob in blobs]
+    if not pending:
+        return []
+    if force or len(pending) >= max_files or pending_age_seconds(pending[0]) >= max_age_seconds:
+        return pending
+    return []
+
+# --- Claim Pending Files for a Batch ---
+def _claim(bucket, pending_name, batch_id, retry=True):
+    claim = bucket.blob(CLAIMS_PREFIX + pending_name[len(PENDING_PREFIX):])
+    try:
+        claim.upload_from_string(batch_id, content_type="text/plain", if_generation_match=0)
+        return claim
+    except PreconditionFailed:
+        pass
+    if not retry:
+        return None
+    try:
+        claim.reload()
+    except NotFound:
+        return None
+    claim_age = (datetime.now(timezone.utc) - claim.time_created).total_seconds()
+    if claim_age < BATCH_CLAIM_TIMEOUT_SECONDS:
+        return None
+    logger.warning(f"Taking over stale claim on {pending_name} ({claim_age:.0f}s old)")
+    try:
+        claim.delete(if_generation_match=claim.generation)
+    except (NotFound, PreconditionFailed):
+        return None
+    return _claim(bucket, pending_name, batch_id, retry=False)
+
+def _delete_quietly(blob):
+    try:
+        blob.delete()
+    except NotFound:
+        pass
+
+# --- Load One Batch into a Staging Table and Merge ---
+# A bq_jobs pipeline: yields the load and the MERGE job in turn, then the
+# dashboard statements dashboard_updates(staging_table_id) returns, if given
+def _load_and_merge(storage_client, bq_client, rows, fields, target_table_id, merge_query, batch_id, kind,
+                    dashboard_updates=None):
+    from google.cloud import bigquery
+
+    schema = schemas.to_schema(fields)
+    if BATCH_FORMAT == "parquet":
+        blob_path = f"{BATCHES_PREFIX}{batch_id}/{kind}.parquet"
+        data = columnar.encode_parquet(rows, fields)
+        content_type = "application/vnd.apache.parquet"
+        # Parquet carries its own types; appending keeps the staging table's schema
+        job_config = bigquery.LoadJobConfig(
+            source_format=bigquery.SourceFormat.PARQUET,
+            write_disposition=bigquery.WriteDisposition.WRITE_APPEND
+        )
+    else:
+        blob_path = f"{BATCHES_PREFIX}{batch_id}/{kind}.json"
+        data = rows.to_ndjson() if isinstance(rows, records.VideoBatch) else "\n".join(json.dumps(row) for row in rows)
+        content_type = "application/json"
+        job_config = bigquery.LoadJobConfig(
+            source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
+            write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE,
+            schema=schema
+        )
+    blob = storage_client.bucket(PROCESSED_BUCKET).blob(blob_path)
+    with metrics.span(f"gcs_upload_{kind}_batch"):
+        blob.upload_from_string(data, content_type=content_type)
+
+    staging_table_id = f"{DATASET_ID}.staging_{kind}_{batch_id}"
+    staging_table = bigquery.Table(staging_table_id, schema=schema)
+    # Orphaned staging tables from a crashed flush clean themselves up
+    staging_table.expires = datetime.now(timezone.utc) + STAGING_TABLE_TTL
+    with metrics.span(f"bq_load_{kind}"):
+        bq_client.create_table(staging_table)
+    try:
+        with metrics.span(f"bq_load_{kind}"):
+            load_job = bq_client.load_table_from_uri(f"gs://{PROCESSED_BUCKET}/{blob_path}", staging_table_id, job_config=job_config)
+            yield load_job
+            load_job.result()
+        logger.info(f"Loaded {len(rows)} {kind} rows into staging table {staging_table_id}")
+
+        with metrics.span(f"bq_merge_{kind}"):
+            merge_job = bq_client.query(merge_query.format(target=target_table_id, source=staging_table_id))
+            yield merge_job
+            merge_job.result()
+        logger.info(f"Merged {kind} batch {batch_id} into BigQuery table {target_table_id}")
+        if dashboard_updates is not None:
+            yield from _update_dashboard(bq_client, dashboard_updates(staging_table_id))
+    except NotFound:
+        # The target may have been dropped; bootstrap it again on the next flush
+        forget_tables()
+        raise
+    finally:
+        bq_client.delete_table(staging_table_id, not_found_ok=True)
+        _delete_quietly(blob)
+
+def _snapshot_pipeline(storage_client, bq_client, rows, batch_id, dashboard_updates=None):
+    ensure_snapshot_tables(bq_client)
+    return (yield from _load_and_merge(storage_client, bq_client, rows, VIDEO_SNAPSHOT_FIELDS,
+                                       VIDEO_SNAPSHOT_TABLE_ID, INSERT_VIDEO_SNAPSHOTS_QUERY, batch_id, "video_snapshots",
+                                       dashboard_updates))
+
+def _dashboard_profile_updates(staging_table_id):
+    return dashboard.profile_updates(DASHBOARD_TABLE_IDS, staging_table_id)
+
+def _dashboard_video_updates(staging_table_id):
+    return dashboard.video_updates(DASHBOARD_TABLE_IDS, staging_table_id)
+
+# --- Flush a Batch ---
+def flush_batch(storage_client, bq_client, pending_names):
+    batch_id = f"{datetime.utcnow().strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex[:8]}"
+    bucket = storage_client.bucket(PROCESSED_BUCKET)
+    claims = {}
+    for name in pending_names:
+        claim = _claim(bucket, name, batch_id)
+        if claim is not None:
+            claims[name] = claim
+    if not claims:
+        logger.info("All pending files are already claimed by other flushes.")
+        return None
+
+    try:
+        # Later snapshots win: profiles and videos by scrape_timestamp, ties by
+        # staging order, so a retried older scrape never replaces newer stats
+        profiles = {}
+        videos = {}
+        flushed = []
+        for name in sorted(claims):
+            try:
+                staged = json.loads(bucket.blob(name).download_as_bytes())
+            except NotFound:
+                continue
+            flushed.append(name)
+            profile = staged.get("profile")
+            if profile and not profile.get("username"):
+                # Staged before process_tiktok_data skipped such pages; it would fail every flush
+                logger.error(f"Dropping profile without a username staged in {name}.")
+                profile = None
+            if profile:
+                current = profiles.get(profile["username"])
+                if current is None or (profile.get("scrape_timestamp") or "") >= (current.get("scrape_timestamp") or ""):
+                    profiles[profile["username"]] = profile
+            for row in _snapshot_rows(staged, name):
+                current = videos.get(row["url"])
+                if current is None or _timestamp_key(row["scrape_timestamp"]) >= _timestamp_key(current["scrape_timestamp"]):
+                    videos[row["url"]] = row
+
+        # The tables are independent, so their load and MERGE jobs run side by
+        # side. Top videos follow whichever table holds the current counts.
+        profile_updates = video_updates = snapshot_updates = None
+        if dashboard.enabled():
+            profile_updates = _dashboard_profile_updates
+            if VIDEO_LOAD_MODE == "snapshots":
+                snapshot_updates = _dashboard_video_updates
+            else:
+                video_updates = _dashboard_video_updates
+        pipelines = {}
+        if profiles:
+            pipelines["profiles"] = _load_and_merge(storage_client, bq_client, list(profiles.values()), PROFILE_FIELDS,
+                                                    PROFILE_TABLE_ID, MERGE_PROFILE_QUERY, batch_id, "profiles", profile_updates)
+        if videos and VIDEO_LOAD_MODE != "snapshots":
+            video_rows = [{name: row.get(name) for name, _, _ in VIDEO_FIELDS} for row in videos.values()]
+            pipelines["videos"] = _load_and_merge(storage_client, bq_client, video_rows, VIDEO_FIELDS,
+                                                  VIDEO_TABLE_ID, MERGE_VIDEO_QUERY, batch_id, "videos", video_updates)
+        if videos and VIDEO_LOAD_MODE != "merge":
+            pipelines["video_snapshots"] = _snapshot_pipeline(storage_client, bq_client, list(videos.values()), batch_id,
+                                                              snapshot_updates)
+        with metrics.span("bq_jobs"):
+            bq_jobs.run_pipelines(pipelines)
+    except Exception:
+        # Release the claims so the next flush retries these files
+        for claim in claims.values():
+            _delete_quietly(claim)
+        raise
+
+    for name in flushed:
+        _delete_quietly(bucket.blob(name))
+    for claim in claims.values():
+        _delete_quietly(claim)
+
+    result = {
+        "batch_id": batch_id,
+        "files": len(flushed),
+        "profiles": len(profiles),
+        "videos": len(videos),
+        "video_snapshots": len(videos) if VIDEO_LOAD_MODE != "merge" else 0,
+    }
+    logger.info(f"Flushed batch: {json.dumps(result)}")
+    return result
+
+def flush_all(storage_client, bq_client, max_batches=100):
+    results = []
+    for _ in range(max_batches):
+        pending = due_batch(storage_client, force=True)
+        if not pending:
+            break
+        result = flush_batch(storage_client, bq_client, pending)
+        if result is None:
+            break
+        results.append(result)
+    return results
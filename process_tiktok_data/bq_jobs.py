@@ -0,0 +1,103 @@
+import contextvars
+import logging
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+logger = logging.getLogger(__name__)
+
+# Runs independent BigQuery pipelines (profiles, videos, video snapshots)
+# side by side instead of one after another. A pipeline is a generator that
+# does its synchronous work (uploads, table calls) and yields each job it
+# submits; it is resumed with the job once the job is done:
+#
+#   def pipeline():
+#       load_job = bq_client.load_table_from_uri(...)
+#       yield load_job
+#       load_job.result()          # raises if the job failed
+#       merge_job = bq_client.query(...)
+#       yield merge_job
+#       merge_job.result()
+#
+# Synchronous steps run on a small thread pool, inside a copy of the caller's
+# context so metrics spans land on the caller's trace; submitted jobs from all
+# pipelines are polled together from the calling thread. Wall-clock is then
+# about the longest pipeline rather than the sum of all of them.
+# BQ_PIPELINE_MODE=serial runs them one after another, as before.
+
+BQ_PIPELINE_MODE = os.environ.get("BQ_PIPELINE_MODE", "concurrent")
+POLL_INTERVAL_SECONDS = float(os.environ.get("BQ_POLL_INTERVAL_SECONDS", "0.1"))
+MAX_POLL_INTERVAL_SECONDS = float(os.environ.get("BQ_MAX_POLL_INTERVAL_SECONDS", "2"))
+# Jobs are polled again after this fraction of the youngest one's age, so a
+# job is noticed within about a quarter of its run time of finishing
+POLL_AGE_FRACTION = 0.25
+
+def _step(context, pipeline, job):
+    return context.run(pipeline.send, job)
+
+# The pipeline's own result() calls do the waiting; the first error stops the rest
+def _run_serially(pipelines):
+    results = {}
+    for name, pipeline in pipelines.items():
+        job = None
+        try:
+            while True:
+                job = pipeline.send(job)
+        except StopIteration as e:
+            results[name] = e.value
+    return results
+
+# pipelines maps a name to a generator. Every pipeline runs to completion;
+# if any failed, the first error (in the order given) is raised afterwards.
+def run_pipelines(pipelines, mode=None):
+    if not pipelines:
+        return {}
+    if (mode or BQ_PIPELINE_MODE) == "serial":
+        return _run_serially(pipelines)
+    results = {}
+    errors = {}
+    stepping = {}
+    waiting = {}
+    with ThreadPoolExecutor(max_workers=len(pipelines), thread_name_prefix="bq-pipeline") as executor:
+        def advance(name, job=None):
+            # A fresh copy per step: the calling thread's context may have moved on meanwhile
+            future = executor.submit(_step, contextvars.copy_context(), pipelines[name], job)
+            stepping[future] = name
+
+        for name in pipelines:
+            advance(name)
+
+        while stepping or waiting:
+            interval = None
+            if waiting:
+                youngest = time.monotonic() - max(submitted for _, submitted in waiting.values())
+                interval = min(max(youngest * POLL_AGE_FRACTION, POLL_INTERVAL_SECONDS), MAX_POLL_INTERVAL_SECONDS)
+            if stepping:
+                # Without jobs to poll there is nothing to do until a step finishes
+                done, _ = wait(stepping, timeout=interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = stepping.pop(future)
+                    try:
+                        waiting[name] = (future.result(), time.monotonic())
+                    except StopIteration as e:
+                        results[name] = e.value
+                    except Exception as e:
+                        logger.error(f"BigQuery pipeline {name} failed: {e}")
+                        errors[name] = e
+            else:
+                time.sleep(interval)
+
+            for name, (job, _) in list(waiting.items()):
+                try:
+                    finished = job.done()
+                except Exception:
+                    # Let the pipeline's own result() call surface the error
+                    finished = True
+                if finished:
+                    del waiting[name]
+                    advance(name, job)
+
+    for name in pipelines:
+        if name in errors:
+            raise errors[name]
+    return results
@@ -0,0 +1,91 @@
+import io
+from datetime import datetime, timezone
+
+# Typed columnar encoding of processed records, driven by the field lists in
+# schemas.py. Values are converted to the BigQuery column type on the way in,
+# so sentinels such as "N/A" in numeric fields become proper NULLs and
+# scrape_timestamp is a real timestamp rather than a string. pyarrow is only
+# imported when something is actually encoded.
+
+PARQUET_COMPRESSION = "snappy"
+
+def _to_integer(value):
+    if value is None or isinstance(value, bool):
+        return None if value is None else int(value)
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def _to_float(value):
+    try:
+        return None if value is None else float(value)
+    except (TypeError, ValueError):
+        return None
+
+def _to_boolean(value):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return value.strip().lower() == "true"
+    return bool(value)
+
+def _to_timestamp(value):
+    if value is None or isinstance(value, datetime):
+        return value
+    try:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+def _to_string(value):
+    return None if value is None else str(value)
+
+CONVERTERS = {
+    "STRING": _to_string,
+    "INTEGER": _to_integer,
+    "INT64": _to_integer,
+    "FLOAT": _to_float,
+    "FLOAT64": _to_float,
+    "BOOLEAN": _to_boolean,
+    "BOOL": _to_boolean,
+    "TIMESTAMP": _to_timestamp,
+}
+
+def arrow_schema(fields):
+    import pyarrow as pa
+
+    arrow_types = {
+        "STRING": pa.string(),
+        "INTEGER": pa.int64(),
+        "INT64": pa.int64(),
+        "FLOAT": pa.float64(),
+        "FLOAT64": pa.float64(),
+        "BOOLEAN": pa.bool_(),
+        "BOOL": pa.bool_(),
+        "TIMESTAMP": pa.timestamp("us", tz="UTC"),
+    }
+    return pa.schema([
+        pa.field(name, arrow_types[field_type], nullable=mode != "REQUIRED")
+        for name, field_type, mode in fields
+    ])
+
+def to_arrow_table(rows, fields, schema=None):
+    import pyarrow as pa
+
+    schema = schema or arrow_schema(fields)
+    columns = {}
+    for name, field_type, _ in fields:
+        convert = CONVERTERS[field_type]
+        columns[name] = [convert(row.get(name)) for row in rows]
+    return pa.Table.from_pydict(columns, schema=schema)
+
+def encode_parquet(rows, fields, compression=PARQUET_COMPRESSION):
+    import pyarrow.parquet as pq
+
+    # records.VideoBatch builds its table from its own typed columns
+    table = rows.to_arrow_table() if hasattr(rows, "to_arrow_table") else to_arrow_table(rows, fields)
+    buffer = io.BytesIO()
+    pq.write_table(table, buffer, compression=compression)
+    return buffer.getvalue()
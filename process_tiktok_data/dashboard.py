@@ -0,0 +1,163 @@
+import os
+
+import schemas
+
+# Small pre-aggregated tables behind the Looker Studio charts, so a dashboard
+# refresh reads a few hundred rows instead of scanning profiles and videos:
+#
+#   dashboard_creators        one row per creator: followers per creator and
+#                             the follower vs like scatter
+#   dashboard_verified_share  creators and followers, verified vs not
+#   dashboard_top_videos      the DASHBOARD_TOP_VIDEOS most viewed videos
+#
+# Each batch flush updates them from its own staging tables, which only hold
+# the rows change detection let through, right after the batch's MERGE.
+# Creators use the same scrape_timestamp guard as the profiles MERGE, so
+# batches flushed out of order still converge. The verified share is
+# refreshed from dashboard_creators (already one row per creator) rather than
+# adjusted by deltas, which would drift whenever two flushes overlap.
+#
+# Top videos only see the videos of the batch: a top video whose views drop
+# keeps its place until the reconciliation rebuilds the tables from the raw
+# tables in full. Nothing here talks to BigQuery; these are the statements,
+# and batch_loader runs them. DASHBOARD_TABLES=off stops the per-batch
+# updates; the reconciliation still builds the tables.
+
+DASHBOARD_TABLES = os.environ.get("DASHBOARD_TABLES", "incremental")
+DASHBOARD_TOP_VIDEOS = int(os.environ.get("DASHBOARD_TOP_VIDEOS", "100"))
+
+CREATOR_FIELDS = schemas.DASHBOARD_CREATOR_FIELDS
+VERIFIED_SHARE_FIELDS = schemas.DASHBOARD_VERIFIED_SHARE_FIELDS
+TOP_VIDEO_FIELDS = schemas.DASHBOARD_TOP_VIDEO_FIELDS
+TABLE_FIELDS = {"creators": CREATOR_FIELDS, "verified_share": VERIFIED_SHARE_FIELDS, "top_videos": TOP_VIDEO_FIELDS}
+
+def enabled():
+    return DASHBOARD_TABLES != "off"
+
+def table_ids(dataset_id):
+    return {
+        "creators": f"{dataset_id}.dashboard_creators",
+        "verified_share": f"{dataset_id}.dashboard_verified_share",
+        "top_videos": f"{dataset_id}.dashboard_top_videos",
+    }
+
+# --- Query Builder ---
+# A MERGE keyed on `key` over the columns of `fields`. matched is "newer"
+# (only a later scrape_timestamp overwrites), "changed" (only rows that
+# differ, so affected rows count corrections) or None (always). Matched rows
+# meeting delete_when are deleted instead, and with delete_missing so are
+# target rows the source no longer has.
+def merge_query(fields, key, source, matched=None, delete_when=None, delete_missing=False):
+    columns = [name for name, _, _ in fields]
+    values = [column for column in columns if column != key]
+    if matched == "newer":
+        condition = " AND (target.scrape_timestamp IS NULL OR source.scrape_timestamp >= target.scrape_timestamp)"
+    elif matched == "changed":
+        condition = " AND (\n    " + "\n    OR ".join(
+            f"target.{column} IS DISTINCT FROM source.{column}" for column in values
+        ) + "\n)"
+    else:
+        condition = ""
+    query = (
+        f"MERGE INTO `{{target}}` AS target\n"
+        f"USING {source} AS source\n"
+        f"ON target.{key} = source.{key}\n"
+    )
+    if delete_when:
+        query += f"WHEN MATCHED AND {delete_when} THEN\n    DELETE\n"
+    query += (
+        f"WHEN MATCHED{condition} THEN\n"
+        f"    UPDATE SET\n        " + ",\n        ".join(f"{column} = source.{column}" for column in values) + "\n"
+        f"WHEN NOT MATCHED THEN\n"
+        f"    INSERT ({', '.join(columns)})\n"
+        f"    VALUES ({', '.join(f'source.{column}' for column in columns)})\n"
+    )
+    if delete_missing:
+        query += "WHEN NOT MATCHED BY SOURCE THEN\n    DELETE\n"
+    return query
+
+def _columns(fields):
+    return ", ".join(name for name, _, _ in fields)
+
+# --- Statements ---
+# NULL is_verified counts as not verified, and both rows are always written,
+# so a side that loses its last creator drops to 0 instead of going stale
+VERIFIED_SHARE_SOURCE = """(
+    SELECT
+        flags.is_verified,
+        COUNT(creators.username) AS creators,
+        COALESCE(SUM(creators.follower_count), 0) AS follower_count
+    FROM (SELECT TRUE AS is_verified UNION ALL SELECT FALSE) AS flags
+    LEFT JOIN `{creators}` AS creators
+    ON COALESCE(creators.is_verified, FALSE) = flags.is_verified
+    GROUP BY flags.is_verified
+)"""
+
+# The batch's most viewed videos, plus any of its videos already listed so
+# their counts are refreshed (or the video dropped, once it has no views)
+BATCH_TOP_VIDEOS_SOURCE = f"""(
+    SELECT {_columns(TOP_VIDEO_FIELDS)}
+    FROM (
+        SELECT *, ROW_NUMBER() OVER (ORDER BY views DESC, url) AS batch_rank
+        FROM `{{source}}`
+    )
+    WHERE (views IS NOT NULL AND batch_rank <= {{limit}}) OR url IN (SELECT url FROM `{{target}}`)
+)"""
+
+ALL_TOP_VIDEOS_SOURCE = f"""(
+    SELECT {_columns(TOP_VIDEO_FIELDS)}
+    FROM (
+        SELECT *, ROW_NUMBER() OVER (ORDER BY views DESC, url) AS view_rank
+        FROM `{{videos}}`
+        WHERE views IS NOT NULL
+    )
+    WHERE view_rank <= {{limit}}
+)"""
+
+TRIM_TOP_VIDEOS_QUERY = """
+DELETE FROM `{target}`
+WHERE url IN (
+    SELECT url
+    FROM (
+        SELECT url, ROW_NUMBER() OVER (ORDER BY views DESC, url) AS view_rank
+        FROM `{target}`
+    )
+    WHERE view_rank > {limit}
+)
+"""
+
+MERGE_CREATORS_QUERY = merge_query(CREATOR_FIELDS, "username", "`{source}`", matched="newer")
+REFRESH_VERIFIED_SHARE_QUERY = merge_query(VERIFIED_SHARE_FIELDS, "is_verified", VERIFIED_SHARE_SOURCE, matched="changed")
+MERGE_TOP_VIDEOS_QUERY = merge_query(TOP_VIDEO_FIELDS, "url", BATCH_TOP_VIDEOS_SOURCE, delete_when="source.views IS NULL")
+
+RECONCILE_CREATORS_QUERY = merge_query(
+    CREATOR_FIELDS, "username", f"(SELECT {_columns(CREATOR_FIELDS)} FROM `{{profiles}}`)",
+    matched="changed", delete_missing=True
+)
+RECONCILE_TOP_VIDEOS_QUERY = merge_query(TOP_VIDEO_FIELDS, "url", ALL_TOP_VIDEOS_SOURCE, matched="changed", delete_missing=True)
+
+# Each returns (table, statement) pairs, to be run in order.
+# source is the batch's staging table for profiles, or for videos or video
+# snapshots (whichever the batch loads)
+def profile_updates(tables, source):
+    return [
+        ("creators", MERGE_CREATORS_QUERY.format(target=tables["creators"], source=source)),
+        ("verified_share", REFRESH_VERIFIED_SHARE_QUERY.format(target=tables["verified_share"], creators=tables["creators"])),
+    ]
+
+def video_updates(tables, source, limit=None):
+    limit = DASHBOARD_TOP_VIDEOS if limit is None else limit
+    return [
+        ("top_videos", MERGE_TOP_VIDEOS_QUERY.format(target=tables["top_videos"], source=source, limit=limit)),
+        ("top_videos", TRIM_TOP_VIDEOS_QUERY.format(target=tables["top_videos"], limit=limit)),
+    ]
+
+# Full rebuild from the raw tables; videos is the videos table, or the
+# videos_current view when video counts are kept as snapshots
+def reconcile_statements(tables, profiles, videos, limit=None):
+    limit = DASHBOARD_TOP_VIDEOS if limit is None else limit
+    return [
+        ("creators", RECONCILE_CREATORS_QUERY.format(target=tables["creators"], profiles=profiles)),
+        ("verified_share", REFRESH_VERIFIED_SHARE_QUERY.format(target=tables["verified_share"], creators=tables["creators"])),
+        ("top_videos", RECONCILE_TOP_VIDEOS_QUERY.format(target=tables["top_videos"], videos=videos, limit=limit)),
+    ]
@@ -0,0 +1,166 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+from google.api_core.exceptions import NotFound, PreconditionFailed
+
+logger = logging.getLogger(__name__)
+
+# Change detection for processed records. Every profile and video record is
+# hashed and compared with the digests stored for that username, so only new
+# or changed rows go on to the load stage and fully unchanged rescrapes stop
+# before any GCS upload or BigQuery work.
+#
+# A digest index per username looks like
+#   {"profile": "<sha256>", "videos": {"<video url>": "<sha256>", ...}}
+# and is stored by a DigestStore: GcsDigestStore in the cloud,
+# SqliteDigestStore for local runs and tests.
+
+DIGEST_STORE = os.environ.get("DIGEST_STORE", "gcs")
+DIGEST_PREFIX = "digests/"
+
+# Fields that change on every scrape without the record itself changing
+VOLATILE_FIELDS = ("scrape_timestamp",)
+# Signed CDN URLs, whose x-expires/x-signature query changes on every fetch;
+# only the part before the query is hashed. An unchanged record therefore
+# keeps the signed URL it was last loaded with.
+SIGNED_URL_FIELDS = ("thumbnail", "profile_pic_url")
+
+# --- Record Digests ---
+def strip_query(value):
+    return value.split("?", 1)[0] if isinstance(value, str) else value
+
+def record_digest(record):
+    normalised = {
+        key: strip_query(value) if key in SIGNED_URL_FIELDS else value
+        for key, value in record.items() if key not in VOLATILE_FIELDS
+    }
+    encoded = json.dumps(normalised, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+def _empty_index():
+    return {"profile": None, "videos": {}}
+
+# --- Digest Stores ---
+# load() returns the index and an opaque version; save() only succeeds if the
+# stored index is still at that version, and returns False otherwise.
+class GcsDigestStore:
+    def __init__(self, storage_client, bucket_name, prefix=DIGEST_PREFIX):
+        self.bucket = storage_client.bucket(bucket_name)
+        self.prefix = prefix
+
+    def load(self, username):
+        blob = self.bucket.blob(f"{self.prefix}{username}.json")
+        try:
+            payload = blob.download_as_bytes()
+        except NotFound:
+            return _empty_index(), 0
+        return json.loads(payload), blob.generation
+
+    def save(self, username, index, version):
+        blob = self.bucket.blob(f"{self.prefix}{username}.json")
+        try:
+            blob.upload_from_string(json.dumps(index), content_type="application/json", if_generation_match=version)
+        except PreconditionFailed:
+            return False
+        return True
+
+
+class SqliteDigestStore:
+    def __init__(self, path=":memory:"):
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS digests (username TEXT PRIMARY KEY, payload TEXT NOT NULL, version INTEGER NOT NULL)"
+        )
+
+    def load(self, username):
+        with self._lock:
+            row = self._conn.execute("SELECT payload, version FROM digests WHERE username = ?", (username,)).fetchone()
+        if row is None:
+            return _empty_index(), 0
+        return json.loads(row[0]), row[1]
+
+    def save(self, username, index, version):
+        payload = json.dumps(index)
+        with self._lock:
+            if version == 0:
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO digests (username, payload, version) VALUES (?, ?, 1)", (username, payload)
+                )
+            else:
+                cursor = self._conn.execute(
+                    "UPDATE digests SET payload = ?, version = version + 1 WHERE username = ? AND version = ?",
+                    (payload, username, version),
+                )
+        return cursor.rowcount == 1
+
+
+_stores = {}
+
+def digest_store_from_env(storage_client, bucket_name):
+    if DIGEST_STORE == "none":
+        return None
+    store = _stores.get(DIGEST_STORE)
+    if store is None:
+        if DIGEST_STORE == "gcs":
+            store = GcsDigestStore(storage_client, bucket_name)
+        elif DIGEST_STORE.startswith("sqlite:///"):
+            store = SqliteDigestStore(DIGEST_STORE[len("sqlite:///"):])
+        else:
+            raise ValueError(f"Unknown DIGEST_STORE: {DIGEST_STORE}")
+        _stores[DIGEST_STORE] = store
+    return store
+
+# --- Detect Changes ---
+class ChangeSet:
+    def __init__(self, username, profile_data, changed_videos, index, version, profile_digest, video_digests, unchanged_videos):
+        self.username = username
+        # None when the profile is unchanged
+        self.profile_data = profile_data
+        self.changed_videos = changed_videos
+        self.unchanged_videos = unchanged_videos
+        self._index = index
+        self._version = version
+        self._profile_digest = profile_digest
+        self._video_digests = video_digests
+
+    @property
+    def unchanged(self):
+        return self.profile_data is None and not self.changed_videos
+
+    def _apply(self, index):
+        index["profile"] = self._profile_digest
+        index.setdefault("videos", {}).update(self._video_digests)
+        return index
+
+    # Called once the changed rows are safely staged for loading
+    def commit(self, store):
+        if self.unchanged:
+            return
+        if store.save(self.username, self._apply(self._index), self._version):
+            return
+        # Another invocation updated this username meanwhile: reapply ours on top
+        index, version = store.load(self.username)
+        if not store.save(self.username, self._apply(index), version):
+            logger.warning(f"Digest index for {self.username} changed concurrently; it will be refreshed on the next scrape.")
+
+def detect_changes(store, username, profile_data, videos_data):
+    index, version = store.load(username)
+    profile_digest = record_digest(profile_data)
+    changed_profile = profile_data if index.get("profile") != profile_digest else None
+
+    # videos_data is a records.VideoBatch; its digests equal record_digest of each row
+    known_videos = index.get("videos") or {}
+    changed_rows = []
+    video_digests = {}
+    for row, (url, digest) in enumerate(zip(videos_data.columns["url"], videos_data.digests())):
+        if known_videos.get(url) != digest:
+            changed_rows.append(row)
+            video_digests[url] = digest
+    changed_videos = videos_data.take(changed_rows)
+    unchanged_videos = len(videos_data) - len(changed_videos)
+    return ChangeSet(username, changed_profile, changed_videos, index, version, profile_digest, video_digests, unchanged_videos)
@@ -0,0 +1,266 @@
+import logging
+import os
+import re
+
+import records
+
+logger = logging.getLogger(__name__)
+
+# Single-pass HTML fallback. The original extractors in main.py walk the
+# BeautifulSoup tree once per find()/find_all() call, several times per video
+# container, and compile the class patterns on every call. Here the document
+# is walked once: every data-e2e node and tiktok-* class node the fallback
+# reads is recorded against the container (or stats block) it sits in, and
+# the records are built from that index afterwards. The output matches
+# extract_profile_data_from_html / extract_video_data_from_html, except that
+# abbreviated counts ("1.2M") are read as numbers instead of digit strings.
+#
+# HTML_PARSER picks the tree builder: "lxml" is much faster and is used when
+# installed ("auto", the default); "html.parser" needs nothing beyond bs4.
+
+HTML_PARSER = os.environ.get("HTML_PARSER", "auto")
+
+# The same patterns the original extractors match classes against
+VIDEO_FEED_CLASS = re.compile("tiktok-.*-DivVideoFeed")
+DESC_CLASS = re.compile("tiktok-.*-desc")
+STATS_CLASS = re.compile("tiktok-.*-stats")
+
+COUNT_PATTERN = re.compile(r"(\d+(?:[.,]\d+)?)\s*([KMB])\b", re.IGNORECASE)
+NON_DIGITS = re.compile(r"[^\d]")
+COUNT_MULTIPLIERS = {"K": 1_000, "M": 1_000_000, "B": 1_000_000_000}
+
+# Only these tags matter to the fallback, so the lxml walk skips the rest
+INDEXED_TAGS = ("a", "div", "h1", "h2", "img", "strong", "svg")
+
+# --- Count Parsing ---
+# "1.2M" -> 1200000, "15.3K" -> 15300, "1,234" -> 1234; anything without digits is 0
+def parse_count(text):
+    if not text:
+        return 0
+    match = COUNT_PATTERN.search(text)
+    if match:
+        return int(round(float(match.group(1).replace(",", ".")) * COUNT_MULTIPLIERS[match.group(2).upper()]))
+    digits = NON_DIGITS.sub("", text)
+    return int(digits) if digits else 0
+
+# --- Tree Backends ---
+def resolve_parser(parser=None):
+    parser = parser or HTML_PARSER
+    if parser != "auto":
+        return parser
+    try:
+        import lxml.html  # noqa: F401
+    except ImportError:
+        return "html.parser"
+    return "lxml"
+
+def _walk_lxml(html_content):
+    import lxml.etree
+    import lxml.html
+
+    if isinstance(html_content, str):
+        html_content = html_content.encode("utf-8")
+    root = lxml.html.document_fromstring(html_content, parser=lxml.html.HTMLParser(encoding="utf-8"))
+    for event, element in lxml.etree.iterwalk(root, events=("start", "end"), tag=INDEXED_TAGS):
+        yield event, element, element.tag
+
+def _walk_soup(html_content):
+    from bs4 import BeautifulSoup, Tag
+
+    if isinstance(html_content, (bytes, bytearray)):
+        html_content = html_content.decode("utf-8")
+    soup = html_content if isinstance(html_content, BeautifulSoup) else BeautifulSoup(html_content, "html.parser")
+    # Iterative depth-first walk with end events, so deep pages cannot hit the recursion limit
+    levels = [iter(soup.contents)]
+    open_tags = []
+    while levels:
+        for child in levels[-1]:
+            if isinstance(child, Tag):
+                yield "start", child, child.name
+                levels.append(iter(child.contents))
+                open_tags.append(child)
+                break
+        else:
+            levels.pop()
+            if len(levels) == len(open_tags) and open_tags:
+                element = open_tags.pop()
+                yield "end", element, element.name
+
+def _class_string(element):
+    value = element.get("class")
+    if not value:
+        return None
+    # bs4 splits class into a list; lxml keeps the raw attribute
+    return " ".join(value) if isinstance(value, list) else " ".join(value.split())
+
+# hasattr() cannot tell the backends apart the other way round: bs4 treats unknown attributes as find()
+def _text(element):
+    return element.get_text() if hasattr(element, "get_text") else element.text_content()
+
+# --- Single-Pass Index ---
+# A video container, or the stats block inside one, still open during the walk
+class _Scope:
+    __slots__ = ("element", "is_container", "first", "stats")
+
+    def __init__(self, element, is_container):
+        self.element = element
+        self.is_container = is_container
+        self.first = {}
+        self.stats = None
+
+
+class IndexedPage:
+    def __init__(self):
+        self.first = {}
+        self.user_stats = []
+        self.containers = []
+        self.feed_containers = []
+
+    def profile_data(self):
+        values = {}
+        first = self.first
+        try:
+            username_tag = first.get(("h2", "user-subtitle"))
+            values["username"] = _text(username_tag).strip() if username_tag is not None else None
+
+            name_tag = first.get(("h1", "user-title"))
+            values["actual_name"] = _text(name_tag).strip() if name_tag is not None else None
+
+            stats = self.user_stats
+            values["following_count"] = parse_count(_text(stats[0])) if len(stats) > 0 else None
+            values["follower_count"] = parse_count(_text(stats[1])) if len(stats) > 1 else None
+            values["total_like_count"] = parse_count(_text(stats[2])) if len(stats) > 2 else None
+
+            bio_tag = first.get(("h2", "user-bio"))
+            values["bio"] = _text(bio_tag).strip() if bio_tag is not None else None
+            values["caption"] = values["bio"]
+
+            link_tag = first.get(("a", "user-link"))
+            values["bio_link"] = _attribute(link_tag, "href") if link_tag is not None else None
+
+            pic_tag = first.get(("img", "user-avatar"))
+            values["profile_pic_url"] = _attribute(pic_tag, "src") if pic_tag is not None else None
+
+            values["is_verified"] = ("svg", "verify-badge") in first
+
+            logger.info("Extracted profile data from HTML successfully.")
+        except Exception as e:
+            logger.error(f"Error extracting profile data from HTML: {e}")
+        return records.profile_record(values)
+
+    def videos_data(self, username):
+        videos_data = records.VideoBatch(username)
+        containers = self.containers
+        if not containers:
+            logger.info("No user-post-item found, trying alternative selector.")
+            containers = self.feed_containers
+
+        for container in containers:
+            try:
+                first = container.first
+                a_tag = first.get("a")
+                url = _attribute(a_tag, "href") if a_tag is not None else None
+                if not url:
+                    logger.warning("Skipping video with missing URL")
+                    continue
+
+                views_tag = first.get("video-views")
+                views = parse_count(_text(views_tag)) if views_tag is not None else None
+
+                img_tag = first.get("img")
+                thumbnail = _attribute(img_tag, "src") if img_tag is not None else None
+
+                desc_container = first.get("desc")
+                description = _text(desc_container).strip() if desc_container is not None else None
+
+                like_count = None
+                comment_count = None
+                share_count = None
+                if container.stats is not None:
+                    stats = container.stats.first
+                    like_count = parse_count(_text(stats["like-count"])) if "like-count" in stats else None
+                    comment_count = parse_count(_text(stats["comment-count"])) if "comment-count" in stats else None
+                    share_count = parse_count(_text(stats["share-count"])) if "share-count" in stats else None
+
+                videos_data.append({
+                    "url": url,
+                    "views": views,
+                    "thumbnail": thumbnail,
+                    "description": description,
+                    "like_count": like_count,
+                    "comment_count": comment_count,
+                    "share_count": share_count
+                })
+            except Exception as e:
+                logger.error(f"Error parsing video container: {e}")
+                continue
+        logger.info(f"Extracted {len(videos_data)} videos from HTML.")
+        return videos_data
+
+# Missing attributes raise KeyError like tag["href"] does, which skips the record
+def _attribute(element, name):
+    value = element.get(name)
+    if value is None:
+        raise KeyError(name)
+    return value
+
+def _record_in_container(scope, element, tag, e2e, classes):
+    first = scope.first
+    if tag == "a" or tag == "img":
+        if tag not in first:
+            first[tag] = element
+    elif tag == "strong":
+        if e2e == "video-views" and "video-views" not in first:
+            first["video-views"] = element
+    elif tag == "div" and classes:
+        if "desc" not in first and DESC_CLASS.search(classes):
+            first["desc"] = element
+        if scope.stats is None and STATS_CLASS.search(classes):
+            scope.stats = _Scope(element, False)
+            return scope.stats
+    return None
+
+def index_page(html_content, parser=None):
+    parser = resolve_parser(parser)
+    walk = _walk_lxml(html_content) if parser == "lxml" else _walk_soup(html_content)
+
+    page = IndexedPage()
+    page_first = page.first
+    # Open containers and stats blocks, innermost last
+    scopes = []
+    for event, element, tag in walk:
+        if event == "end":
+            while scopes and scopes[-1].element is element:
+                scopes.pop()
+            continue
+        e2e = element.get("data-e2e")
+        classes = _class_string(element) if tag == "div" else None
+
+        if e2e is not None:
+            key = (tag, e2e)
+            if key not in page_first:
+                page_first[key] = element
+            if tag == "strong" and e2e == "user-stats":
+                page.user_stats.append(element)
+
+        # Like find() on each container, a node only counts for the scopes it is inside
+        opened = []
+        for scope in scopes:
+            if scope.is_container:
+                stats_scope = _record_in_container(scope, element, tag, e2e, classes)
+                if stats_scope is not None:
+                    opened.append(stats_scope)
+            elif tag == "strong" and e2e in ("like-count", "comment-count", "share-count") and e2e not in scope.first:
+                scope.first[e2e] = element
+
+        if tag == "div":
+            if e2e == "user-post-item":
+                container = _Scope(element, True)
+                page.containers.append(container)
+                opened.append(container)
+            if classes and VIDEO_FEED_CLASS.search(classes):
+                container = _Scope(element, True)
+                page.feed_containers.append(container)
+                opened.append(container)
+        scopes.extend(opened)
+    return page
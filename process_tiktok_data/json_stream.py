@@ -0,0 +1,194 @@
+import codecs
+import json
+import re
+
+# Incremental reader for the rehydration JSON of very large profile pages.
+# json.loads() needs the whole payload plus the decoded dict in memory at
+# once; here the payload is consumed chunk by chunk, only the parts the
+# extractors use are decoded, and the post lists are handed out one post at a
+# time. Values the pipeline never reads are skipped without being decoded, so
+# memory is bounded by the chunk size and the largest single value kept,
+# not by the number of posts.
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_STRING = re.compile(r'"(?:[^"\\]|\\.)*"', re.DOTALL)
+_SCALAR = re.compile(r"-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?|true|false|null")
+_SCALAR_END = re.compile(r"[,\]}\s]")
+# Inside a container: a complete string, a bracket, or the opening quote of a string cut off by the chunk end
+_CONTAINER_TOKEN = re.compile(r'"(?:[^"\\]|\\.)*"|[\[\]{}]|"', re.DOTALL)
+
+_DECODER = json.JSONDecoder()
+
+# Keys under webapp.user-detail holding post lists, in the extractors' order of preference
+POST_LIST_KEYS = ("posts", "itemList", "ItemList")
+
+
+class JsonStream:
+    def __init__(self, stream, chunk_size, prefix=b""):
+        self._stream = stream
+        self._chunk_size = chunk_size
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = self._decoder.decode(prefix)
+        self._pos = 0
+        self._eof = False
+
+    # --- Buffering ---
+    def _fill(self):
+        if self._eof:
+            return False
+        chunk = self._stream.read(self._chunk_size)
+        if not chunk:
+            self._eof = True
+            self._buffer += self._decoder.decode(b"", final=True)
+            return False
+        self._buffer += self._decoder.decode(chunk)
+        return True
+
+    # Drops what has been consumed; only called between values, when no positions are held
+    def _compact(self):
+        if self._pos >= self._chunk_size:
+            self._buffer = self._buffer[self._pos:]
+            self._pos = 0
+
+    def _need_more(self):
+        if not self._fill():
+            raise ValueError("Unexpected end of JSON payload")
+
+    # --- Tokens ---
+    def peek(self):
+        while True:
+            self._pos = _WHITESPACE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            self._need_more()
+
+    def _expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Expected {char!r} at offset {self._pos} of the JSON buffer")
+        self._pos += 1
+
+    def _value_end(self):
+        first = self.peek()
+        start = self._pos
+        if first == '"':
+            while True:
+                match = _STRING.match(self._buffer, start)
+                if match:
+                    return match.end()
+                self._need_more()
+        if first not in "{[":
+            # A number or literal running into the end of the buffer may continue in the next chunk
+            while _SCALAR_END.search(self._buffer, start) is None and self._fill():
+                pass
+            match = _SCALAR.match(self._buffer, start)
+            if match is None:
+                raise ValueError(f"Invalid JSON value at offset {start} of the JSON buffer")
+            return match.end()
+
+        # Containers are scanned for their closing bracket, resuming where the last chunk ended
+        depth = 0
+        scan = start
+        while True:
+            match = _CONTAINER_TOKEN.search(self._buffer, scan)
+            if match is None:
+                scan = len(self._buffer)
+                self._need_more()
+                continue
+            token = match.group()
+            if token == '"':
+                # A string split across chunks: rescan it once more data is in
+                scan = match.start()
+                self._need_more()
+                continue
+            scan = match.end()
+            if token in "{[":
+                depth += 1
+            elif token in "}]":
+                depth -= 1
+                if depth == 0:
+                    return scan
+
+    # Decoded in place; a value cut off by the end of the buffer is retried with the next chunk in
+    def read_value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self._buffer, self._pos)
+            except ValueError:
+                if self._fill():
+                    continue
+                raise
+            # A number is only complete once a delimiter follows it
+            if not isinstance(value, (dict, list, str)) and not _SCALAR_END.match(self._buffer, end) and self._fill():
+                continue
+            self._pos = end
+            return value
+
+    # Skipped values are only scanned, never decoded
+    def skip_value(self):
+        self._pos = self._value_end()
+
+    # --- Containers ---
+    # Yields each key; the caller must read or skip its value before resuming
+    def iter_object(self):
+        self._expect("{")
+        if self.peek() == "}":
+            self._pos += 1
+            return
+        while True:
+            if self.peek() != '"':
+                raise ValueError(f"Expected an object key at offset {self._pos} of the JSON buffer")
+            key = self.read_value()
+            self._expect(":")
+            yield key
+            self._compact()
+            if self.peek() == ",":
+                self._pos += 1
+                continue
+            self._expect("}")
+            return
+
+    # Yields once per element; the caller must read or skip it before resuming
+    def iter_array(self):
+        self._expect("[")
+        if self.peek() == "]":
+            self._pos += 1
+            return
+        while True:
+            yield
+            self._compact()
+            if self.peek() == ",":
+                self._pos += 1
+                continue
+            self._expect("]")
+            return
+
+
+# --- Rehydration Payload Events ---
+# Yields, in document order:
+#   ("user_detail", None)           when __DEFAULT_SCOPE__ has webapp.user-detail
+#   ("user_info", user_info)        the decoded userInfo object
+#   ("post", source, post)          one post from a user-detail list or ItemModule
+# Everything else in the payload is skipped.
+def iter_rehydration_events(stream, chunk_size, prefix=b""):
+    reader = JsonStream(stream, chunk_size, prefix)
+    for key in reader.iter_object():
+        if key == "__DEFAULT_SCOPE__" and reader.peek() == "{":
+            for scope_key in reader.iter_object():
+                if scope_key != "webapp.user-detail" or reader.peek() != "{":
+                    reader.skip_value()
+                    continue
+                yield "user_detail", None
+                for detail_key in reader.iter_object():
+                    if detail_key == "userInfo":
+                        yield "user_info", reader.read_value()
+                    elif detail_key in POST_LIST_KEYS and reader.peek() == "[":
+                        for _ in reader.iter_array():
+                            yield "post", detail_key, reader.read_value()
+                    else:
+                        reader.skip_value()
+        elif key == "ItemModule" and reader.peek() == "{":
+            for _ in reader.iter_object():
+                yield "post", "ItemModule", reader.read_value()
+        else:
+            reader.skip_value()
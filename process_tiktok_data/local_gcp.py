@@ -0,0 +1,634 @@
+import io
+import itertools
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+from google.api_core.exceptions import BadRequest, Conflict, NotFound, PreconditionFailed
+
+# In-process stand-ins for the parts of google-cloud-storage and
+# google-cloud-bigquery the pipeline uses, so batching and MERGE behaviour can
+# be exercised offline. Only the call signatures the pipeline relies on are
+# implemented.
+
+# --- Local Cloud Storage ---
+# Objects live in memory, or as files under `directory` when one is given, so
+# large objects do not count towards the process's memory.
+class _StoredObject:
+    def __init__(self, data, generation, content_type, content_encoding, metadata, path=None):
+        self.data = data
+        self.path = path
+        self.size = len(data) if path is None else os.path.getsize(path)
+        self.generation = generation
+        self.content_type = content_type
+        self.content_encoding = content_encoding
+        self.metadata = dict(metadata) if metadata else None
+        self.time_created = datetime.now(timezone.utc)
+
+    def read(self):
+        if self.path is None:
+            return self.data
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def open(self):
+        return io.BytesIO(self.data) if self.path is None else open(self.path, "rb")
+
+    def discard(self):
+        if self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class LocalStorageClient:
+    def __init__(self, directory=None):
+        self._objects = {}
+        self._lock = threading.Lock()
+        self._generations = itertools.count(1)
+        self._listeners = []
+        self.directory = directory
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    # Like a bucket notification (or an Eventarc trigger): callback(event_type,
+    # data) runs for every object written ("finalized") or deleted
+    # ("deleted"), with data shaped like a GCS event's. It runs on the writing
+    # thread, so it should hand work off rather than do it.
+    def add_listener(self, callback):
+        with self._lock:
+            self._listeners.append(callback)
+
+    def _notify(self, event_type, bucket_name, name, stored):
+        with self._lock:
+            listeners = list(self._listeners)
+        if not listeners:
+            return
+        data = {
+            "bucket": bucket_name,
+            "name": name,
+            "size": str(stored.size),
+            "contentType": stored.content_type,
+            "generation": str(stored.generation),
+            "timeCreated": stored.time_created.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
+        }
+        if stored.content_encoding:
+            data["contentEncoding"] = stored.content_encoding
+        if stored.metadata:
+            data["metadata"] = dict(stored.metadata)
+        for callback in listeners:
+            callback(event_type, data)
+
+    def bucket(self, bucket_name):
+        return LocalBucket(self, bucket_name)
+
+    def list_blobs(self, bucket_or_name, prefix=None, max_results=None):
+        bucket_name = getattr(bucket_or_name, "name", bucket_or_name)
+        with self._lock:
+            names = sorted(
+                name for (bucket, name) in self._objects
+                if bucket == bucket_name and (not prefix or name.startswith(prefix))
+            )
+        if max_results is not None:
+            names = names[:max_results]
+        bucket = self.bucket(bucket_name)
+        blobs = []
+        for name in names:
+            blob = bucket.blob(name)
+            try:
+                blob.reload()
+            except NotFound:
+                continue
+            blobs.append(blob)
+        return blobs
+
+    def _get(self, bucket_name, name):
+        with self._lock:
+            stored = self._objects.get((bucket_name, name))
+        if stored is None:
+            raise NotFound(f"gs://{bucket_name}/{name}")
+        return stored
+
+    def _put(self, bucket_name, name, data, content_type, content_encoding, metadata, if_generation_match):
+        if self.directory is None:
+            return self._store(bucket_name, name, data, None, content_type, content_encoding, metadata, if_generation_match)
+        handle, path = tempfile.mkstemp(dir=self.directory, suffix=".object")
+        with os.fdopen(handle, "wb") as f:
+            f.write(data)
+        return self._store(bucket_name, name, None, path, content_type, content_encoding, metadata, if_generation_match)
+
+    # Streaming uploads: in-memory objects are buffered, on-disk ones go straight to a file
+    def _writer(self, blob, content_type, if_generation_match):
+        if self.directory is None:
+            return _LocalBlobWriter(blob, io.BytesIO(), None, content_type, if_generation_match)
+        handle, path = tempfile.mkstemp(dir=self.directory, suffix=".object")
+        return _LocalBlobWriter(blob, os.fdopen(handle, "wb"), path, content_type, if_generation_match)
+
+    def _store(self, bucket_name, name, data, path, content_type, content_encoding, metadata, if_generation_match):
+        with self._lock:
+            current = self._objects.get((bucket_name, name))
+            if if_generation_match is not None:
+                current_generation = current.generation if current else 0
+                if current_generation != if_generation_match:
+                    if path is not None:
+                        os.remove(path)
+                    raise PreconditionFailed(f"gs://{bucket_name}/{name}")
+            stored = _StoredObject(data, next(self._generations), content_type, content_encoding, metadata, path)
+            self._objects[(bucket_name, name)] = stored
+        if current is not None:
+            current.discard()
+        self._notify("finalized", bucket_name, name, stored)
+        return stored
+
+    def _delete(self, bucket_name, name, if_generation_match):
+        with self._lock:
+            current = self._objects.get((bucket_name, name))
+            if current is None:
+                raise NotFound(f"gs://{bucket_name}/{name}")
+            if if_generation_match is not None and current.generation != if_generation_match:
+                raise PreconditionFailed(f"gs://{bucket_name}/{name}")
+            del self._objects[(bucket_name, name)]
+        current.discard()
+        self._notify("deleted", bucket_name, name, current)
+
+
+class LocalBucket:
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+
+    def blob(self, blob_name):
+        return LocalBlob(self, blob_name)
+
+    def list_blobs(self, prefix=None, max_results=None):
+        return self.client.list_blobs(self.name, prefix=prefix, max_results=max_results)
+
+
+class LocalBlob:
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+        self.generation = None
+        self.content_type = None
+        self.content_encoding = None
+        self.metadata = None
+        self.time_created = None
+        self.size = None
+
+    def _load(self, stored):
+        self.generation = stored.generation
+        self.content_type = stored.content_type
+        self.content_encoding = stored.content_encoding
+        self.metadata = dict(stored.metadata) if stored.metadata else None
+        self.time_created = stored.time_created
+        self.size = stored.size
+
+    def reload(self):
+        self._load(self.bucket.client._get(self.bucket.name, self.name))
+
+    def exists(self):
+        try:
+            self.reload()
+        except NotFound:
+            return False
+        return True
+
+    def upload_from_string(self, data, content_type=None, if_generation_match=None):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        stored = self.bucket.client._put(
+            self.bucket.name, self.name, bytes(data), content_type or "application/octet-stream",
+            self.content_encoding, self.metadata, if_generation_match,
+        )
+        self._load(stored)
+
+    def upload_from_file(self, file_obj, content_type=None, if_generation_match=None):
+        self.upload_from_string(file_obj.read(), content_type=content_type, if_generation_match=if_generation_match)
+
+    def download_as_bytes(self):
+        stored = self.bucket.client._get(self.bucket.name, self.name)
+        self._load(stored)
+        return stored.read()
+
+    def open(self, mode="rb", chunk_size=None, content_type=None, if_generation_match=None, **kwargs):
+        if mode in ("r", "rt"):
+            return io.TextIOWrapper(self.open("rb"), encoding="utf-8")
+        if mode == "rb":
+            stored = self.bucket.client._get(self.bucket.name, self.name)
+            self._load(stored)
+            return stored.open()
+        if mode in ("w", "wt"):
+            return io.TextIOWrapper(self.open("wb", content_type=content_type, if_generation_match=if_generation_match), encoding="utf-8")
+        if mode == "wb":
+            return self.bucket.client._writer(self, content_type, if_generation_match)
+        raise ValueError(f"Unsupported LocalBlob mode: {mode}")
+
+    def download_as_text(self, encoding="utf-8"):
+        return self.download_as_bytes().decode(encoding)
+
+    def delete(self, if_generation_match=None):
+        self.bucket.client._delete(self.bucket.name, self.name, if_generation_match)
+
+
+class _LocalBlobWriter(io.RawIOBase):
+    def __init__(self, blob, target, path, content_type, if_generation_match):
+        self._blob = blob
+        self._target = target
+        self._path = path
+        self._content_type = content_type or "application/octet-stream"
+        self._if_generation_match = if_generation_match
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        return self._target.write(data)
+
+    # The object only appears once the writer is closed, like a resumable upload
+    def close(self):
+        if self.closed:
+            return
+        super().close()
+        blob = self._blob
+        client = blob.bucket.client
+        if self._path is None:
+            data = self._target.getvalue()
+        else:
+            self._target.close()
+            data = None
+        stored = client._store(
+            blob.bucket.name, blob.name, data, self._path, self._content_type,
+            blob.content_encoding, blob.metadata, self._if_generation_match,
+        )
+        blob._load(stored)
+
+
+# --- Local BigQuery ---
+_SQLITE_TYPES = {
+    "STRING": "TEXT",
+    "INTEGER": "INTEGER",
+    "INT64": "INTEGER",
+    "FLOAT": "REAL",
+    "FLOAT64": "REAL",
+    "NUMERIC": "REAL",
+    "BOOLEAN": "INTEGER",
+    "BOOL": "INTEGER",
+    "TIMESTAMP": "TEXT",
+    "DATE": "TEXT",
+    "DATETIME": "TEXT",
+}
+
+_BACKTICK_ID = re.compile(r"`([^`]+)`")
+_MERGE_HEAD = re.compile(r"^\s*MERGE\s+(?:INTO\s+)?(\S+)\s+(?:AS\s+)?(\w+)\s+USING\s+", re.IGNORECASE | re.DOTALL)
+_MERGE_ALIAS_ON = re.compile(r"\s*(?:AS\s+)?(\w+)\s+ON\s+", re.IGNORECASE)
+_MERGE_WHEN = re.compile(
+    r"\bWHEN\s+(NOT\s+MATCHED\s+BY\s+SOURCE|NOT\s+MATCHED(?:\s+BY\s+TARGET)?|MATCHED)\b(.*?)\bTHEN\b", re.IGNORECASE | re.DOTALL
+)
+_MERGE_UPDATE = re.compile(r"^\s*UPDATE\s+SET\s+(.*)$", re.IGNORECASE | re.DOTALL)
+_MERGE_INSERT = re.compile(r"^\s*INSERT\s*\((.*?)\)\s*VALUES\s*\((.*)\)\s*;?\s*$", re.IGNORECASE | re.DOTALL)
+_MERGE_DELETE = re.compile(r"^\s*DELETE\s*;?\s*$", re.IGNORECASE)
+
+
+def _table_id(table):
+    if isinstance(table, str):
+        return table
+    return f"{table.project}.{table.dataset_id}.{table.table_id}"
+
+
+def _sqlite_name(table_id):
+    parts = table_id.split(".")
+    return "__".join(parts[-2:])
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _matching_paren(sql, start):
+    depth = 0
+    for index in range(start, len(sql)):
+        if sql[index] == "(":
+            depth += 1
+        elif sql[index] == ")":
+            depth -= 1
+            if depth == 0:
+                return index
+    raise BadRequest("Unbalanced parentheses in MERGE source")
+
+
+class LocalRow(dict):
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+# The work is done when the job is submitted; `latency` only delays when it
+# reports DONE, so concurrent job handling can be exercised.
+class LocalJob:
+    def __init__(self, job_type, rows=None, num_dml_affected_rows=None, output_rows=None, latency=0.0):
+        self.job_id = f"local_{job_type}_{uuid.uuid4().hex[:12]}"
+        self.job_type = job_type
+        self.error_result = None
+        self.num_dml_affected_rows = num_dml_affected_rows
+        self.output_rows = output_rows
+        self._rows = rows or []
+        self._done_at = time.monotonic() + latency
+
+    @property
+    def state(self):
+        return "DONE" if self.done() else "RUNNING"
+
+    def done(self, *args, **kwargs):
+        return time.monotonic() >= self._done_at
+
+    def result(self, *args, **kwargs):
+        remaining = self._done_at - time.monotonic()
+        if remaining > 0:
+            time.sleep(remaining)
+        return list(self._rows)
+
+
+# job_latency_seconds and api_latency_seconds stand in for BigQuery job run
+# time and API round trips; both default to 0.
+class LocalBigQueryClient:
+    def __init__(self, storage_client=None, database=":memory:", project="local-project",
+                 job_latency_seconds=0.0, api_latency_seconds=0.0):
+        self.project = project
+        self.storage_client = storage_client
+        self.job_latency_seconds = job_latency_seconds
+        self.api_latency_seconds = api_latency_seconds
+        self._conn = sqlite3.connect(database, check_same_thread=False, isolation_level=None)
+        self._lock = threading.RLock()
+        self._schemas = {}
+        self._views = set()
+        self.jobs = []
+
+    def _round_trip(self):
+        if self.api_latency_seconds:
+            time.sleep(self.api_latency_seconds)
+
+    # Tables
+    def create_table(self, table, exists_ok=False):
+        self._round_trip()
+        table_id = _table_id(table)
+        name = _sqlite_name(table_id)
+        with self._lock:
+            if name in self._schemas:
+                if exists_ok:
+                    return table
+                raise Conflict(f"Already Exists: Table {table_id}")
+            view_query = getattr(table, "view_query", None)
+            if view_query:
+                self._create_view(name, view_query)
+            else:
+                self._create(name, table.schema)
+            self.jobs.append(("create_table", table_id))
+        return table
+
+    def get_table(self, table):
+        self._round_trip()
+        table_id = _table_id(table)
+        if _sqlite_name(table_id) not in self._schemas:
+            raise NotFound(f"Not found: Table {table_id}")
+        return table_id
+
+    def delete_table(self, table, not_found_ok=False):
+        self._round_trip()
+        table_id = _table_id(table)
+        name = _sqlite_name(table_id)
+        with self._lock:
+            if name not in self._schemas:
+                if not_found_ok:
+                    return
+                raise NotFound(f"Not found: Table {table_id}")
+            kind = "VIEW" if name in self._views else "TABLE"
+            self._conn.execute(f"DROP {kind} {_quote(name)}")
+            del self._schemas[name]
+            self._views.discard(name)
+            self.jobs.append(("delete_table", table_id))
+
+    def _create(self, name, schema):
+        columns = [(field.name, field.field_type.upper()) for field in schema]
+        ddl = ", ".join(f"{_quote(column)} {_SQLITE_TYPES.get(field_type, 'TEXT')}" for column, field_type in columns)
+        self._conn.execute(f"CREATE TABLE IF NOT EXISTS {_quote(name)} ({ddl})")
+        self._schemas[name] = columns
+
+    # Partitioning and clustering only matter to BigQuery's cost, so a view is all that is kept
+    def _create_view(self, name, view_query):
+        sql = _BACKTICK_ID.sub(lambda match: _quote(_sqlite_name(match.group(1))), view_query)
+        self._conn.execute(f"CREATE VIEW {_quote(name)} AS {sql}")
+        cursor = self._conn.execute(f"SELECT * FROM {_quote(name)} LIMIT 0")
+        self._schemas[name] = [(column[0], "VIEW") for column in cursor.description]
+        self._views.add(name)
+
+    # Loads
+    def load_table_from_uri(self, source_uris, destination, job_config=None):
+        if isinstance(source_uris, str):
+            source_uris = [source_uris]
+        payloads = []
+        for uri in source_uris:
+            bucket_name, _, blob_name = uri[len("gs://"):].partition("/")
+            payloads.append(self.storage_client.bucket(bucket_name).blob(blob_name).download_as_bytes())
+        return self._load(payloads, destination, job_config)
+
+    def load_table_from_file(self, file_obj, destination, job_config=None, **kwargs):
+        return self._load([file_obj.read()], destination, job_config)
+
+    def _load(self, payloads, destination, job_config):
+        self._round_trip()
+        table_id = _table_id(destination)
+        name = _sqlite_name(table_id)
+        rows = []
+        source_format = getattr(job_config, "source_format", None) or "NEWLINE_DELIMITED_JSON"
+        for payload in payloads:
+            if source_format == "PARQUET":
+                import pyarrow.parquet as pq
+
+                rows.extend(pq.read_table(io.BytesIO(payload)).to_pylist())
+                continue
+            if isinstance(payload, bytes):
+                payload = payload.decode("utf-8")
+            rows.extend(json.loads(line) for line in payload.splitlines() if line.strip())
+        with self._lock:
+            if name not in self._schemas:
+                if job_config is None or not job_config.schema:
+                    raise NotFound(f"Not found: Table {table_id}")
+                self._create(name, job_config.schema)
+            if job_config is not None and job_config.write_disposition == "WRITE_TRUNCATE":
+                self._conn.execute(f"DELETE FROM {_quote(name)}")
+            self._insert(name, rows)
+            self.jobs.append(("load", table_id))
+        return LocalJob("load", output_rows=len(rows), latency=self.job_latency_seconds)
+
+    def _insert(self, name, rows):
+        columns = self._schemas[name]
+        placeholders = ", ".join("?" for _ in columns)
+        column_list = ", ".join(_quote(column) for column, _ in columns)
+        values = [
+            tuple(_coerce(row.get(column), field_type, column) for column, field_type in columns)
+            for row in rows
+        ]
+        self._conn.executemany(f"INSERT INTO {_quote(name)} ({column_list}) VALUES ({placeholders})", values)
+
+    # Queries
+    def query(self, query, job_config=None):
+        self._round_trip()
+        sql = _BACKTICK_ID.sub(lambda match: _quote(_sqlite_name(match.group(1))), query)
+        with self._lock:
+            if _MERGE_HEAD.match(sql):
+                affected = self._merge(sql)
+                self.jobs.append(("merge", query))
+                return LocalJob("query", num_dml_affected_rows=affected, latency=self.job_latency_seconds)
+            cursor = self._conn.execute(sql)
+            self.jobs.append(("query", query))
+            if cursor.description is None:
+                return LocalJob("query", num_dml_affected_rows=cursor.rowcount, latency=self.job_latency_seconds)
+            names = [column[0] for column in cursor.description]
+            rows = [LocalRow(zip(names, values)) for values in cursor.fetchall()]
+            return LocalJob("query", rows=rows, latency=self.job_latency_seconds)
+
+    def rows(self, table):
+        name = _sqlite_name(_table_id(table))
+        columns = self._schemas[name]
+        cursor = self._conn.execute(f"SELECT * FROM {_quote(name)}")
+        result = []
+        for values in cursor.fetchall():
+            row = LocalRow()
+            for (column, field_type), value in zip(columns, values):
+                if field_type in ("BOOLEAN", "BOOL") and value is not None:
+                    value = bool(value)
+                row[column] = value
+            result.append(row)
+        return result
+
+    # MERGE INTO target USING source ON cond WHEN ... is rewritten into an
+    # UPDATE ... FROM plus an INSERT ... SELECT over the unmatched source rows
+    # (and a DELETE of target rows without a source row for NOT MATCHED BY
+    # SOURCE), all evaluated against the pre-MERGE target like BigQuery does.
+    def _merge(self, sql):
+        head = _MERGE_HEAD.match(sql)
+        target, target_alias = head.group(1), head.group(2)
+        position = head.end()
+        if sql[position] == "(":
+            end = _matching_paren(sql, position)
+            source = sql[position:end + 1]
+            position = end + 1
+        else:
+            source = sql[position:].split(None, 1)[0]
+            position += len(source)
+        alias_on = _MERGE_ALIAS_ON.match(sql, position)
+        if not alias_on:
+            raise BadRequest("Unsupported MERGE statement")
+        source_alias = alias_on.group(1)
+        matches = list(_MERGE_WHEN.finditer(sql, alias_on.end()))
+        if not matches:
+            raise BadRequest("MERGE statement has no WHEN clauses")
+        on_condition = sql[alias_on.end():matches[0].start()].strip()
+        clauses = []
+        for index, clause in enumerate(matches):
+            body_end = matches[index + 1].start() if index + 1 < len(matches) else len(sql)
+            clauses.append((clause, sql[clause.end():body_end]))
+        # Matched and not-matched-by-source clauses run first so inserted rows
+        # are never seen as matches, nor deleted
+        clauses.sort(key=lambda item: _clause_kind(item[0]) == "not_matched")
+
+        self._conn.execute("DROP TABLE IF EXISTS temp._merge_source")
+        self._conn.execute("DROP TABLE IF EXISTS temp._merge_unmatched")
+        self._conn.execute(f"CREATE TEMP TABLE _merge_source AS SELECT * FROM {source}")
+        self._conn.execute(
+            f"CREATE TEMP TABLE _merge_unmatched AS SELECT * FROM temp._merge_source AS {source_alias} "
+            f"WHERE NOT EXISTS (SELECT 1 FROM {target} AS {target_alias} WHERE {on_condition})"
+        )
+
+        affected = 0
+        previous_conditions = {"matched": [], "not_matched": [], "not_matched_by_source": []}
+        self._conn.execute("BEGIN")
+        try:
+            for clause, body in clauses:
+                kind = _clause_kind(clause)
+                matched = kind == "matched"
+                condition = clause.group(2).strip()
+                if condition.upper().startswith("AND"):
+                    condition = condition[3:].strip()
+                previous = previous_conditions[kind]
+                guard = f"({condition})" if condition else "1"
+                if previous:
+                    guard += " AND NOT (" + " OR ".join(f"({cond})" for cond in previous) + ")"
+                previous.append(condition or "1")
+
+                update = _MERGE_UPDATE.match(body)
+                insert = _MERGE_INSERT.match(body)
+                if matched and update:
+                    cursor = self._conn.execute(
+                        f"UPDATE {target} AS {target_alias} SET {update.group(1).strip().rstrip(';')} "
+                        f"FROM temp._merge_source AS {source_alias} WHERE ({on_condition}) AND {guard}"
+                    )
+                elif matched and _MERGE_DELETE.match(body):
+                    cursor = self._conn.execute(
+                        f"DELETE FROM {target} WHERE rowid IN (SELECT {target_alias}.rowid FROM {target} AS {target_alias} "
+                        f"JOIN temp._merge_source AS {source_alias} ON {on_condition} WHERE {guard})"
+                    )
+                elif kind == "not_matched_by_source" and _MERGE_DELETE.match(body):
+                    cursor = self._conn.execute(
+                        f"DELETE FROM {target} WHERE rowid IN (SELECT {target_alias}.rowid FROM {target} AS {target_alias} "
+                        f"WHERE NOT EXISTS (SELECT 1 FROM temp._merge_source AS {source_alias} WHERE {on_condition}) AND {guard})"
+                    )
+                elif kind == "not_matched" and insert:
+                    cursor = self._conn.execute(
+                        f"INSERT INTO {target} ({insert.group(1)}) SELECT {insert.group(2)} "
+                        f"FROM temp._merge_unmatched AS {source_alias} WHERE {guard}"
+                    )
+                else:
+                    raise BadRequest(f"Unsupported MERGE clause: {clause.group(0)} {body.strip()[:40]}")
+                affected += cursor.rowcount
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+        finally:
+            self._conn.execute("DROP TABLE IF EXISTS temp._merge_source")
+            self._conn.execute("DROP TABLE IF EXISTS temp._merge_unmatched")
+        return affected
+
+
+def _clause_kind(clause):
+    words = clause.group(1).upper().split()
+    if words[0] == "MATCHED":
+        return "matched"
+    return "not_matched_by_source" if words[-1] == "SOURCE" else "not_matched"
+
+
+# Timestamps are stored in one canonical form so they compare correctly as text
+def _timestamp_text(value):
+    if not isinstance(value, datetime):
+        value = datetime.fromisoformat(str(value).replace("Z", "+00:00").replace(" UTC", "+00:00"))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def _coerce(value, field_type, column):
+    if value is None:
+        return None
+    try:
+        if field_type in ("INTEGER", "INT64"):
+            return int(value)
+        if field_type in ("FLOAT", "FLOAT64", "NUMERIC"):
+            return float(value)
+        if field_type in ("BOOLEAN", "BOOL"):
+            if isinstance(value, str):
+                return int(value.lower() == "true")
+            return int(bool(value))
+        if field_type == "TIMESTAMP":
+            return _timestamp_text(value)
+    except (TypeError, ValueError):
+        raise BadRequest(f"Could not convert value {value!r} for field {column} of type {field_type}")
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return value
@@ -1,96 +1,118 @@
+import time
+_import_started = time.perf_counter()
+
 import functions_framework
-from google.cloud import storage
-from google.cloud import bigquery
 import logging
 import json
+import os
 import re
-from bs4 import BeautifulSoup
+from collections import Counter
 from datetime import datetime
+import batch_loader
+import clients
+import fingerprints
+import html_extract
+import json_stream
+import metrics
+import observations
+import raw_pages
+import records
+import streaming
+
+# google.cloud.bigquery and bs4 are imported on first use: most files never
+# need the HTML fallback, and BigQuery is only touched when a batch flushes.
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# HTML fallback engine: "indexed" walks the page once (html_extract), "soup"
+# runs the original find()-based extractors below
+HTML_EXTRACTOR = os.environ.get("HTML_EXTRACTOR", "indexed")
+
+# Which extraction path each processed file took, for the lifetime of the instance
+parse_path_counts = Counter()
+
+clients.record_module_import("process_tiktok_data", _import_started)
+
+# --- Extract Rehydration JSON without parsing the page (Fast Path) ---
+# Works on the raw str or bytes page so the common case never builds a BeautifulSoup tree.
+def extract_rehydration_json(html_content):
+    if isinstance(html_content, (bytes, bytearray)):
+        open_tag = raw_pages.REHYDRATION_OPEN_TAG_BYTES
+        close_tag = b"</script"
+    else:
+        open_tag = raw_pages.REHYDRATION_OPEN_TAG_STR
+        close_tag = "</script"
+
+    match = open_tag.search(html_content)
+    if not match:
+        return None
+    start = match.end()
+    end = html_content.find(close_tag, start)
+    if end == -1:
+        return None
+    payload = html_content[start:end].strip()
+    if not payload:
+        return None
+    try:
+        return json.loads(payload)
+    except ValueError as e:
+        logger.error(f"Error decoding rehydration JSON: {e}")
+        return None
+
+def build_soup(html_content):
+    from bs4 import BeautifulSoup
+
+    if isinstance(html_content, (bytes, bytearray)):
+        html_content = html_content.decode("utf-8")
+    return BeautifulSoup(html_content, "html.parser")
+
 # --- Extract Profile Data from JSON ---
 def extract_profile_data_from_json(json_data):
-    profile_data = {
-        "username": "N/A",
-        "user_id": "N/A",
-        "actual_name": "Unknown",
-        "following_count": 0,
-        "follower_count": 0,
-        "total_like_count": 0,
-        "caption": "N/A",
-        "bio_link": "No link",
-        "bio": "N/A",
-        "profile_pic_url": "N/A",
-        "is_verified": False
-    }
+    values = {}
     try:
         user_info = json_data["__DEFAULT_SCOPE__"]["webapp.user-detail"]["userInfo"]
         user = user_info.get("user", {})
         stats = user_info.get("stats", {})
-        profile_data["username"] = user.get("uniqueId", "N/A")
-        profile_data["user_id"] = user.get("id", "N/A")
-        profile_data["actual_name"] = user.get("nickname", "Unknown")
-        profile_data["following_count"] = stats.get("followingCount", 0)
-        profile_data["follower_count"] = stats.get("followerCount", 0)
-        profile_data["total_like_count"] = stats.get("heartCount", 0)
-        profile_data["caption"] = user.get("signature", "N/A")
-        profile_data["bio_link"] = user.get("bioLink", {}).get("link", "No link")
-        profile_data["bio"] = user.get("bio", "N/A")
-        profile_data["profile_pic_url"] = user.get("avatarLarger", "N/A")
-        profile_data["is_verified"] = user.get("verified", False)
+        values = {
+            "username": user.get("uniqueId"),
+            "user_id": user.get("id"),
+            "actual_name": user.get("nickname"),
+            "following_count": stats.get("followingCount"),
+            "follower_count": stats.get("followerCount"),
+            "total_like_count": stats.get("heartCount"),
+            "caption": user.get("signature"),
+            "bio_link": (user.get("bioLink") or {}).get("link"),
+            "bio": user.get("bio"),
+            "profile_pic_url": user.get("avatarLarger"),
+            "is_verified": user.get("verified"),
+        }
         logger.info("Extracted profile data from JSON successfully.")
     except KeyError as e:
         logger.error(f"KeyError extracting profile data: {e}")
-    return profile_data
+    return records.profile_record(values)
 
 # --- Extract Video Data from JSON ---
+def find_json_posts(json_data):
+    user_detail = json_data.get("__DEFAULT_SCOPE__", {}).get("webapp.user-detail", {})
+    posts = user_detail.get("posts", [])
+    if not posts:
+        logger.info("No posts found in JSON under 'posts', trying alternative structure.")
+        posts = user_detail.get("itemList", user_detail.get("ItemList", []))
+    if not posts:
+        logger.info("No itemList found, trying stats.videoList.")
+        posts = user_detail.get("userInfo", {}).get("stats", {}).get("videoList", [])
+    if not posts:
+        logger.info("No videoList found, searching for ItemModule.")
+        item_module = json_data.get("ItemModule", {})
+        posts = list(item_module.values()) if item_module else []
+    return posts
+
 def extract_video_data_from_json(json_data, username):
-    videos_data = []
+    videos_data = records.VideoBatch(username)
     try:
-        user_detail = json_data.get("__DEFAULT_SCOPE__", {}).get("webapp.user-detail", {})
-        posts = user_detail.get("posts", [])
-        if not posts:
-            logger.info("No posts found in JSON under 'posts', trying alternative structure.")
-            posts = user_detail.get("itemList", user_detail.get("ItemList", []))
-        if not posts:
-            logger.info("No itemList found, trying stats.videoList.")
-            posts = user_detail.get("userInfo", {}).get("stats", {}).get("videoList", [])
-        if not posts:
-            logger.info("No videoList found, searching for ItemModule.")
-            item_module = json_data.get("ItemModule", {})
-            posts = list(item_module.values()) if item_module else []
-
-        for post in posts:
-            try:
-                video_id = post.get("id")
-                if not video_id:
-                    continue
-                url = f"https://www.tiktok.com/@{username}/video/{video_id}"
-                views = post.get("stats", {}).get("playCount", 0)
-                thumbnail = post.get("video", {}).get("cover", "N/A")
-                description = post.get("desc", "N/A")
-                create_time = post.get("createTime", "N/A")
-                if create_time != "N/A":
-                    create_time = datetime.fromtimestamp(int(create_time)).isoformat()
-                like_count = post.get("stats", {}).get("diggCount", 0)
-                comment_count = post.get("stats", {}).get("commentCount", 0)
-                share_count = post.get("stats", {}).get("shareCount", 0)
-                videos_data.append({
-                    "url": url,
-                    "views": views,
-                    "thumbnail": thumbnail,
-                    "description": description,
-                    "create_time": create_time,
-                    "like_count": like_count,
-                    "comment_count": comment_count,
-                    "share_count": share_count
-                })
-            except KeyError as e:
-                logger.error(f"KeyError extracting video data for a post: {e}")
-                continue
+        videos_data.extend_posts(find_json_posts(json_data))
         logger.info(f"Extracted {len(videos_data)} videos from JSON.")
     except Exception as e:
         logger.error(f"Error accessing video data in JSON: {e}")
@@ -98,52 +120,40 @@ def extract_video_data_from_json(json_data, username):
 
 # --- Extract Profile Data from HTML (Fallback) ---
 def extract_profile_data_from_html(soup):
-    profile_data = {
-        "username": "N/A",
-        "user_id": "N/A",
-        "actual_name": "Unknown",
-        "following_count": 0,
-        "follower_count": 0,
-        "total_like_count": 0,
-        "caption": "N/A",
-        "bio_link": "No link",
-        "bio": "N/A",
-        "profile_pic_url": "N/A",
-        "is_verified": False
-    }
+    values = {}
     try:
         username_tag = soup.find("h2", {"data-e2e": "user-subtitle"})
-        profile_data["username"] = username_tag.text.strip() if username_tag else "N/A"
+        values["username"] = username_tag.text.strip() if username_tag else None
         
         name_tag = soup.find("h1", {"data-e2e": "user-title"})
-        profile_data["actual_name"] = name_tag.text.strip() if name_tag else "Unknown"
+        values["actual_name"] = name_tag.text.strip() if name_tag else None
         
         stats = soup.find_all("strong", {"data-e2e": "user-stats"})
-        profile_data["following_count"] = int(re.sub(r'[^\d]', '', stats[0].text)) if stats and len(stats) > 0 else 0
-        profile_data["follower_count"] = int(re.sub(r'[^\d]', '', stats[1].text)) if stats and len(stats) > 1 else 0
-        profile_data["total_like_count"] = int(re.sub(r'[^\d]', '', stats[2].text)) if stats and len(stats) > 2 else 0
+        values["following_count"] = int(re.sub(r'[^\d]', '', stats[0].text)) if stats and len(stats) > 0 else None
+        values["follower_count"] = int(re.sub(r'[^\d]', '', stats[1].text)) if stats and len(stats) > 1 else None
+        values["total_like_count"] = int(re.sub(r'[^\d]', '', stats[2].text)) if stats and len(stats) > 2 else None
         
         bio_tag = soup.find("h2", {"data-e2e": "user-bio"})
-        profile_data["bio"] = bio_tag.text.strip() if bio_tag else "N/A"
-        profile_data["caption"] = profile_data["bio"]
+        values["bio"] = bio_tag.text.strip() if bio_tag else None
+        values["caption"] = values["bio"]
         
         link_tag = soup.find("a", {"data-e2e": "user-link"})
-        profile_data["bio_link"] = link_tag["href"] if link_tag else "No link"
+        values["bio_link"] = link_tag["href"] if link_tag else None
         
         pic_tag = soup.find("img", {"data-e2e": "user-avatar"})
-        profile_data["profile_pic_url"] = pic_tag["src"] if pic_tag else "N/A"
+        values["profile_pic_url"] = pic_tag["src"] if pic_tag else None
         
         verified_tag = soup.find("svg", {"data-e2e": "verify-badge"})
-        profile_data["is_verified"] = bool(verified_tag)
+        values["is_verified"] = bool(verified_tag)
         
         logger.info("Extracted profile data from HTML successfully.")
     except Exception as e:
         logger.error(f"Error extracting profile data from HTML: {e}")
-    return profile_data
+    return records.profile_record(values)
 
 # --- Extract Video Data from HTML (Fallback) ---
 def extract_video_data_from_html(soup, username):
-    videos_data = []
+    videos_data = records.VideoBatch(username)
     try:
         video_containers = soup.find_all("div", {"data-e2e": "user-post-item"})
         if not video_containers:
@@ -153,43 +163,42 @@ def extract_video_data_from_html(soup, username):
         for container in video_containers:
             try:
                 a_tag = container.find("a")
-                url = a_tag["href"] if a_tag else "N/A"
-                if not url or url == "N/A":
+                url = a_tag["href"] if a_tag else None
+                if not url:
                     logger.warning("Skipping video with missing URL")
                     continue
 
                 views_tag = container.find("strong", {"data-e2e": "video-views"})
-                views = int(re.sub(r'[^\d]', '', views_tag.text)) if views_tag else 0
+                views = int(re.sub(r'[^\d]', '', views_tag.text)) if views_tag else None
 
                 img_tag = container.find("img")
-                thumbnail = img_tag["src"] if img_tag else "N/A"
+                thumbnail = img_tag["src"] if img_tag else None
 
                 desc_container = container.find("div", {"class": re.compile("tiktok-.*-desc")})
-                description = desc_container.text.strip() if desc_container else "N/A"
+                description = desc_container.text.strip() if desc_container else None
 
                 stats_container = container.find("div", {"class": re.compile("tiktok-.*-stats")})
-                like_count = 0
-                comment_count = 0
-                share_count = 0
+                like_count = None
+                comment_count = None
+                share_count = None
                 if stats_container:
                     like_tag = stats_container.find("strong", {"data-e2e": "like-count"})
-                    like_count = int(re.sub(r'[^\d]', '', like_tag.text)) if like_tag else 0
+                    like_count = int(re.sub(r'[^\d]', '', like_tag.text)) if like_tag else None
                     comment_tag = stats_container.find("strong", {"data-e2e": "comment-count"})
-                    comment_count = int(re.sub(r'[^\d]', '', comment_tag.text)) if comment_tag else 0
+                    comment_count = int(re.sub(r'[^\d]', '', comment_tag.text)) if comment_tag else None
                     share_tag = stats_container.find("strong", {"data-e2e": "share-count"})
-                    share_count = int(re.sub(r'[^\d]', '', share_tag.text)) if share_tag else 0
+                    share_count = int(re.sub(r'[^\d]', '', share_tag.text)) if share_tag else None
 
-                video_entry = {
+                # The HTML fallback has no creation time
+                videos_data.append({
                     "url": url,
                     "views": views,
                     "thumbnail": thumbnail,
                     "description": description,
-                    "create_time": "N/A",
                     "like_count": like_count,
                     "comment_count": comment_count,
                     "share_count": share_count
-                }
-                videos_data.append(video_entry)
+                })
             except Exception as e:
                 logger.error(f"Error parsing video container: {e}")
                 continue
@@ -198,6 +207,74 @@ def extract_video_data_from_html(soup, username):
         logger.error(f"Error extracting video data from HTML: {e}")
     return videos_data
 
+# --- Extract Profile and Video Data from a Page ---
+# Prefers the rehydration JSON; the HTML is only parsed if a fallback needs it.
+# The page is either the raw str/bytes or a raw_pages.RawPage, which is scanned
+# as a decompressed stream and only read in full for the HTML fallback.
+def extract_page_data(page, username):
+    # read_json covers the download too when the page is streamed
+    with metrics.span("read_json"):
+        if isinstance(page, raw_pages.RawPage):
+            with page.open() as stream:
+                json_data = raw_pages.extract_rehydration_json_from_stream(stream)
+        else:
+            json_data = extract_rehydration_json(page)
+
+    def read_html():
+        if not isinstance(page, raw_pages.RawPage):
+            return page
+        with metrics.span("read_html"):
+            return page.read()
+
+    def parse_html():
+        html_content = read_html()
+        with metrics.span("parse_html"):
+            if HTML_EXTRACTOR == "soup":
+                return build_soup(html_content)
+            return html_extract.index_page(html_content)
+
+    def extract_html_profile(document):
+        if HTML_EXTRACTOR == "soup":
+            return extract_profile_data_from_html(document)
+        return document.profile_data()
+
+    def extract_html_videos(document):
+        if HTML_EXTRACTOR == "soup":
+            return extract_video_data_from_html(document, username)
+        return document.videos_data(username)
+
+    profile_data = None
+    videos_data = records.VideoBatch(username)
+    profile_path = "json"
+    videos_path = "json"
+
+    if json_data and "__DEFAULT_SCOPE__" in json_data and "webapp.user-detail" in json_data["__DEFAULT_SCOPE__"]:
+        logger.info("JSON data found, extracting data...")
+        with metrics.span("extract_json"):
+            profile_data = extract_profile_data_from_json(json_data)
+            videos_data = extract_video_data_from_json(json_data, profile_data["username"])
+
+    # The parsed HTML document, built at most once
+    document = None
+
+    if not profile_data or not profile_data["username"]:
+        logger.info("Falling back to HTML parsing for profile data.")
+        document = parse_html()
+        with metrics.span("extract_html"):
+            profile_data = extract_html_profile(document)
+        profile_path = "html"
+
+    if not videos_data:
+        logger.info("Falling back to HTML parsing for video data.")
+        if document is None:
+            document = parse_html()
+        with metrics.span("extract_html"):
+            videos_data = extract_html_videos(document)
+        videos_path = "html"
+
+    parse_path = {"profile_path": profile_path, "videos_path": videos_path, "soup_built": document is not None}
+    return profile_data, videos_data, parse_path
+
 @functions_framework.cloud_event
 def process_tiktok_data(cloud_event):
     try:
@@ -205,42 +282,92 @@ def process_tiktok_data(cloud_event):
         bucket_name = event_data["bucket"]
         file_name = event_data["name"]
         logger.info(f"Processing file: gs://{bucket_name}/{file_name}")
+        clients.log_cold_start("process_tiktok_data")
 
-        storage_client = storage.Client()
-        bucket = storage_client.bucket(bucket_name)
-        blob = bucket.blob(file_name)
-        html_content = blob.download_as_text()
-        logger.info("Downloaded HTML file.")
-
-        soup = BeautifulSoup(html_content, "html.parser")
-
-        script_tag = soup.find("script", id="__UNIVERSAL_DATA_FOR_REHYDRATION__")
-        profile_data = None
-        videos_data = []
-        username = file_name.split("/")[-2]
-
-        if script_tag and script_tag.string:
-            json_data = json.loads(script_tag.string.strip())
-            if "__DEFAULT_SCOPE__" in json_data and "webapp.user-detail" in json_data["__DEFAULT_SCOPE__"]:
-                logger.info("JSON data found, extracting data...")
-                profile_data = extract_profile_data_from_json(json_data)
-                videos_data = extract_video_data_from_json(json_data, profile_data["username"])
-        
-        if not profile_data or profile_data["username"] == "N/A":
-            logger.info("Falling back to HTML parsing for profile data.")
-            profile_data = extract_profile_data_from_html(soup)
-        
-        if not videos_data:
-            logger.info("Falling back to HTML parsing for video data.")
-            videos_data = extract_video_data_from_html(soup, username)
+        with metrics.trace("process_tiktok_data", file=file_name) as trace:
+            process_file(event_data, trace)
+
+        clients.log_client_init("process_tiktok_data")
+
+    except Exception as e:
+        logger.error(f"Error in process_tiktok_data: {str(e)}")
+        raise
+
+def process_file(event_data, trace):
+    bucket_name = event_data["bucket"]
+    file_name = event_data["name"]
+    storage_client = clients.get_storage_client()
+    bucket = storage_client.bucket(bucket_name)
+    blob = bucket.blob(file_name)
+    page = raw_pages.RawPage(blob, event_data.get("metadata"), event_data.get("size"))
+    logger.info(f"Streaming HTML file ({page.stored_bytes} bytes stored, codec: {page.codec or 'none'}).")
+
+    username = file_name.split("/")[-2]
+    if streaming.should_stream(page) and process_file_streaming(event_data, trace, storage_client, page, username):
+        return
+
+    profile_data, videos_data, parse_path = extract_page_data(page, username)
+    profile_path = parse_path["profile_path"]
+    videos_path = parse_path["videos_path"]
+    soup_built = parse_path["soup_built"]
 
-        # Add scrape_timestamp only to profile_data
-        profile_data["scrape_timestamp"] = event_data["timeCreated"]
+    parse_path_counts[f"profile_{profile_path}"] += 1
+    parse_path_counts[f"videos_{videos_path}"] += 1
+    parse_path_counts["soup_built" if soup_built else "soup_skipped"] += 1
+    trace.set(
+        profile_path=profile_path,
+        videos_path=videos_path,
+        soup_built=soup_built,
+        stored_bytes=page.stored_bytes,
+        codec=page.codec,
+        videos=len(videos_data),
+        parse_path_totals=dict(parse_path_counts),
+    )
 
+    # Blocked and captcha pages yield no username; a profile without one
+    # cannot be loaded (username is REQUIRED), so it is never staged
+    if not profile_data["username"]:
+        logger.error(f"No username found in {file_name}, skipping the file.")
+        trace.set(skipped="no_username")
+        return
+
+    # Add scrape_timestamp only to profile_data
+    profile_data["scrape_timestamp"] = event_data["timeCreated"]
+
+    logger.info(f"Extracted profile data for {profile_data['username']} and {len(videos_data)} videos.")
+    # Formatting whole record lists is expensive for big profiles, so only a sample is logged
+    if metrics.sample_payload():
         logger.info(f"Extracted profile data: {profile_data}")
-        logger.info(f"Extracted {len(videos_data)} videos: {videos_data}")
+        logger.info(f"Extracted {len(videos_data)} videos: {list(videos_data)}")
+
+    processed_bucket_name = batch_loader.PROCESSED_BUCKET
+
+    # Only new or changed rows go on to the load stage
+    staged_profile = profile_data
+    staged_videos = videos_data
+    changes = None
+    digest_store = fingerprints.digest_store_from_env(storage_client, processed_bucket_name)
+    if digest_store is not None:
+        with metrics.span("change_detection"):
+            changes = fingerprints.detect_changes(digest_store, username, profile_data, videos_data)
+        trace.set(
+            profile_changed=changes.profile_data is not None,
+            videos_changed=len(changes.changed_videos),
+            videos_unchanged=changes.unchanged_videos,
+        )
+    if observations.enabled():
+        tracker = observations.ObservationTracker()
+        tracker.add_batch(videos_data)
+        record_observation(storage_client, username, profile_data, tracker, len(changes.changed_videos) if changes else None,
+                           page.credits)
+    if changes is not None:
+        if changes.unchanged:
+            logger.info(f"Nothing changed for {username} since the last scrape, skipping.")
+            return
+        staged_profile = changes.profile_data
+        staged_videos = changes.changed_videos
 
-        processed_bucket_name = "tiktok-processed-data"
+    with metrics.span("gcs_upload"):
         profile_blob_path = f"profiles/{username}/{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.json"
         profile_blob = storage_client.bucket(processed_bucket_name).blob(profile_blob_path)
         profile_blob.upload_from_string(json.dumps(profile_data), content_type="application/json")
@@ -249,195 +376,161 @@ def process_tiktok_data(cloud_event):
         if videos_data:
             video_blob_path = f"videos/{username}/{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.json"
             video_blob = storage_client.bucket(processed_bucket_name).blob(video_blob_path)
-            video_content = "\n".join(json.dumps(video) for video in videos_data)
-            video_blob.upload_from_string(video_content, content_type="application/json")
+            video_blob.upload_from_string(videos_data.to_ndjson(), content_type="application/json")
             logger.info(f"Saved processed video data to GCS: {video_blob_path}")
 
-        bq_client = bigquery.Client()
-
-        # --- Load Profile Data into a Temporary Table and Merge ---
-        profile_table_id = "training-triggering-pipeline.tiktok_dataset.profiles"
-        temp_profile_table_id = "training-triggering-pipeline.tiktok_dataset.temp_profiles"
-
-        # Create the temporary profiles table if it doesn't exist
-        temp_profile_table = bigquery.Table(temp_profile_table_id, schema=[
-            bigquery.SchemaField("username", "STRING", mode="REQUIRED"),
-            bigquery.SchemaField("user_id", "STRING"),
-            bigquery.SchemaField("actual_name", "STRING"),
-            bigquery.SchemaField("following_count", "INTEGER"),
-            bigquery.SchemaField("follower_count", "INTEGER"),
-            bigquery.SchemaField("total_like_count", "INTEGER"),
-            bigquery.SchemaField("caption", "STRING"),
-            bigquery.SchemaField("bio_link", "STRING"),
-            bigquery.SchemaField("bio", "STRING"),
-            bigquery.SchemaField("profile_pic_url", "STRING"),
-            bigquery.SchemaField("is_verified", "BOOLEAN"),
-            bigquery.SchemaField("scrape_timestamp", "TIMESTAMP")
-        ])
-        try:
-            bq_client.create_table(temp_profile_table, exists_ok=True)
-        except Exception as e:
-            logger.error(f"Error creating temporary profiles table: {e}")
-            raise
-
-        # Load profile data into the temporary table
-        profile_job_config = bigquery.LoadJobConfig(
-            source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
-            write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE,  # Overwrite the temp table
-            schema=[
-                bigquery.SchemaField("username", "STRING", mode="REQUIRED"),
-                bigquery.SchemaField("user_id", "STRING"),
-                bigquery.SchemaField("actual_name", "STRING"),
-                bigquery.SchemaField("following_count", "INTEGER"),
-                bigquery.SchemaField("follower_count", "INTEGER"),
-                bigquery.SchemaField("total_like_count", "INTEGER"),
-                bigquery.SchemaField("caption", "STRING"),
-                bigquery.SchemaField("bio_link", "STRING"),
-                bigquery.SchemaField("bio", "STRING"),
-                bigquery.SchemaField("profile_pic_url", "STRING"),
-                bigquery.SchemaField("is_verified", "BOOLEAN"),
-                bigquery.SchemaField("scrape_timestamp", "TIMESTAMP")
-            ]
+        # Loading into BigQuery happens in micro-batches, see batch_loader
+        staged_blob_path = batch_loader.stage_processed(
+            storage_client, staged_profile, staged_videos,
+            username=profile_data["username"], scrape_timestamp=profile_data["scrape_timestamp"]
         )
-        profile_uri = f"gs://{processed_bucket_name}/{profile_blob_path}"
-        profile_load_job = bq_client.load_table_from_uri(profile_uri, temp_profile_table_id, job_config=profile_job_config)
-        profile_load_job.result()
-        logger.info(f"Loaded profile data into temporary table {temp_profile_table_id}")
-
-        # Merge the temporary table into the profiles table
-        merge_profile_query = f"""
-        MERGE INTO `{profile_table_id}` AS target
-        USING `{temp_profile_table_id}` AS source
-        ON target.username = source.username
-        WHEN MATCHED THEN
-            UPDATE SET
-                user_id = source.user_id,
-                actual_name = source.actual_name,
-                following_count = source.following_count,
-                follower_count = source.follower_count,
-                total_like_count = source.total_like_count,
-                caption = source.caption,
-                bio_link = source.bio_link,
-                bio = source.bio,
-                profile_pic_url = source.profile_pic_url,
-                is_verified = source.is_verified,
-                scrape_timestamp = source.scrape_timestamp
-        WHEN NOT MATCHED THEN
-            INSERT (
-                username,
-                user_id,
-                actual_name,
-                following_count,
-                follower_count,
-                total_like_count,
-                caption,
-                bio_link,
-                bio,
-                profile_pic_url,
-                is_verified,
-                scrape_timestamp
-            )
-            VALUES (
-                source.username,
-                source.user_id,
-                source.actual_name,
-                source.following_count,
-                source.follower_count,
-                source.total_like_count,
-                source.caption,
-                source.bio_link,
-                source.bio,
-                source.profile_pic_url,
-                source.is_verified,
-                source.scrape_timestamp
-            )
-        """
-        merge_profile_job = bq_client.query(merge_profile_query)
-        merge_profile_job.result()
-        logger.info(f"Merged profile data into BigQuery table {profile_table_id}")
-
-        # --- Load Video Data into a Temporary Table and Merge ---
-        if videos_data:
-            video_table_id = "training-triggering-pipeline.tiktok_dataset.videos"
-            temp_video_table_id = "training-triggering-pipeline.tiktok_dataset.temp_videos"
-
-            # Create the temporary videos table if it doesn't exist
-            temp_video_table = bigquery.Table(temp_video_table_id, schema=[
-                bigquery.SchemaField("url", "STRING", mode="REQUIRED"),
-                bigquery.SchemaField("views", "INTEGER"),
-                bigquery.SchemaField("thumbnail", "STRING"),
-                bigquery.SchemaField("description", "STRING"),
-                bigquery.SchemaField("create_time", "STRING"),
-                bigquery.SchemaField("like_count", "INTEGER"),
-                bigquery.SchemaField("comment_count", "INTEGER"),
-                bigquery.SchemaField("share_count", "INTEGER")
-            ])
+        logger.info(f"Staged processed data for batch loading: {staged_blob_path}")
+    if changes is not None:
+        changes.commit(digest_store)
+
+    flush_due_batch(storage_client, trace)
+
+# Unchanged rescrapes are recorded too: they tell the recrawl scheduler a creator is quiet
+def record_observation(storage_client, username, profile_data, tracker, changed_videos, credits=None):
+    with metrics.span("observation"):
+        observations.stage_observation(
+            storage_client, batch_loader.PROCESSED_BUCKET, tracker.observation(username, profile_data, changed_videos, credits)
+        )
+
+def flush_due_batch(storage_client, trace):
+    pending = batch_loader.due_batch(storage_client)
+    if pending:
+        bq_client = clients.get_bigquery_client()
+        batch_loader.flush_batch(storage_client, bq_client, pending)
+        trace.set(flushed_files=len(pending))
+
+# --- Streaming Mode for Very Large Pages ---
+# Reads the rehydration JSON incrementally and writes videos out in chunks as
+# they are extracted (see streaming.py), so memory stays flat however many
+# posts the profile has. Returns False, having written nothing, when the page
+# needs the regular path: no usable user-detail payload, or no videos in it.
+# The first post list met in the payload is used; the regular path prefers
+# "posts" over "itemList" when a page has both.
+def process_file_streaming(event_data, trace, storage_client, page, username):
+    chunk_size = streaming.read_chunk_size()
+    digest_store = fingerprints.digest_store_from_env(storage_client, batch_loader.PROCESSED_BUCKET)
+    profile_data = None
+    stats_videos = []
+    writer = None
+    source = None
+    early_posts = []
+    skipped_posts = 0
+
+    with page.open() as stream:
+        with metrics.span("read_json"):
+            prefix = raw_pages.seek_rehydration_payload(stream, chunk_size)
+        if prefix is None:
+            return False
+
+        with metrics.span("stream_extract"):
             try:
-                bq_client.create_table(temp_video_table, exists_ok=True)
-            except Exception as e:
-                logger.error(f"Error creating temporary videos table: {e}")
-                raise
-
-            # Load video data into the temporary table
-            video_job_config = bigquery.LoadJobConfig(
-                source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
-                write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE,  # Overwrite the temp table
-                schema=[
-                    bigquery.SchemaField("url", "STRING", mode="REQUIRED"),
-                    bigquery.SchemaField("views", "INTEGER"),
-                    bigquery.SchemaField("thumbnail", "STRING"),
-                    bigquery.SchemaField("description", "STRING"),
-                    bigquery.SchemaField("create_time", "STRING"),
-                    bigquery.SchemaField("like_count", "INTEGER"),
-                    bigquery.SchemaField("comment_count", "INTEGER"),
-                    bigquery.SchemaField("share_count", "INTEGER")
-                ]
-            )
-            video_uri = f"gs://{processed_bucket_name}/{video_blob_path}"
-            video_load_job = bq_client.load_table_from_uri(video_uri, temp_video_table_id, job_config=video_job_config)
-            video_load_job.result()
-            logger.info(f"Loaded video data into temporary table {temp_video_table_id}")
-
-            # Merge the temporary table into the videos table
-            merge_video_query = f"""
-            MERGE INTO `{video_table_id}` AS target
-            USING `{temp_video_table_id}` AS source
-            ON target.url = source.url
-            WHEN MATCHED THEN
-                UPDATE SET
-                    views = source.views,
-                    thumbnail = source.thumbnail,
-                    description = source.description,
-                    create_time = source.create_time,
-                    like_count = source.like_count,
-                    comment_count = source.comment_count,
-                    share_count = source.share_count
-            WHEN NOT MATCHED THEN
-                INSERT (
-                    url,
-                    views,
-                    thumbnail,
-                    description,
-                    create_time,
-                    like_count,
-                    comment_count,
-                    share_count
-                )
-                VALUES (
-                    source.url,
-                    source.views,
-                    source.thumbnail,
-                    source.description,
-                    source.create_time,
-                    source.like_count,
-                    source.comment_count,
-                    source.share_count
-                )
-            """
-            merge_video_job = bq_client.query(merge_video_query)
-            merge_video_job.result()
-            logger.info(f"Merged video data into BigQuery table {video_table_id}")
+                for event in json_stream.iter_rehydration_events(stream, chunk_size, prefix):
+                    if event[0] == "user_info":
+                        user_info = event[1]
+                        profile_data = extract_profile_data_from_json({"__DEFAULT_SCOPE__": {"webapp.user-detail": {"userInfo": user_info}}})
+                        if not profile_data["username"]:
+                            return False
+                        profile_data["scrape_timestamp"] = event_data["timeCreated"]
+                        stats_videos = user_info.get("stats", {}).get("videoList") or []
+                        writer = streaming.VideoChunkWriter(
+                            storage_client, username, profile_data,
+                            f"videos/{username}/{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.json",
+                            digest_store,
+                        )
+                        writer.add_posts(early_posts)
+                        early_posts = []
+                    elif event[0] == "post":
+                        if source is None:
+                            source = event[1]
+                        elif event[1] != source:
+                            skipped_posts += 1
+                            continue
+                        if writer is None:
+                            # Posts ahead of userInfo wait for the username their URLs need
+                            early_posts.append(event[2])
+                            continue
+                        writer.add_posts((event[2],))
+            except ValueError as e:
+                if writer is not None and writer.videos:
+                    raise
+                logger.error(f"Error streaming rehydration JSON, using the regular path: {e}")
+                return False
+
+            if writer is not None and not writer.videos:
+                logger.info("No posts found in the streamed JSON, trying stats.videoList.")
+                writer.add_posts(stats_videos)
+    if writer is None or not writer.videos:
+        return False
+
+    with metrics.span("gcs_upload"):
+        profile_blob_path = f"profiles/{username}/{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.json"
+        profile_blob = storage_client.bucket(batch_loader.PROCESSED_BUCKET).blob(profile_blob_path)
+        profile_blob.upload_from_string(json.dumps(profile_data), content_type="application/json")
+        logger.info(f"Saved processed profile data to GCS: {profile_blob_path}")
+    writer.close()
+    if observations.enabled():
+        record_observation(storage_client, username, profile_data, writer.tracker,
+                           writer.changed_videos if digest_store is not None else None, page.credits)
+
+    parse_path_counts["profile_json"] += 1
+    parse_path_counts["videos_json"] += 1
+    parse_path_counts["soup_skipped"] += 1
+    parse_path_counts["streamed"] += 1
+    trace.set(
+        profile_path="json",
+        videos_path="json",
+        soup_built=False,
+        streamed=True,
+        stored_bytes=page.stored_bytes,
+        codec=page.codec,
+        videos=writer.videos,
+        skipped_posts=skipped_posts,
+        staged_files=len(writer.staged_files),
+        parse_path_totals=dict(parse_path_counts),
+    )
+    if writer.digest_store is not None:
+        trace.set(
+            profile_changed=writer.profile_changed,
+            videos_changed=writer.changed_videos,
+            videos_unchanged=writer.unchanged_videos,
+        )
+    logger.info(f"Extracted profile data for {profile_data['username']} and {writer.videos} videos (streamed).")
 
+    flush_due_batch(storage_client, trace)
+    return True
+
+# Flushes everything pending regardless of thresholds; meant for Cloud Scheduler
+# so quiet periods still get their data merged.
+@functions_framework.http
+def flush_tiktok_batches(request):
+    try:
+        clients.log_cold_start("flush_tiktok_batches")
+        with metrics.trace("flush_tiktok_batches") as trace:
+            storage_client = clients.get_storage_client()
+            bq_client = clients.get_bigquery_client()
+            results = batch_loader.flush_all(storage_client, bq_client)
+            trace.set(batches=len(results))
+        return json.dumps({"batches": results}), 200, {"Content-Type": "application/json"}
     except Exception as e:
-        logger.error(f"Error in process_tiktok_data: {str(e)}")
-        raise
\ No newline at end of file
+        logger.error(f"Error in flush_tiktok_batches: {str(e)}")
+        raise
+
+# Rebuilds the dashboard tables from profiles and videos in full; meant for a
+# daily Cloud Scheduler job, to catch up anything the per-batch updates missed.
+@functions_framework.http
+def reconcile_dashboard_tables(request):
+    try:
+        clients.log_cold_start("reconcile_dashboard_tables")
+        with metrics.trace("reconcile_dashboard_tables") as trace:
+            bq_client = clients.get_bigquery_client()
+            corrected = batch_loader.reconcile_dashboard(bq_client)
+            trace.set(corrected_rows=corrected)
+        return json.dumps({"corrected_rows": corrected}), 200, {"Content-Type": "application/json"}
+    except Exception as e:
+        logger.error(f"Error in reconcile_dashboard_tables: {str(e)}")
+        raise
@@ -0,0 +1,68 @@
+import heapq
+import json
+import logging
+import os
+import time
+import uuid
+
+import records
+
+logger = logging.getLogger(__name__)
+
+# Recrawl observations: one small record per processed scrape, from which
+# the recrawl_scheduler function learns how fast each creator changes
+# (follower and like deltas, new uploads). They are staged under
+# observations/pending/ in the processed bucket; the scheduler folds them into
+# its state and deletes them. RECRAWL_OBSERVATIONS=gcs turns them on.
+
+RECRAWL_OBSERVATIONS = os.environ.get("RECRAWL_OBSERVATIONS", "off")
+OBSERVATIONS_PREFIX = "observations/pending/"
+# Creation times of the newest videos, enough to count uploads between two scrapes
+RECENT_VIDEO_TIMES = 50
+
+def enabled():
+    return RECRAWL_OBSERVATIONS == "gcs"
+
+class ObservationTracker:
+    def __init__(self):
+        self.videos = 0
+        # Min-heap of the newest create_time values seen
+        self._recent = []
+
+    # Only the newest RECENT_VIDEO_TIMES creation times of a batch are rendered
+    def add_batch(self, videos):
+        self.videos += len(videos)
+        epochs = videos.columns["create_time"]
+        nulls = videos.nulls["create_time"]
+        newest = heapq.nlargest(RECENT_VIDEO_TIMES, (epoch for row, epoch in enumerate(epochs) if row not in nulls))
+        for create_time in records.iso_times(newest):
+            self._push(create_time)
+
+    def _push(self, create_time):
+        if not create_time:
+            return
+        if len(self._recent) < RECENT_VIDEO_TIMES:
+            heapq.heappush(self._recent, create_time)
+        elif create_time > self._recent[0]:
+            heapq.heapreplace(self._recent, create_time)
+
+    # changed_videos is the change detection count, None when it is off;
+    # credits is what the scrape cost, None when the raw page does not say
+    def observation(self, username, profile_data, changed_videos=None, credits=None):
+        return {
+            "username": username,
+            "profile_url": f"https://www.tiktok.com/@{username}",
+            "scrape_timestamp": profile_data.get("scrape_timestamp"),
+            "follower_count": profile_data.get("follower_count"),
+            "total_like_count": profile_data.get("total_like_count"),
+            "videos": self.videos,
+            "recent_video_times": sorted(self._recent, reverse=True),
+            "changed_videos": changed_videos,
+            "credits": credits,
+        }
+
+def stage_observation(storage_client, bucket_name, observation):
+    blob_name = f"{OBSERVATIONS_PREFIX}{int(time.time() * 1000):013d}-{uuid.uuid4().hex[:12]}.json"
+    blob = storage_client.bucket(bucket_name).blob(blob_name)
+    blob.upload_from_string(json.dumps(observation), content_type="application/json", if_generation_match=0)
+    return blob_name
@@ -0,0 +1,128 @@
+import gzip
+import json
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# Raw pages may be stored compressed by scrape_tiktok (RAW_COMPRESSION).
+# The codec is recorded in the object name (.html.gz / .html.zst) and in the
+# "codec" metadata entry. Pages are read through a streaming decompressor,
+# so the rehydration JSON can be pulled out without ever holding the whole
+# uncompressed page in memory. Uncompressed .html objects read as before.
+
+READ_CHUNK_SIZE = 1024 * 1024
+CODEC_EXTENSIONS = {".gz": "gzip", ".zst": "zstd"}
+
+REHYDRATION_SCRIPT_ID = "__UNIVERSAL_DATA_FOR_REHYDRATION__"
+
+# Matches the opening tag of the rehydration <script>, whatever the attribute order or quoting
+_REHYDRATION_OPEN_TAG = r"""<script\b[^>]*\bid\s*=\s*["']?""" + REHYDRATION_SCRIPT_ID + r"""["']?[^>]*>"""
+REHYDRATION_OPEN_TAG_STR = re.compile(_REHYDRATION_OPEN_TAG, re.IGNORECASE)
+REHYDRATION_OPEN_TAG_BYTES = re.compile(_REHYDRATION_OPEN_TAG.encode("ascii"), re.IGNORECASE)
+_CLOSE_TAG = b"</script"
+# Longest opening tag we expect to have to stitch across a chunk boundary
+_MAX_TAG_BYTES = 64 * 1024
+
+def codec_for(name, metadata=None):
+    if metadata and metadata.get("codec"):
+        return metadata["codec"]
+    for extension, codec in CODEC_EXTENSIONS.items():
+        if name.endswith(extension):
+            return codec
+    return None
+
+def open_decompressed(stream, codec):
+    if codec is None or codec == "identity":
+        return stream
+    if codec == "gzip":
+        return gzip.GzipFile(fileobj=stream, mode="rb")
+    if codec == "zstd":
+        import zstandard
+
+        return zstandard.ZstdDecompressor().stream_reader(stream, closefd=True)
+    raise ValueError(f"Unsupported raw page codec: {codec}")
+
+def decompress(data, codec):
+    if codec is None or codec == "identity":
+        return data
+    if codec == "gzip":
+        return gzip.decompress(data)
+    if codec == "zstd":
+        import zstandard
+
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    raise ValueError(f"Unsupported raw page codec: {codec}")
+
+# --- Raw Page Handle ---
+# metadata and size can be passed from the finalize event to save a metadata request
+class RawPage:
+    def __init__(self, blob, metadata=None, size=None):
+        self.blob = blob
+        metadata = metadata or blob.metadata
+        self.codec = codec_for(blob.name, metadata)
+        self.stored_bytes = int(size) if size is not None else blob.size
+        # Recorded by scrape_tiktok for compressed pages; None when unknown
+        uncompressed = (metadata or {}).get("uncompressed_bytes")
+        if uncompressed is not None:
+            self.uncompressed_bytes = int(uncompressed)
+        elif self.codec in (None, "identity"):
+            self.uncompressed_bytes = self.stored_bytes
+        else:
+            self.uncompressed_bytes = None
+        # ScrapingBee credits the fetch cost, recorded by scrape_tiktok
+        credits = (metadata or {}).get("credits")
+        self.credits = int(credits) if credits is not None else None
+
+    def open(self):
+        return open_decompressed(self.blob.open("rb", chunk_size=READ_CHUNK_SIZE), self.codec)
+
+    # Only for the HTML fallback, which needs the whole document
+    def read(self):
+        return decompress(self.blob.download_as_bytes(), self.codec)
+
+# --- Extract Rehydration JSON from a Stream ---
+# Reads up to the opening rehydration tag and returns the bytes already read
+# past it, or None if the page has no rehydration script.
+def seek_rehydration_payload(stream, chunk_size=READ_CHUNK_SIZE):
+    buffer = b""
+    match = None
+    while match is None:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            return None
+        buffer += chunk
+        match = REHYDRATION_OPEN_TAG_BYTES.search(buffer)
+        if match is None:
+            # Keep only a possibly incomplete tag at the end of what was read
+            last_tag = buffer.rfind(b"<")
+            buffer = buffer[last_tag:] if last_tag != -1 and len(buffer) - last_tag <= _MAX_TAG_BYTES else b""
+    return buffer[match.end():]
+
+def extract_rehydration_json_from_stream(stream, chunk_size=READ_CHUNK_SIZE):
+    tail = seek_rehydration_payload(stream, chunk_size)
+    if tail is None:
+        return None
+
+    parts = []
+    while True:
+        end = tail.find(_CLOSE_TAG)
+        if end != -1:
+            parts.append(tail[:end])
+            break
+        # Hold back enough bytes to catch a close tag split across chunks
+        keep = len(_CLOSE_TAG) - 1
+        parts.append(tail[:-keep] if len(tail) > keep else b"")
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            return None
+        tail = (tail[-keep:] if len(tail) > keep else tail) + chunk
+
+    payload = b"".join(parts).strip()
+    if not payload:
+        return None
+    try:
+        return json.loads(payload)
+    except ValueError as e:
+        logger.error(f"Error decoding rehydration JSON: {e}")
+        return None
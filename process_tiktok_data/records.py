@@ -0,0 +1,379 @@
+import hashlib
+from array import array
+from datetime import datetime, timedelta, timezone
+from json.encoder import encode_basestring, encode_basestring_ascii
+
+import columnar
+import fingerprints
+import schemas
+
+# Typed records for processed data, generated from the schema files.
+#
+# A page's videos are held column by column in a VideoBatch: INTEGER columns
+# (and create_time, a Unix time until it is written out) are array('q')
+# buffers with a set of NULL row indexes, STRING columns plain lists. Values
+# are converted to the column type as they are appended, so a missing count
+# or description is NULL rather than 0 or "N/A", and each output (NDJSON
+# lines, change-detection digests, an Arrow table) is produced for the whole
+# batch at once. Profiles, one per page, are plain dicts with every schema
+# column, see profile_record().
+
+INTEGER_TYPES = ("INTEGER", "INT64")
+# STRING columns filled from Unix times; rendered as ISO 8601 when written out
+EPOCH_COLUMNS = ("create_time",)
+
+# Where each video column comes from in a post of the rehydration JSON (the
+# url is built from the post id)
+POST_PATHS = {
+    "views": ("stats", "playCount"),
+    "thumbnail": ("video", "cover"),
+    "description": ("desc",),
+    "create_time": ("createTime",),
+    "like_count": ("stats", "diggCount"),
+    "comment_count": ("stats", "commentCount"),
+    "share_count": ("stats", "shareCount"),
+}
+
+_NULL = "null"
+_EPOCH = datetime(1970, 1, 1)
+_HOUR_MINUTES = [f"{hour:02d}:{minute:02d}:" for hour in range(24) for minute in range(60)]
+_SECONDS = [f"{second:02d}" for second in range(60)]
+# The same tables the other way round, for reading ISO strings back
+_HOUR_MINUTE_SECONDS = {hour_minute: index * 60 for index, hour_minute in enumerate(_HOUR_MINUTES)}
+_SECOND_VALUES = {second: index for index, second in enumerate(_SECONDS)}
+_MIN_EPOCH = int((datetime.min - _EPOCH).total_seconds())
+_MAX_EPOCH = int((datetime.max - _EPOCH).total_seconds())
+
+# --- Conversions ---
+# None for anything that is not a whole number; the arrays reject what does not fit in 64 bits
+def to_integer(value):
+    if value is None or type(value) is int:
+        return value
+    try:
+        return int(value)
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+# Unix times outside what datetime can render are NULL
+def to_epoch(value):
+    if isinstance(value, str) and not value.strip().isdigit():
+        try:
+            parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+        return int((parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)).timestamp())
+    value = to_integer(value)
+    return value if value is not None and _MIN_EPOCH <= value <= _MAX_EPOCH else None
+
+# to_epoch for a whole column. ISO strings written by iso_times, which is what
+# staged rows hold, are read back with a date cache instead of fromisoformat.
+def to_epochs(values):
+    if all(type(value) is int for value in values) and _MIN_EPOCH <= min(values, default=0) and max(values, default=0) <= _MAX_EPOCH:
+        return values
+    dates = {}
+    epochs = []
+    append = epochs.append
+    for value in values:
+        if type(value) is str and len(value) == 19 and value[10] == "T":
+            date = value[:10]
+            day = dates.get(date)
+            if day is None:
+                try:
+                    day = dates[date] = (datetime.fromisoformat(date) - _EPOCH).days * 86400
+                except ValueError:
+                    day = dates[date] = False
+            hour_minute = _HOUR_MINUTE_SECONDS.get(value[11:17])
+            second = _SECOND_VALUES.get(value[17:])
+            if day is not False and hour_minute is not None and second is not None:
+                append(day + hour_minute + second)
+                continue
+        append(to_epoch(value))
+    return epochs
+
+# Same text as datetime.fromtimestamp(t).isoformat() on a UTC host, but the
+# date part is formatted once per day rather than once per value
+def iso_times(epochs, nulls=()):
+    dates = {}
+    rendered = []
+    append = rendered.append
+    for epoch in epochs:
+        day, second = divmod(epoch, 86400)
+        date = dates.get(day)
+        if date is None:
+            date = dates[day] = (_EPOCH + timedelta(days=day)).date().isoformat() + "T"
+        minute, second = divmod(second, 60)
+        append(date + _HOUR_MINUTES[minute] + _SECONDS[second])
+    for row in nulls:
+        rendered[row] = None
+    return rendered
+
+# --- Profiles ---
+def _profile_converter(field_type):
+    if field_type in INTEGER_TYPES:
+        return to_integer
+    # scrape_timestamp stays the string it was given; BigQuery parses it on load
+    if field_type == "TIMESTAMP":
+        return lambda value: value
+    return columnar.CONVERTERS[field_type]
+
+_PROFILE_LAYOUT = [(name, _profile_converter(field_type)) for name, field_type, _ in schemas.PROFILE_FIELDS]
+
+# Missing values are None, never placeholders such as "N/A" or 0
+def profile_record(values):
+    return {name: convert(values.get(name)) for name, convert in _PROFILE_LAYOUT}
+
+# --- Video Batches ---
+def _kind(name, field_type):
+    if name in EPOCH_COLUMNS:
+        return "epoch"
+    return "integer" if field_type in INTEGER_TYPES else "string"
+
+VIDEO_LAYOUT = [(name, _kind(name, field_type)) for name, field_type, _ in schemas.VIDEO_RECORD_FIELDS]
+VIDEO_COLUMNS = [name for name, _ in VIDEO_LAYOUT]
+_KINDS = dict(VIDEO_LAYOUT)
+# json.dumps(row) and fingerprints.record_digest(row) layouts, filled with %
+_JSON_TEMPLATE = "{" + ", ".join(f"{encode_basestring_ascii(name)}: %s" for name in VIDEO_COLUMNS) + "}"
+_DIGEST_ORDER = sorted(range(len(VIDEO_COLUMNS)), key=VIDEO_COLUMNS.__getitem__)
+_DIGEST_TEMPLATE = "{" + ",".join(f"{encode_basestring(VIDEO_COLUMNS[index])}:%s" for index in _DIGEST_ORDER) + "}"
+_URL_INDEX = VIDEO_COLUMNS.index("url")
+_STRING_TYPES = {str, type(None)}
+
+# POST_PATHS as (parent key, [(column index, key)]) groups, so each parent is looked up once
+def _post_sources():
+    sources = {}
+    for name, path in POST_PATHS.items():
+        sources.setdefault(path[0] if len(path) > 1 else None, []).append((VIDEO_COLUMNS.index(name), path[-1]))
+    return list(sources.items())
+
+_POST_SOURCES = _post_sources()
+
+# A post's raw values in VIDEO_COLUMNS order, None for a post without an id
+def _post_values(post, username):
+    video_id = post.get("id")
+    if not video_id:
+        return None
+    values = [None] * len(VIDEO_COLUMNS)
+    values[_URL_INDEX] = f"https://www.tiktok.com/@{username}/video/{video_id}"
+    for parent, keys in _POST_SOURCES:
+        source = post if parent is None else post.get(parent)
+        if type(source) is dict:
+            for index, key in keys:
+                values[index] = source.get(key)
+    return values
+
+# What a JSON line costs besides its values
+_ROW_OVERHEAD = len(_JSON_TEMPLATE) - 2 * len(VIDEO_COLUMNS)
+
+
+class VideoBatch:
+    __slots__ = ("username", "scrape_timestamp", "columns", "nulls", "approx_bytes", "_lines")
+    fields = schemas.VIDEO_RECORD_FIELDS
+
+    def __init__(self, username=None, scrape_timestamp=None):
+        self.username = username
+        self.scrape_timestamp = scrape_timestamp
+        self.columns = {name: [] if kind == "string" else array("q") for name, kind in VIDEO_LAYOUT}
+        # Row indexes of the NULLs in each array-backed column
+        self.nulls = {name: set() for name, kind in VIDEO_LAYOUT if kind != "string"}
+        # Rough encoded size, for callers that flush by size
+        self.approx_bytes = 0
+        # json_lines(), kept because the archive and the staged file both need them
+        self._lines = None
+
+    # Rows are dicts keyed by column, e.g. staged JSON; ISO create_time strings are parsed back
+    @classmethod
+    def from_rows(cls, rows, username=None, scrape_timestamp=None):
+        rows = list(rows)
+        batch = cls(username, scrape_timestamp)
+        batch._extend_columns([[row.get(name) for row in rows] for name in VIDEO_COLUMNS])
+        return batch
+
+    def __len__(self):
+        return len(self.columns["url"])
+
+    def __iter__(self):
+        return (dict(zip(VIDEO_COLUMNS, values)) for values in zip(*(self.column(name) for name in VIDEO_COLUMNS)))
+
+    def __eq__(self, other):
+        if not isinstance(other, VideoBatch):
+            return NotImplemented
+        return self.columns == other.columns and self.nulls == other.nulls
+
+    def __repr__(self):
+        return f"VideoBatch(username={self.username!r}, videos={len(self)})"
+
+    # --- Appending ---
+    def append(self, values):
+        self._append_row([values.get(name) for name in VIDEO_COLUMNS])
+
+    # Appends one post of the rehydration JSON; posts without an id are skipped
+    def append_post(self, post):
+        values = _post_values(post, self.username)
+        if values is None:
+            return False
+        self._append_row(values)
+        return True
+
+    # values in VIDEO_COLUMNS order. Ints go straight into the arrays; anything
+    # else is converted first, and what does not fit is NULL.
+    def _append_row(self, values):
+        self._lines = None
+        row = len(self.columns["url"])
+        size = _ROW_OVERHEAD
+        for (name, kind), value in zip(VIDEO_LAYOUT, values):
+            column = self.columns[name]
+            if kind == "string":
+                if value is not None:
+                    if type(value) is not str:
+                        value = str(value)
+                    size += len(value) + 2
+                column.append(value)
+                continue
+            if kind == "epoch":
+                value = to_epoch(value)
+            elif type(value) is not int:
+                value = to_integer(value)
+            try:
+                column.append(value)
+            except (TypeError, OverflowError):
+                self.nulls[name].add(row)
+                column.append(0)
+            size += 12
+        self.approx_bytes += size
+
+    # Same as append_post for each post, but reads the posts a column at a time
+    def extend_posts(self, posts):
+        posts = [post for post in posts if post.get("id")]
+        if not posts:
+            return 0
+        columns = [None] * len(VIDEO_COLUMNS)
+        columns[_URL_INDEX] = [f"https://www.tiktok.com/@{self.username}/video/{post['id']}" for post in posts]
+        for parent, keys in _POST_SOURCES:
+            sources = posts
+            if parent is not None:
+                sources = [source if type(source) is dict else {} for source in [post.get(parent) for post in posts]]
+            for index, key in keys:
+                columns[index] = [source.get(key) for source in sources]
+        self._extend_columns(columns)
+        return len(posts)
+
+    # Converts whole columns at once: an int column goes into its array in one
+    # call, and only columns holding something else are converted value by value
+    def _extend_columns(self, columns):
+        self._lines = None
+        offset = len(self)
+        size = _ROW_OVERHEAD * len(columns[0]) if columns else 0
+        for (name, kind), values in zip(VIDEO_LAYOUT, columns):
+            if kind == "string":
+                if not set(map(type, values)) <= _STRING_TYPES:
+                    values = [value if value is None or type(value) is str else str(value) for value in values]
+                self.columns[name].extend(values)
+                size += sum(map(len, filter(None, values))) + 2 * len(values)
+                continue
+            size += 12 * len(values)
+            column = self.columns[name]
+            if kind == "epoch":
+                values = to_epochs(values)
+            try:
+                column.extend(values)
+                continue
+            except (TypeError, OverflowError):
+                # extend() keeps what it appended before the bad value
+                del column[offset:]
+            nulls = self.nulls[name]
+            for row, value in enumerate(values, offset):
+                if kind == "integer":
+                    value = to_integer(value)
+                try:
+                    column.append(value)
+                except (TypeError, OverflowError):
+                    nulls.add(row)
+                    column.append(0)
+        self.approx_bytes += size
+
+    def take(self, rows):
+        batch = VideoBatch(self.username, self.scrape_timestamp)
+        for name, kind in VIDEO_LAYOUT:
+            column = self.columns[name]
+            picked = [column[row] for row in rows]
+            batch.columns[name] = picked if kind == "string" else array("q", picked)
+            if kind != "string" and self.nulls[name]:
+                nulls = self.nulls[name]
+                batch.nulls[name] = {index for index, row in enumerate(rows) if row in nulls}
+        batch.approx_bytes = self.approx_bytes * len(rows) // max(len(self), 1)
+        if self._lines is not None:
+            batch._lines = [self._lines[row] for row in rows]
+        return batch
+
+    # --- Reading ---
+    def column(self, name):
+        column = self.columns[name]
+        kind = _KINDS[name]
+        if kind == "string":
+            return list(column)
+        if kind == "epoch":
+            return iso_times(column, self.nulls[name])
+        values = column.tolist()
+        for row in self.nulls[name]:
+            values[row] = None
+        return values
+
+    # digest=True normalises the columns as fingerprints.record_digest does
+    def _encoded_columns(self, encode_string, digest=False):
+        encoded = []
+        for name, kind in VIDEO_LAYOUT:
+            if kind == "integer":
+                values = list(map(str, self.columns[name]))
+                for row in self.nulls[name]:
+                    values[row] = _NULL
+            else:
+                column = self.columns[name] if kind == "string" else self.column(name)
+                if digest and name in fingerprints.SIGNED_URL_FIELDS:
+                    column = [fingerprints.strip_query(value) for value in column]
+                values = [_NULL if value is None else encode_string(value) for value in column]
+            encoded.append(values)
+        return encoded
+
+    # One JSON document per video, exactly as json.dumps(row) writes it
+    def json_lines(self):
+        if self._lines is None:
+            self._lines = [_JSON_TEMPLATE % values for values in zip(*self._encoded_columns(encode_basestring_ascii))]
+        return self._lines
+
+    def to_ndjson(self):
+        return "\n".join(self.json_lines())
+
+    # fingerprints.record_digest of every row
+    def digests(self):
+        encoded = self._encoded_columns(encode_basestring, digest=True)
+        ordered = [encoded[index] for index in _DIGEST_ORDER]
+        return [hashlib.sha256((_DIGEST_TEMPLATE % values).encode("utf-8")).hexdigest() for values in zip(*ordered)]
+
+    # Builds the Arrow columns straight from the buffers; pyarrow is imported here
+    def to_arrow_table(self, schema=None):
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        schema = schema or columnar.arrow_schema(self.fields)
+        length = len(self)
+        arrays = []
+        for name, kind in VIDEO_LAYOUT:
+            column = self.columns[name]
+            if kind == "string":
+                arrays.append(pa.array(column, pa.string()))
+                continue
+            nulls = self.nulls[name]
+            validity = None
+            if nulls:
+                bitmap = bytearray(b"\xff" * ((length + 7) // 8))
+                for row in nulls:
+                    bitmap[row >> 3] &= ~(1 << (row & 7)) & 0xFF
+                validity = pa.py_buffer(bytes(bitmap))
+            buffers = [validity, pa.py_buffer(column.tobytes())]
+            if kind == "epoch":
+                # "2024-01-01 12:00:00" -> "2024-01-01T12:00:00", as iso_times writes it
+                times = pa.Array.from_buffers(pa.timestamp("s"), length, buffers, null_count=len(nulls))
+                arrays.append(pc.utf8_replace_slice(times.cast(pa.string()), start=10, stop=11, replacement="T"))
+            else:
+                arrays.append(pa.Array.from_buffers(pa.int64(), length, buffers, null_count=len(nulls)))
+        return pa.Table.from_arrays(arrays, schema=schema)
@@ -0,0 +1,27 @@
+import json
+import os
+
+# profile_schema.json and videos_schema.json are the single definition of the
+# BigQuery columns. Fields are (name, type, mode) tuples so that importing
+# this module does not pull in google.cloud.bigquery.
+
+SCHEMA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "schemas")
+
+def load_fields(file_name):
+    with open(os.path.join(SCHEMA_DIR, file_name), encoding="utf-8") as f:
+        return [(field["name"], field["type"], field.get("mode", "NULLABLE")) for field in json.load(f)]
+
+PROFILE_FIELDS = load_fields("profile_schema.json")
+VIDEO_FIELDS = load_fields("videos_schema.json")
+# What a scrape extracts per video; scrape_timestamp is stamped on at flush time
+VIDEO_RECORD_FIELDS = [field for field in VIDEO_FIELDS if field[0] != "scrape_timestamp"]
+VIDEO_SNAPSHOT_FIELDS = load_fields("video_snapshots_schema.json")
+DASHBOARD_CREATOR_FIELDS = load_fields("dashboard_creators_schema.json")
+DASHBOARD_VERIFIED_SHARE_FIELDS = load_fields("dashboard_verified_share_schema.json")
+DASHBOARD_TOP_VIDEO_FIELDS = load_fields("dashboard_top_videos_schema.json")
+
+# google.cloud.bigquery is only imported once a schema is actually needed
+def to_schema(fields):
+    from google.cloud import bigquery
+
+    return [bigquery.SchemaField(name, field_type, mode=mode) for name, field_type, mode in fields]
@@ -0,0 +1,138 @@
+import logging
+import os
+
+import batch_loader
+import fingerprints
+import metrics
+import observations
+import raw_pages
+import records
+
+logger = logging.getLogger(__name__)
+
+# Streaming mode for very large profile pages. Instead of holding the page,
+# the decoded rehydration JSON, every video record and the joined NDJSON in
+# memory together, main.process_file_streaming reads the page through
+# json_stream and hands each post to a VideoChunkWriter, which collects them
+# in a records.VideoBatch and, a chunk at a time:
+#
+#   - writes the videos/<username>/<timestamp>.json NDJSON archive through a
+#     resumable upload;
+#   - stages the videos for batch_loader (one pending file per chunk),
+#     running change detection per chunk.
+#
+# STREAM_MEMORY_LIMIT_MB is the working-set ceiling the chunk sizes are
+# derived from. STREAM_MODE picks when to stream: "auto" (pages of at least
+# STREAM_THRESHOLD_MB uncompressed), "always" or "never".
+
+STREAM_MODE = os.environ.get("STREAM_MODE", "auto")
+STREAM_THRESHOLD_MB = float(os.environ.get("STREAM_THRESHOLD_MB", "32"))
+STREAM_MEMORY_LIMIT_MB = float(os.environ.get("STREAM_MEMORY_LIMIT_MB", "64"))
+
+MB = 1024 * 1024
+# Resumable upload chunks must be a multiple of 256 KiB
+UPLOAD_CHUNK_UNIT = 256 * 1024
+# Compressed pages without an uncompressed_bytes entry are assumed to shrink about this much
+ASSUMED_COMPRESSION_RATIO = 10
+
+# --- Memory Budget ---
+# Staged records exist as a batch, JSON and Parquet at some point, so they get
+# an eighth of the ceiling; the read and upload buffers a sixteenth each.
+def staged_chunk_bytes():
+    return max(int(STREAM_MEMORY_LIMIT_MB * MB) // 8, 64 * 1024)
+
+def read_chunk_size():
+    return max(min(raw_pages.READ_CHUNK_SIZE, int(STREAM_MEMORY_LIMIT_MB * MB) // 16), 64 * 1024)
+
+def upload_chunk_size():
+    units = int(STREAM_MEMORY_LIMIT_MB * MB) // 16 // UPLOAD_CHUNK_UNIT
+    return max(units, 1) * UPLOAD_CHUNK_UNIT
+
+def should_stream(page):
+    if STREAM_MODE == "always":
+        return True
+    if STREAM_MODE != "auto":
+        return False
+    size = page.uncompressed_bytes
+    if size is None:
+        size = (page.stored_bytes or 0) * ASSUMED_COMPRESSION_RATIO
+    return size >= STREAM_THRESHOLD_MB * MB
+
+# --- Chunked Video Writer ---
+class VideoChunkWriter:
+    def __init__(self, storage_client, username, profile_data, archive_path, digest_store=None):
+        self.storage_client = storage_client
+        self.username = username
+        self.profile_data = profile_data
+        self.archive_path = archive_path
+        self.digest_store = digest_store
+        self.chunk_limit = staged_chunk_bytes()
+        self.flushed_videos = 0
+        self.changed_videos = 0
+        self.unchanged_videos = 0
+        self.profile_changed = False
+        self.staged_files = []
+        self.tracker = observations.ObservationTracker()
+        self._archive = None
+        self._chunk = records.VideoBatch(profile_data["username"])
+        self._profile_done = False
+
+    @property
+    def videos(self):
+        return self.flushed_videos + len(self._chunk)
+
+    def add_posts(self, posts):
+        for post in posts:
+            if self._chunk.append_post(post) and self._chunk.approx_bytes >= self.chunk_limit:
+                self.flush()
+
+    # Writes the chunk to the archive and stages it; the profile goes with the first chunk
+    def flush(self):
+        videos = self._chunk
+        self._chunk = records.VideoBatch(self.profile_data["username"])
+        if videos:
+            self._write_archive(videos)
+        self.flushed_videos += len(videos)
+        self.tracker.add_batch(videos)
+        profile_data = None if self._profile_done else self.profile_data
+
+        changes = None
+        if self.digest_store is not None:
+            with metrics.span("change_detection"):
+                changes = fingerprints.detect_changes(self.digest_store, self.username, self.profile_data, videos)
+            if self._profile_done or changes.profile_data is None:
+                profile_data = None
+            videos = changes.changed_videos
+            self.unchanged_videos += changes.unchanged_videos
+        self._profile_done = True
+        self.changed_videos += len(videos)
+        self.profile_changed = self.profile_changed or profile_data is not None
+
+        if profile_data is None and not videos:
+            return
+        with metrics.span("gcs_upload"):
+            staged_blob_path = batch_loader.stage_processed(
+                self.storage_client, profile_data, videos,
+                username=self.profile_data["username"], scrape_timestamp=self.profile_data["scrape_timestamp"]
+            )
+        self.staged_files.append(staged_blob_path)
+        if changes is not None:
+            changes.commit(self.digest_store)
+
+    def _write_archive(self, videos):
+        with metrics.span("gcs_upload"):
+            if self._archive is None:
+                blob = self.storage_client.bucket(batch_loader.PROCESSED_BUCKET).blob(self.archive_path)
+                self._archive = blob.open("wt", chunk_size=upload_chunk_size(), content_type="application/json")
+            else:
+                # Same layout as the non-streaming archive: newline-separated, no trailing newline
+                self._archive.write("\n")
+            self._archive.write(videos.to_ndjson())
+
+    def close(self):
+        self.flush()
+        if self._archive is not None:
+            with metrics.span("gcs_upload"):
+                self._archive.close()
+            logger.info(f"Saved processed video data to GCS: {self.archive_path}")
+        logger.info(f"Staged {len(self.staged_files)} chunk(s) of processed data for batch loading.")
@@ -0,0 +1,145 @@
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Clients are built on first use and then kept for the life of the instance,
+# so warm invocations reuse their auth tokens and pooled HTTP connections.
+# The google.cloud imports happen here, on first use, not at module load, so a
+# function only needs the libraries of the clients it actually asks for.
+#
+# process_tiktok_data, scrape_tiktok and recrawl_scheduler each deploy their
+# own directory, so this file is copied into all three; edit them together.
+# tests/test_shared_modules.py fails when the copies differ.
+
+HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", "32"))
+CLOUD_PLATFORM_SCOPE = "https://www.googleapis.com/auth/cloud-platform"
+
+_lock = threading.RLock()
+_clients = {}
+_init_seconds = {}
+_startup = {"logged": False, "modules": {}}
+
+# --- Shared Authorized Session ---
+def _build_http():
+    import google.auth
+    from google.auth.transport.requests import AuthorizedSession
+    from requests.adapters import HTTPAdapter
+
+    credentials, project = google.auth.default(scopes=[CLOUD_PLATFORM_SCOPE])
+    session = AuthorizedSession(credentials)
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+    session.mount("https://", adapter)
+    return session, credentials, project
+
+def _build_storage_client():
+    from google.cloud import storage
+
+    session, credentials, project = get_client("http")
+    return storage.Client(project=project, credentials=credentials, _http=session)
+
+def _build_bigquery_client():
+    from google.cloud import bigquery
+
+    session, credentials, project = get_client("http")
+    return bigquery.Client(project=project, credentials=credentials, _http=session)
+
+# Plain pooled session for outbound calls such as ScrapingBee
+def _build_scraper_session():
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+# For the recrawl scheduler, and for republishing the rest of a batch too big
+# for one scrape_tiktok invocation
+def _build_publisher():
+    from google.cloud import pubsub_v1
+
+    _, credentials, _ = get_client("http")
+    return pubsub_v1.PublisherClient(credentials=credentials)
+
+_BUILDERS = {
+    "http": _build_http,
+    "storage": _build_storage_client,
+    "bigquery": _build_bigquery_client,
+    "scraper_session": _build_scraper_session,
+    "publisher": _build_publisher,
+}
+
+def get_client(name):
+    client = _clients.get(name)
+    if client is not None:
+        return client
+    with _lock:
+        client = _clients.get(name)
+        if client is None:
+            started = time.perf_counter()
+            client = _BUILDERS[name]()
+            _init_seconds[name] = time.perf_counter() - started
+            _clients[name] = client
+    return client
+
+def get_storage_client():
+    return get_client("storage")
+
+def get_bigquery_client():
+    return get_client("bigquery")
+
+def get_scraper_session():
+    return get_client("scraper_session")
+
+def get_publisher():
+    return get_client("publisher")
+
+# Lets local runs and benchmarks swap in stand-ins such as local_gcp,
+# local_scrapingbee or local_pubsub
+def set_clients(storage_client=None, bigquery_client=None, scraper_session=None, publisher=None):
+    with _lock:
+        if storage_client is not None:
+            _clients["storage"] = storage_client
+        if bigquery_client is not None:
+            _clients["bigquery"] = bigquery_client
+        if scraper_session is not None:
+            _clients["scraper_session"] = scraper_session
+        if publisher is not None:
+            _clients["publisher"] = publisher
+
+def reset_clients():
+    with _lock:
+        _clients.clear()
+        _init_seconds.clear()
+
+# --- Startup Timing ---
+def record_module_import(module_name, import_started):
+    _startup["modules"][module_name] = time.perf_counter() - import_started
+    _startup.setdefault("instance_started", import_started)
+
+# Logged once per instance, on its first invocation
+def log_cold_start(function_name):
+    if _startup["logged"]:
+        return
+    _startup["logged"] = True
+    logger.info(json.dumps({
+        "metric": "cold_start",
+        "function": function_name,
+        "import_seconds": {name: round(seconds, 4) for name, seconds in _startup["modules"].items()},
+        "seconds_to_first_invocation": round(time.perf_counter() - _startup.get("instance_started", time.perf_counter()), 4),
+    }))
+
+def log_client_init(function_name):
+    if not _init_seconds:
+        return
+    logger.info(json.dumps({
+        "metric": "client_init",
+        "function": function_name,
+        "init_seconds": {name: round(seconds, 4) for name, seconds in _init_seconds.items()},
+    }))
+    _init_seconds.clear()
@@ -0,0 +1,69 @@
+import itertools
+import threading
+import time
+
+# An in-memory stand-in for the Pub/Sub publisher, for local runs of the
+# scheduler. It keeps every published message per topic and, like a push
+# subscription, hands each one to the callbacks registered with subscribe():
+#
+#   publisher = LocalPublisherClient()
+#   publisher.subscribe(topic, lambda message: scrape(message.data))
+#   run_scheduler(store, source, publisher, publisher.topic_path("p", "scrape-tiktok-topic"))
+
+class LocalMessage:
+    def __init__(self, message_id, data, attributes):
+        self.message_id = message_id
+        self.data = data
+        self.attributes = attributes
+        self.publish_time = time.time()
+
+
+class LocalPublishFuture:
+    def __init__(self, message_id=None, error=None):
+        self.message_id = message_id
+        self.error = error
+
+    def result(self, timeout=None):
+        if self.error is not None:
+            raise self.error
+        return self.message_id
+
+
+class LocalPublisherClient:
+    def __init__(self, fail_after=None):
+        self.messages = {}
+        self.published = 0
+        self._subscribers = {}
+        # Publishes after the first fail_after raise, to exercise partial failures
+        self.fail_after = fail_after
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def topic_path(self, project, topic):
+        return f"projects/{project}/topics/{topic}"
+
+    def subscribe(self, topic, callback):
+        with self._lock:
+            self._subscribers.setdefault(topic, []).append(callback)
+
+    def publish(self, topic, data, **attributes):
+        if not isinstance(data, bytes):
+            raise TypeError("Message data must be bytes")
+        with self._lock:
+            if self.fail_after is not None and self.published >= self.fail_after:
+                return LocalPublishFuture(error=RuntimeError(f"Local publish to {topic} failed"))
+            message = LocalMessage(str(next(self._ids)), data, attributes)
+            self.messages.setdefault(topic, []).append(message)
+            self.published += 1
+            callbacks = list(self._subscribers.get(topic, ()))
+        for callback in callbacks:
+            callback(message)
+        return LocalPublishFuture(message.message_id)
+
+    # Removes and returns up to max_messages published messages, oldest first
+    def pull(self, topic, max_messages=None):
+        with self._lock:
+            messages = self.messages.get(topic, [])
+            count = len(messages) if max_messages is None else max_messages
+            pulled, self.messages[topic] = messages[:count], messages[count:]
+        return pulled
@@ -0,0 +1,49 @@
+import time
+_import_started = time.perf_counter()
+
+import functions_framework
+import json
+import logging
+import os
+import clients
+import metrics
+import scheduler
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PROJECT_ID = os.environ.get("GCP_PROJECT", "training-triggering-pipeline")
+SCRAPE_TOPIC = os.environ.get("SCRAPE_TOPIC", "scrape-tiktok-topic")
+
+clients.record_module_import("recrawl_scheduler", _import_started)
+
+# Invoked by Cloud Scheduler every few minutes. The optional JSON body adds or
+# removes creators and can ask for a dry run (state and report, nothing
+# published or saved):
+#
+#   {"add": ["https://www.tiktok.com/@user"], "remove": [], "dry_run": false}
+@functions_framework.http
+def schedule_recrawls(request):
+    try:
+        body = request.get_json(silent=True) or {}
+        clients.log_cold_start("schedule_recrawls")
+        storage_client = clients.get_storage_client()
+        publisher = clients.get_publisher()
+        with metrics.trace("schedule_recrawls") as trace:
+            result = scheduler.run_scheduler(
+                scheduler.state_store_from_env(storage_client),
+                scheduler.GcsObservationSource(storage_client),
+                publisher,
+                publisher.topic_path(PROJECT_ID, SCRAPE_TOPIC),
+                add_urls=body.get("add", []),
+                remove_urls=body.get("remove", []),
+                dry_run=bool(body.get("dry_run")),
+            )
+            trace.set(**{key: value for key, value in result.items() if key not in ("metric", "report")})
+        logger.info(json.dumps(result))
+        clients.log_client_init("schedule_recrawls")
+        return json.dumps(result), 200, {"Content-Type": "application/json"}
+    except Exception as e:
+        logger.error(f"Error in schedule_recrawls: {str(e)}")
+        raise
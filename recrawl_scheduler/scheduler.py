@@ -0,0 +1,472 @@
+import heapq
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+from google.api_core.exceptions import NotFound, PreconditionFailed
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Adaptive recrawl scheduling. process_tiktok_data leaves one observation per
+# processed scrape (follower and like counts, creation times of the newest
+# videos); each run folds them into a per-creator change velocity, then
+# publishes the creators that are due to scrape-tiktok-topic, most overdue
+# first, within a ScrapingBee credit budget per hour.
+#
+# A scrape's "change" is a score: new videos, plus follower and like growth in
+# percent, each weighted (RECRAWL_WEIGHT_*). Velocity is an exponentially
+# weighted average of change per day, and a creator is next due once about
+# RECRAWL_TARGET_CHANGE worth of change is expected, clamped to
+# [RECRAWL_MIN_INTERVAL_HOURS, RECRAWL_MAX_INTERVAL_HOURS]. Creators with a
+# single observation so far use RECRAWL_DEFAULT_INTERVAL_HOURS.
+#
+# Each publish reserves its estimated credits in the hourly ledger: what the
+# creator's last scrape cost, or RECRAWL_CREDITS_PER_SCRAPE before one is
+# known. Tiered fetching makes most scrapes cost 1 credit and render-only
+# profiles 5, so once the observation reports what the scrape actually cost,
+# the reservation is settled to it.
+#
+# State is one JSON document kept by a StateStore (GCS, a local file or
+# memory), so runs are stateless and any store can be swapped in for tests.
+
+RECRAWL_CREDIT_BUDGET_PER_HOUR = float(os.environ.get("RECRAWL_CREDIT_BUDGET_PER_HOUR", "500"))
+# Reserved for a creator whose scrape cost is not known yet; the render_js
+# cost (5 credits), so the first scrapes never overrun the budget
+RECRAWL_CREDITS_PER_SCRAPE = float(os.environ.get("RECRAWL_CREDITS_PER_SCRAPE", "5"))
+RECRAWL_BATCH_SIZE = int(os.environ.get("RECRAWL_BATCH_SIZE", "10"))
+RECRAWL_TARGET_CHANGE = float(os.environ.get("RECRAWL_TARGET_CHANGE", "1"))
+RECRAWL_MIN_INTERVAL_HOURS = float(os.environ.get("RECRAWL_MIN_INTERVAL_HOURS", "1"))
+RECRAWL_MAX_INTERVAL_HOURS = float(os.environ.get("RECRAWL_MAX_INTERVAL_HOURS", "168"))
+RECRAWL_DEFAULT_INTERVAL_HOURS = float(os.environ.get("RECRAWL_DEFAULT_INTERVAL_HOURS", "24"))
+# A published creator with no observation back by then (failed scrape) is due again
+RECRAWL_RETRY_HOURS = float(os.environ.get("RECRAWL_RETRY_HOURS", "6"))
+RECRAWL_VELOCITY_ALPHA = float(os.environ.get("RECRAWL_VELOCITY_ALPHA", "0.3"))
+RECRAWL_WEIGHT_NEW_VIDEO = float(os.environ.get("RECRAWL_WEIGHT_NEW_VIDEO", "1"))
+RECRAWL_WEIGHT_FOLLOWER_PCT = float(os.environ.get("RECRAWL_WEIGHT_FOLLOWER_PCT", "1"))
+RECRAWL_WEIGHT_LIKE_PCT = float(os.environ.get("RECRAWL_WEIGHT_LIKE_PCT", "0.5"))
+# A scrape counts as useful in the report once it captured at least this much change
+RECRAWL_USEFUL_CHANGE = float(os.environ.get("RECRAWL_USEFUL_CHANGE", "0.5"))
+RECRAWL_STATE = os.environ.get("RECRAWL_STATE", "gcs")
+
+STATE_BUCKET = "tiktok-processed-data"
+STATE_BLOB = "recrawl/state.json"
+OBSERVATIONS_PREFIX = "observations/pending/"
+
+HOUR = 3600.0
+DAY = 24 * HOUR
+# Scrapes closer together than this are treated as this far apart when computing velocity
+MIN_ELAPSED_SECONDS = HOUR
+
+def _epoch(timestamp):
+    if isinstance(timestamp, (int, float)):
+        return float(timestamp)
+    parsed = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+def _number(value):
+    return value if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+def username_for(profile_url):
+    return profile_url.rstrip("/").split("@")[-1]
+
+def empty_state():
+    return {
+        "creators": {},
+        # [epoch, credits, username] for publishes in the last hour
+        "ledger": [],
+        "totals": {
+            "credits": 0.0,
+            "published": 0,
+            "observations": 0,
+            "change": 0.0,
+            "scheduled_scrapes": 0,
+            "scheduled_change": 0.0,
+            "useful_scheduled_scrapes": 0,
+            "new_videos": 0,
+            "follower_delta": 0,
+            "like_delta": 0,
+        },
+    }
+
+# --- State Stores ---
+# load() returns the state and an opaque version; save() only succeeds if the
+# stored state is still at that version, and returns False otherwise.
+class GcsStateStore:
+    def __init__(self, storage_client, bucket_name=STATE_BUCKET, blob_name=STATE_BLOB):
+        self.bucket = storage_client.bucket(bucket_name)
+        self.blob_name = blob_name
+
+    def load(self):
+        blob = self.bucket.blob(self.blob_name)
+        try:
+            payload = blob.download_as_bytes()
+        except NotFound:
+            return empty_state(), 0
+        return json.loads(payload), blob.generation
+
+    def save(self, state, version):
+        blob = self.bucket.blob(self.blob_name)
+        try:
+            blob.upload_from_string(json.dumps(state), content_type="application/json", if_generation_match=version)
+        except PreconditionFailed:
+            return False
+        return True
+
+
+class FileStateStore:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _read(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                document = json.load(f)
+        except FileNotFoundError:
+            return empty_state(), 0
+        return document["state"], document["version"]
+
+    def load(self):
+        with self._lock:
+            return self._read()
+
+    def save(self, state, version):
+        with self._lock:
+            if self._read()[1] != version:
+                return False
+            temporary = f"{self.path}.tmp"
+            with open(temporary, "w", encoding="utf-8") as f:
+                json.dump({"state": state, "version": version + 1}, f)
+            os.replace(temporary, self.path)
+        return True
+
+
+class MemoryStateStore:
+    def __init__(self):
+        self._state = None
+        self._version = 0
+        self._lock = threading.Lock()
+
+    def load(self):
+        with self._lock:
+            if self._state is None:
+                return empty_state(), 0
+            return json.loads(self._state), self._version
+
+    def save(self, state, version):
+        with self._lock:
+            if version != self._version:
+                return False
+            self._state = json.dumps(state)
+            self._version += 1
+        return True
+
+
+def state_store_from_env(storage_client):
+    if RECRAWL_STATE == "gcs":
+        return GcsStateStore(storage_client)
+    if RECRAWL_STATE == "memory":
+        return MemoryStateStore()
+    if RECRAWL_STATE.startswith("file://"):
+        return FileStateStore(RECRAWL_STATE[len("file://"):])
+    raise ValueError(f"Unknown RECRAWL_STATE: {RECRAWL_STATE}")
+
+# --- Observation Sources ---
+# pending() returns (key, observation) pairs; acknowledge() removes them once
+# the state that includes them is saved.
+class GcsObservationSource:
+    def __init__(self, storage_client, bucket_name=STATE_BUCKET, prefix=OBSERVATIONS_PREFIX, max_results=5000):
+        self.bucket = storage_client.bucket(bucket_name)
+        self.client = storage_client
+        self.prefix = prefix
+        self.max_results = max_results
+
+    def pending(self):
+        observations = []
+        for blob in self.client.list_blobs(self.bucket.name, prefix=self.prefix, max_results=self.max_results):
+            try:
+                observations.append((blob.name, json.loads(blob.download_as_bytes())))
+            except NotFound:
+                continue
+        return observations
+
+    def acknowledge(self, keys):
+        for key in keys:
+            try:
+                self.bucket.blob(key).delete()
+            except NotFound:
+                pass
+
+
+class MemoryObservationSource:
+    def __init__(self, observations=None):
+        self.observations = list(observations or [])
+
+    def pending(self):
+        return list(enumerate(self.observations))
+
+    def acknowledge(self, keys):
+        acknowledged = set(keys)
+        self.observations = [observation for index, observation in enumerate(self.observations) if index not in acknowledged]
+
+# --- Scheduler ---
+class RecrawlScheduler:
+    def __init__(self, state=None):
+        self.state = state or empty_state()
+        self.creators = self.state["creators"]
+        self.totals = self.state["totals"]
+        # Min-heap of (next_due, username); stale entries are skipped when popped
+        self._queue = [(creator["next_due"], username) for username, creator in self.creators.items()]
+        heapq.heapify(self._queue)
+
+    def _schedule(self, username, next_due):
+        self.creators[username]["next_due"] = next_due
+        heapq.heappush(self._queue, (next_due, username))
+
+    def add_creator(self, profile_url, now):
+        username = username_for(profile_url)
+        if username in self.creators:
+            return False
+        self.creators[username] = {
+            "profile_url": profile_url,
+            "next_due": now,
+            "velocity": None,
+            "observations": 0,
+            "last": None,
+            "published_at": None,
+            "credits": 0.0,
+            "change": 0.0,
+            # Reserved by the pending publish, and what the last scrape cost
+            "reserved_credits": None,
+            "last_credits": None,
+        }
+        self._schedule(username, now)
+        return True
+
+    def remove_creator(self, profile_url):
+        # Its queue entries go stale and are dropped when popped
+        return self.creators.pop(username_for(profile_url), None) is not None
+
+    def interval_seconds(self, velocity):
+        if velocity is None:
+            hours = RECRAWL_DEFAULT_INTERVAL_HOURS
+        elif velocity <= 0:
+            hours = RECRAWL_MAX_INTERVAL_HOURS
+        else:
+            hours = RECRAWL_TARGET_CHANGE / velocity * 24
+        return min(max(hours, RECRAWL_MIN_INTERVAL_HOURS), RECRAWL_MAX_INTERVAL_HOURS) * HOUR
+
+    # Scores the change since the creator's previous observation (0 for the
+    # first one); returns None for duplicates and out-of-order observations,
+    # which are ignored
+    def observe(self, observation):
+        username = observation["username"]
+        scraped_at = _epoch(observation["scrape_timestamp"])
+        creator = self.creators.get(username)
+        if creator is None:
+            self.add_creator(observation.get("profile_url") or f"https://www.tiktok.com/@{username}", scraped_at)
+            creator = self.creators[username]
+        last = creator["last"]
+        if last is not None and scraped_at <= last["scraped_at"]:
+            return None
+
+        recent_times = observation.get("recent_video_times") or []
+        followers = _number(observation.get("follower_count"))
+        likes = _number(observation.get("total_like_count"))
+        change = 0.0
+        if last is not None:
+            latest_seen = last.get("latest_video_time")
+            new_videos = sum(1 for created in recent_times if created > latest_seen) if latest_seen else 0
+            follower_delta = followers - last["follower_count"] if followers is not None and last["follower_count"] is not None else 0
+            like_delta = likes - last["total_like_count"] if likes is not None and last["total_like_count"] is not None else 0
+            follower_pct = abs(follower_delta) * 100 / max(last["follower_count"] or 0, 1)
+            like_pct = abs(like_delta) * 100 / max(last["total_like_count"] or 0, 1)
+            change = (
+                new_videos * RECRAWL_WEIGHT_NEW_VIDEO
+                + follower_pct * RECRAWL_WEIGHT_FOLLOWER_PCT
+                + like_pct * RECRAWL_WEIGHT_LIKE_PCT
+            )
+            elapsed_days = max(scraped_at - last["scraped_at"], MIN_ELAPSED_SECONDS) / DAY
+            rate = change / elapsed_days
+            velocity = creator["velocity"]
+            creator["velocity"] = rate if velocity is None else RECRAWL_VELOCITY_ALPHA * rate + (1 - RECRAWL_VELOCITY_ALPHA) * velocity
+
+            self.totals["change"] += change
+            self.totals["new_videos"] += new_videos
+            self.totals["follower_delta"] += follower_delta
+            self.totals["like_delta"] += like_delta
+            creator["change"] += change
+            # Credit the change to the scheduler when it asked for this scrape
+            if creator["published_at"] is not None:
+                self.totals["scheduled_scrapes"] += 1
+                self.totals["scheduled_change"] += change
+                if change >= RECRAWL_USEFUL_CHANGE:
+                    self.totals["useful_scheduled_scrapes"] += 1
+
+        creator["last"] = {
+            "scraped_at": scraped_at,
+            "follower_count": followers,
+            "total_like_count": likes,
+            "latest_video_time": recent_times[0] if recent_times else (last or {}).get("latest_video_time"),
+        }
+        credits = _number(observation.get("credits"))
+        if credits is not None:
+            self._settle(username, creator, credits)
+        creator["observations"] += 1
+        creator["published_at"] = None
+        creator["reserved_credits"] = None
+        self.totals["observations"] += 1
+        self._schedule(username, scraped_at + self.interval_seconds(creator["velocity"]))
+        return change
+
+    # Replaces the credits reserved by the publish that asked for this scrape
+    # with what it cost; scrapes the scheduler did not publish are not charged
+    def _settle(self, username, creator, credits):
+        creator["last_credits"] = credits
+        reserved = creator.get("reserved_credits")
+        if creator["published_at"] is None or reserved is None:
+            return
+        creator["credits"] += credits - reserved
+        self.totals["credits"] += credits - reserved
+        for entry in self.state["ledger"]:
+            if entry[2:] == [username] and entry[0] == creator["published_at"]:
+                entry[1] = credits
+
+    def credits_last_hour(self, now):
+        self.state["ledger"] = [entry for entry in self.state["ledger"] if entry[0] > now - HOUR]
+        return sum(entry[1] for entry in self.state["ledger"])
+
+    def estimate_credits(self, creator):
+        last = creator.get("last_credits")
+        return last if last is not None else RECRAWL_CREDITS_PER_SCRAPE
+
+    def due_count(self, now):
+        return sum(1 for creator in self.creators.values() if creator["next_due"] <= now)
+
+    # Picks the due creators the remaining hourly budget allows, most overdue
+    # first, and marks them published; the rest stay queued for the next run.
+    # A creator too expensive for what is left does not hold back cheaper due
+    # creators behind it; it stays queued at its place.
+    def plan(self, now):
+        available = RECRAWL_CREDIT_BUDGET_PER_HOUR - self.credits_last_hour(now)
+        selected = []
+        deferred = []
+        while self._queue and self._queue[0][0] <= now and available > 0:
+            next_due, username = heapq.heappop(self._queue)
+            creator = self.creators.get(username)
+            if creator is None or creator["next_due"] != next_due:
+                continue
+            credits = self.estimate_credits(creator)
+            if credits > available:
+                deferred.append((next_due, username))
+                continue
+            selected.append((username, credits))
+            available -= credits
+        for entry in deferred:
+            heapq.heappush(self._queue, entry)
+        for username, credits in selected:
+            creator = self.creators[username]
+            creator["published_at"] = now
+            creator["reserved_credits"] = credits
+            creator["credits"] += credits
+            self._schedule(username, now + RECRAWL_RETRY_HOURS * HOUR)
+            self.state["ledger"].append([now, credits, username])
+            self.totals["credits"] += credits
+        self.totals["published"] += len(selected)
+        return [self.creators[username]["profile_url"] for username, _ in selected]
+
+    # --- Report ---
+    def report(self, now, top=5):
+        totals = self.totals
+        credits = totals["credits"]
+        fastest = sorted(
+            (creator for creator in self.creators.items() if creator[1]["velocity"] is not None),
+            key=lambda item: item[1]["velocity"], reverse=True,
+        )[:top]
+        return {
+            "creators": len(self.creators),
+            "due": self.due_count(now),
+            "credits_spent": credits,
+            "credits_last_hour": self.credits_last_hour(now),
+            "budget_per_hour": RECRAWL_CREDIT_BUDGET_PER_HOUR,
+            "published": totals["published"],
+            "credits_per_scrape": round(credits / totals["published"], 4) if totals["published"] else None,
+            "change_captured": round(totals["scheduled_change"], 4),
+            "change_per_credit": round(totals["scheduled_change"] / credits, 6) if credits else None,
+            "useful_scrape_ratio": (
+                round(totals["useful_scheduled_scrapes"] / totals["scheduled_scrapes"], 4) if totals["scheduled_scrapes"] else None
+            ),
+            "new_videos": totals["new_videos"],
+            "follower_delta": totals["follower_delta"],
+            "like_delta": totals["like_delta"],
+            "fastest_creators": [
+                {"username": username, "velocity_per_day": round(creator["velocity"], 4),
+                 "interval_hours": round(self.interval_seconds(creator["velocity"]) / HOUR, 2)}
+                for username, creator in fastest
+            ],
+        }
+
+# --- One Scheduler Run ---
+def _publish(publisher, topic, urls):
+    published = []
+    for start in range(0, len(urls), RECRAWL_BATCH_SIZE):
+        batch = urls[start:start + RECRAWL_BATCH_SIZE]
+        # scrape_tiktok accepts a JSON list of profile URLs
+        publisher.publish(topic, json.dumps(batch).encode("utf-8")).result()
+        published.extend(batch)
+    return published
+
+# Folds pending observations in, plans within budget, saves the state and
+# then publishes; saving first means two overlapping runs never publish the
+# same creators twice (the loser's save fails and it publishes nothing).
+def run_scheduler(store, observation_source, publisher, topic, now=None, add_urls=(), remove_urls=(), dry_run=False):
+    now = time.time() if now is None else now
+    with metrics.span("load_state"):
+        state, version = store.load()
+    scheduler = RecrawlScheduler(state)
+
+    added = sum(1 for url in add_urls if scheduler.add_creator(url, now))
+    removed = sum(1 for url in remove_urls if scheduler.remove_creator(url))
+    with metrics.span("observations"):
+        pending = observation_source.pending()
+    applied = 0
+    for _, observation in pending:
+        if scheduler.observe(observation) is not None:
+            applied += 1
+
+    urls = [] if dry_run else scheduler.plan(now)
+    result = {
+        "metric": "recrawl_run",
+        "added": added,
+        "removed": removed,
+        "observations": len(pending),
+        "observations_applied": applied,
+        "published": 0,
+        "backlog": scheduler.due_count(now),
+        "dry_run": dry_run,
+    }
+    if dry_run:
+        result["report"] = scheduler.report(now)
+        return result
+
+    with metrics.span("save_state"):
+        saved = store.save(scheduler.state, version)
+    if not saved:
+        logger.warning("Recrawl state changed during this run (overlapping run?); nothing published.")
+        result["conflict"] = True
+        return result
+    with metrics.span("observations"):
+        observation_source.acknowledge([key for key, _ in pending])
+
+    with metrics.span("publish"):
+        # Creators whose batch fails come due again after RECRAWL_RETRY_HOURS
+        result["published"] = len(_publish(publisher, topic, urls))
+    result["report"] = scheduler.report(now)
+    return result
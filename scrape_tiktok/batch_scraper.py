@@ -0,0 +1,130 @@
+import json
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Concurrency, rate limiting and retry policy for fetching many profiles per
+# invocation. Every attempt, including retries, takes a token from the
+# bucket, since ScrapingBee bills and throttles per request.
+
+SCRAPE_CONCURRENCY = int(os.environ.get("SCRAPE_CONCURRENCY", "5"))
+SCRAPE_RATE_PER_SECOND = float(os.environ.get("SCRAPE_RATE_PER_SECOND", "2"))
+SCRAPE_BURST = int(os.environ.get("SCRAPE_BURST", "5"))
+SCRAPE_MAX_RETRIES = int(os.environ.get("SCRAPE_MAX_RETRIES", "4"))
+SCRAPE_BACKOFF_BASE_SECONDS = float(os.environ.get("SCRAPE_BACKOFF_BASE_SECONDS", "1"))
+SCRAPE_BACKOFF_MAX_SECONDS = float(os.environ.get("SCRAPE_BACKOFF_MAX_SECONDS", "30"))
+SCRAPE_TIMEOUT_SECONDS = float(os.environ.get("SCRAPE_TIMEOUT_SECONDS", "120"))
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# --- Token Bucket Rate Limiter ---
+class TokenBucket:
+    def __init__(self, rate, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = max(1, capacity or 1)
+        self._tokens = float(self.capacity)
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return 0.0
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                wait = (1 - self._tokens) / self.rate
+            self._sleep(wait)
+            waited += wait
+
+# --- Fetch with Exponential Backoff ---
+class FetchError(Exception):
+    def __init__(self, message, status_code=None, attempts=0):
+        super().__init__(message)
+        self.status_code = status_code
+        self.attempts = attempts
+
+def backoff_seconds(attempt, response=None):
+    if response is not None:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), SCRAPE_BACKOFF_MAX_SECONDS)
+    delay = min(SCRAPE_BACKOFF_MAX_SECONDS, SCRAPE_BACKOFF_BASE_SECONDS * (2 ** attempt))
+    # Full jitter keeps concurrent workers from retrying in lockstep
+    return random.uniform(0, delay)
+
+def fetch_with_retries(session, url, params, rate_limiter=None, max_retries=None, timeout=None, sleep=time.sleep):
+    max_retries = SCRAPE_MAX_RETRIES if max_retries is None else max_retries
+    timeout = SCRAPE_TIMEOUT_SECONDS if timeout is None else timeout
+    attempt = 0
+    while True:
+        if rate_limiter is not None:
+            with metrics.span("rate_limit_wait"):
+                rate_limiter.acquire()
+        response = None
+        try:
+            response = session.get(url, params=params, timeout=timeout)
+            if response.status_code not in RETRYABLE_STATUS_CODES:
+                response.raise_for_status()
+                return response, attempt + 1
+            error = FetchError(f"HTTP {response.status_code}", response.status_code, attempt + 1)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            error = FetchError(f"{type(e).__name__}: {e}", None, attempt + 1)
+        except requests.HTTPError as e:
+            raise FetchError(str(e), response.status_code, attempt + 1)
+        if attempt >= max_retries:
+            raise error
+        delay = backoff_seconds(attempt, response)
+        logger.warning(f"Retrying {params.get('url', url)} in {delay:.2f}s after {error}")
+        with metrics.span("retry_backoff"):
+            sleep(delay)
+        attempt += 1
+
+# --- Run a Batch Concurrently ---
+def _percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return round(ordered[index], 4)
+
+def run_batch(items, worker, concurrency=None):
+    concurrency = SCRAPE_CONCURRENCY if concurrency is None else concurrency
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(items) or 1))) as executor:
+        results = list(executor.map(worker, items))
+    elapsed = time.perf_counter() - started
+
+    latencies = [result["latency_seconds"] for result in results if result["ok"]]
+    summary = {
+        "metric": "scrape_batch",
+        "urls": len(results),
+        "succeeded": sum(1 for result in results if result["ok"]),
+        "failed": sum(1 for result in results if not result["ok"]),
+        "attempts": sum(result["attempts"] for result in results),
+        "credits": sum(result.get("credits", 0) for result in results),
+        "tiers": {tier: sum(1 for result in results if result.get("tier") == tier) for tier in ("plain", "render")},
+        "elapsed_seconds": round(elapsed, 4),
+        "urls_per_second": round(len(results) / elapsed, 4) if elapsed else None,
+        "latency_p50_seconds": _percentile(latencies, 0.5),
+        "latency_p95_seconds": _percentile(latencies, 0.95),
+        "latency_max_seconds": _percentile(latencies, 1.0),
+    }
+    logger.info(json.dumps(summary))
+    return results, summary
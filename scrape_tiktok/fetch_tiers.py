@@ -0,0 +1,208 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+from google.api_core.exceptions import NotFound
+
+import batch_scraper
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Tiered fetching. process_tiktok_data only needs the rehydration payload
+# (webapp.user-detail), which TikTok often serves in the plain HTML, so a
+# profile is first fetched without JS rendering (1 ScrapingBee credit) and
+# only escalated to render_js (5 credits, and seconds slower) when that page
+# has no usable payload.
+#
+# Rendered fetches wait SCRAPE_RENDER_WAIT_MS instead of a fixed 5s. A
+# rendered page that still lacks the payload is fetched again with twice the
+# wait (up to SCRAPE_RENDER_MAX_WAIT_MS), and the wait that worked is
+# remembered per profile. Waits only grow: a wait that is too short costs
+# another rendered fetch, one that is too long only costs time.
+#
+# The tier that worked is kept per profile by a TierStore (FETCH_TIER_STORE:
+# "gcs", "memory" or "none"), so later scrapes of a render-only profile skip
+# the plain attempt. The plain tier is re-probed every
+# SCRAPE_PLAIN_REPROBE_HOURS, in case the profile starts serving it again.
+# SCRAPE_FETCH_MODE=render restores the old single render_js fetch.
+
+SCRAPE_FETCH_MODE = os.environ.get("SCRAPE_FETCH_MODE", "tiered")
+SCRAPE_RENDER_WAIT_MS = int(os.environ.get("SCRAPE_RENDER_WAIT_MS", "1500"))
+SCRAPE_RENDER_MAX_WAIT_MS = int(os.environ.get("SCRAPE_RENDER_MAX_WAIT_MS", "5000"))
+SCRAPE_PLAIN_REPROBE_HOURS = float(os.environ.get("SCRAPE_PLAIN_REPROBE_HOURS", "72"))
+FETCH_TIER_STORE = os.environ.get("FETCH_TIER_STORE", "gcs")
+
+TIER_BUCKET = "tiktok-processed-data"
+TIER_PREFIX = "fetch_tiers/"
+LEGACY_WAIT_MS = 5000
+# ScrapingBee bills successful requests only: 1 credit plain, 5 with render_js
+TIER_CREDITS = {"plain": 1, "render": 5}
+
+_REHYDRATION_SCRIPT = re.compile(
+    r"""<script\b[^>]*\bid\s*=\s*["']?__UNIVERSAL_DATA_FOR_REHYDRATION__["']?[^>]*>(.*?)</script""",
+    re.IGNORECASE | re.DOTALL,
+)
+
+# --- Payload Check ---
+# Usable means process_tiktok_data will find a profile in it, not just that
+# the script tag exists: blocked pages carry an empty webapp.user-detail.
+def has_profile_payload(html_content):
+    match = _REHYDRATION_SCRIPT.search(html_content)
+    if match is None:
+        return False
+    try:
+        user_detail = json.loads(match.group(1))["__DEFAULT_SCOPE__"]["webapp.user-detail"]
+        return bool(user_detail["userInfo"]["user"]["uniqueId"])
+    except (ValueError, KeyError, TypeError):
+        return False
+
+# --- Tier Stores ---
+# get() returns the profile's tier record or None; put() overwrites it. A
+# record looks like
+#   {"tier": "render", "render_wait_ms": 3000, "plain_probed_at": 1700000000.0}
+class GcsTierStore:
+    def __init__(self, storage_client, bucket_name=TIER_BUCKET, prefix=TIER_PREFIX):
+        self.bucket = storage_client.bucket(bucket_name)
+        self.prefix = prefix
+        # Warm instances skip the read for profiles they have already seen
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def get(self, username):
+        with self._lock:
+            if username in self._cache:
+                return self._cache[username]
+        try:
+            record = json.loads(self.bucket.blob(f"{self.prefix}{username}.json").download_as_bytes())
+        except NotFound:
+            record = None
+        with self._lock:
+            self._cache[username] = record
+        return record
+
+    def put(self, username, record):
+        self.bucket.blob(f"{self.prefix}{username}.json").upload_from_string(
+            json.dumps(record), content_type="application/json"
+        )
+        with self._lock:
+            self._cache[username] = record
+
+
+class MemoryTierStore:
+    def __init__(self):
+        self.records = {}
+        self._lock = threading.Lock()
+
+    def get(self, username):
+        with self._lock:
+            return self.records.get(username)
+
+    def put(self, username, record):
+        with self._lock:
+            self.records[username] = record
+
+
+def tier_store_from_env(storage_client):
+    if FETCH_TIER_STORE == "gcs":
+        return GcsTierStore(storage_client)
+    if FETCH_TIER_STORE == "memory":
+        return MemoryTierStore()
+    if FETCH_TIER_STORE == "none":
+        return None
+    raise ValueError(f"Unknown FETCH_TIER_STORE: {FETCH_TIER_STORE}")
+
+# The profile's username, as used for raw page paths and tier records
+def username_for(profile_url):
+    return profile_url.rstrip("/").split("@")[-1]
+
+# --- Tier Plan ---
+def _params(api_key, profile_url, tier, wait_ms=None):
+    params = {"api_key": api_key, "url": profile_url}
+    if tier == "plain":
+        params["render_js"] = "false"
+    else:
+        params["render_js"] = "true"
+        params["wait"] = str(wait_ms)
+    return params
+
+def plan_tiers(record, now):
+    wait_ms = SCRAPE_RENDER_WAIT_MS if record is None else record.get("render_wait_ms", SCRAPE_RENDER_WAIT_MS)
+    if record is not None and record.get("tier") == "render":
+        probed_at = record.get("plain_probed_at") or 0
+        if now - probed_at < SCRAPE_PLAIN_REPROBE_HOURS * 3600:
+            return ["render"], wait_ms
+    return ["plain", "render"], wait_ms
+
+# --- Tiered Fetch ---
+# Returns the last response (with a usable payload whenever any tier had one)
+# and a summary of what it took. The page is returned even without a payload:
+# process_tiktok_data still has its HTML fallback. A plain fetch that fails
+# outright (blocked, or out of retries) escalates to render_js too; only a
+# failed rendered fetch raises FetchError.
+def fetch_profile(session, scrapingbee_url, api_key, profile_url, rate_limiter=None, store=None):
+    if SCRAPE_FETCH_MODE == "render":
+        params = _params(api_key, profile_url, "render", LEGACY_WAIT_MS)
+        response, attempts = batch_scraper.fetch_with_retries(session, scrapingbee_url, params, rate_limiter=rate_limiter)
+        return response, {"tier": "render", "attempts": attempts, "credits": TIER_CREDITS["render"],
+                          "fetches": 1, "wait_ms": LEGACY_WAIT_MS, "payload": has_profile_payload(response.text)}
+
+    username = username_for(profile_url)
+    now = time.time()
+    record = store.get(username) if store is not None else None
+    tiers, wait_ms = plan_tiers(record, now)
+    summary = {"tier": None, "attempts": 0, "credits": 0, "fetches": 0, "wait_ms": None, "payload": False}
+    response = None
+    plain_probed = False
+    for tier in tiers:
+        while True:
+            params = _params(api_key, profile_url, tier, wait_ms)
+            plain_probed = plain_probed or tier == "plain"
+            try:
+                with metrics.span(f"fetch_{tier}"):
+                    response, attempts = batch_scraper.fetch_with_retries(session, scrapingbee_url, params, rate_limiter=rate_limiter)
+            except batch_scraper.FetchError as e:
+                summary["attempts"] += e.attempts
+                if tier != "plain":
+                    e.attempts = summary["attempts"]
+                    raise
+                # Failed requests are not billed, so the plain attempt cost nothing
+                logger.warning(f"Plain fetch of {profile_url} failed ({e}), escalating to render_js")
+                break
+            summary["attempts"] += attempts
+            summary["credits"] += TIER_CREDITS[tier]
+            summary["fetches"] += 1
+            summary["tier"] = tier
+            summary["payload"] = has_profile_payload(response.text)
+            if tier == "render":
+                summary["wait_ms"] = wait_ms
+            if summary["payload"] or tier == "plain" or wait_ms >= SCRAPE_RENDER_MAX_WAIT_MS:
+                break
+            wait_ms = min(wait_ms * 2, SCRAPE_RENDER_MAX_WAIT_MS)
+            logger.info(f"No profile payload for {profile_url} after rendering, retrying with wait={wait_ms}ms")
+        if summary["payload"]:
+            break
+        if tier == "plain" and response is not None:
+            logger.info(f"No profile payload in the plain page for {profile_url}, escalating to render_js")
+
+    if store is not None:
+        _remember(store, username, record, summary, wait_ms, now if plain_probed else None)
+    return response, summary
+
+# Only writes when something changed, so steady profiles cost no extra GCS writes
+def _remember(store, username, record, summary, wait_ms, plain_probed_at):
+    updated = dict(record or {})
+    if summary["payload"]:
+        updated["tier"] = summary["tier"]
+    if summary["tier"] == "render":
+        updated["render_wait_ms"] = wait_ms
+    if plain_probed_at is not None and updated.get("tier") == "render":
+        updated["plain_probed_at"] = plain_probed_at
+    if updated != (record or {}):
+        try:
+            store.put(username, updated)
+        except Exception as e:
+            logger.warning(f"Could not save the fetch tier for {username}: {e}")
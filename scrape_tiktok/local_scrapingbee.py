@@ -0,0 +1,181 @@
+import argparse
+import json
+import os
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# A local stand-in for the ScrapingBee API, so scraping can be exercised
+# without credits. Point the function at it with SCRAPINGBEE_URL:
+#
+#   python local_scrapingbee.py --port 8765 --pages-dir ./recorded
+#   SCRAPINGBEE_URL=http://127.0.0.1:8765/api/v1/ functions-framework --target=scrape_tiktok
+#
+# Pages come from page_for(profile_url, params) when given, else from
+# <pages_dir>/<username>.html, else a small synthetic profile page.
+# Throttling and server errors can be injected to exercise retries.
+#
+# For tiered fetching, a js_only_fraction of profiles (picked by username, so
+# the same ones every time) answer plain fetches with an app shell that has
+# no rehydration payload, and rendered fetches only carry it when their wait
+# reaches render_ready_ms. Rendering takes wait * render_time_scale seconds,
+# and credits counts what ScrapingBee would have billed (1 plain, 5 rendered).
+
+APP_SHELL = "<html><head><title>TikTok</title></head><body><div id=\"app\"></div><script src=\"/app.js\"></script></body></html>"
+
+def synthetic_page(profile_url, posts=3):
+    username = profile_url.rstrip("/").split("@")[-1]
+    data = {
+        "__DEFAULT_SCOPE__": {
+            "webapp.user-detail": {
+                "userInfo": {
+                    "user": {"uniqueId": username, "id": str(zlib.crc32(username.encode("utf-8"))), "nickname": username},
+                    "stats": {"followingCount": 1, "followerCount": 100, "heartCount": 1000},
+                },
+                "itemList": [
+                    {"id": str(7000000000000000000 + index), "createTime": 1700000000 + index,
+                     "desc": f"video {index}", "stats": {"playCount": 10 * index, "diggCount": index}}
+                    for index in range(posts)
+                ],
+            }
+        }
+    }
+    return (
+        "<html><head><script id=\"__UNIVERSAL_DATA_FOR_REHYDRATION__\" type=\"application/json\">"
+        + json.dumps(data)
+        + "</script></head><body></body></html>"
+    )
+
+
+class LocalScrapingBee:
+    def __init__(self, page_for=None, pages_dir=None, latency_seconds=0.0, throttle_first=0,
+                 error_rate=0.0, retry_after=None, js_only_fraction=0.0, render_ready_ms=0,
+                 render_time_scale=0.0, host="127.0.0.1", port=0):
+        self.page_for = page_for
+        self.pages_dir = pages_dir
+        self.latency_seconds = latency_seconds
+        # The first N requests for each profile URL get a 429
+        self.throttle_first = throttle_first
+        # Fraction of the remaining requests answered with a 503
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.js_only_fraction = js_only_fraction
+        self.render_ready_ms = render_ready_ms
+        self.render_time_scale = render_time_scale
+        self.credits = 0
+        self.requests = []
+        self._seen = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/api/v1/"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _page(self, profile_url, params):
+        if self.page_for is not None:
+            return self.page_for(profile_url, params)
+        if self.pages_dir:
+            path = os.path.join(self.pages_dir, profile_url.rstrip("/").split("@")[-1] + ".html")
+            if os.path.exists(path):
+                with open(path, encoding="utf-8") as f:
+                    return f.read()
+        return synthetic_page(profile_url)
+
+    def js_only(self, profile_url):
+        username = profile_url.rstrip("/").split("@")[-1]
+        return zlib.crc32(username.encode("utf-8")) % 1000 < self.js_only_fraction * 1000
+
+    def _respond(self, params):
+        profile_url = params.get("url", "")
+        with self._lock:
+            self.requests.append(params)
+            seen = self._seen.get(profile_url, 0)
+            self._seen[profile_url] = seen + 1
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        if not params.get("api_key"):
+            return 401, '{"message": "Missing api_key"}', {}
+        if seen < self.throttle_first:
+            headers = {"Retry-After": str(self.retry_after)} if self.retry_after is not None else {}
+            return 429, '{"message": "Too many concurrent requests"}', headers
+        if self.error_rate and random.random() < self.error_rate:
+            return 503, '{"message": "Service unavailable"}', {}
+        page = self._page(profile_url, params)
+        if page is None:
+            return 404, '{"message": "Not found"}', {}
+        # ScrapingBee renders unless told not to
+        rendered = params.get("render_js", "true") != "false"
+        wait_ms = int(params.get("wait", "0")) if rendered else 0
+        if rendered and self.render_time_scale:
+            time.sleep(wait_ms / 1000 * self.render_time_scale)
+        with self._lock:
+            self.credits += 5 if rendered else 1
+        if self.js_only(profile_url) and (not rendered or wait_ms < self.render_ready_ms):
+            return 200, APP_SHELL, {}
+        return 200, page, {}
+
+    def _handler_class(self):
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                query = parse_qs(urlparse(self.path).query)
+                params = {key: values[0] for key, values in query.items()}
+                status, body, headers = stand_in._respond(params)
+                payload = body.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "text/html; charset=utf-8" if status == 200 else "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a local ScrapingBee stand-in.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--pages-dir", default=None, help="Directory of recorded <username>.html pages")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before answering")
+    parser.add_argument("--throttle-first", type=int, default=0, help="Answer the first N requests per URL with 429")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 503")
+    parser.add_argument("--js-only-fraction", type=float, default=0.0, help="Fraction of profiles that need render_js")
+    parser.add_argument("--render-ready-ms", type=int, default=0, help="Render wait before the payload appears")
+    parser.add_argument("--render-time-scale", type=float, default=0.0, help="Seconds of rendering per second of wait")
+    args = parser.parse_args()
+    stand_in = LocalScrapingBee(pages_dir=args.pages_dir, latency_seconds=args.latency,
+                                throttle_first=args.throttle_first, error_rate=args.error_rate,
+                                js_only_fraction=args.js_only_fraction, render_ready_ms=args.render_ready_ms,
+                                render_time_scale=args.render_time_scale, port=args.port)
+    print(f"Local ScrapingBee listening on {stand_in.url}")
+    try:
+        stand_in._server.serve_forever()
+    except KeyboardInterrupt:
+        stand_in.stop()
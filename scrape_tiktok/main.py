@@ -1,48 +1,194 @@
+import time
+_import_started = time.perf_counter()
+
 import functions_framework
-from google.cloud import storage
-import requests
 import base64
+import json
 import logging
-import time
 import os
+import batch_scraper
+import clients
+import fetch_tiers
+import metrics
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+SCRAPINGBEE_URL = os.environ.get("SCRAPINGBEE_URL", "https://app.scrapingbee.com/api/v1/")
+RAW_BUCKET = "tiktok-raw-data"
+PROJECT_ID = os.environ.get("GCP_PROJECT", "training-triggering-pipeline")
+SCRAPE_TOPIC = os.environ.get("SCRAPE_TOPIC", "scrape-tiktok-topic")
+# Most URLs one invocation scrapes: at the default SCRAPE_RATE_PER_SECOND of 2,
+# 200 take about 100 seconds, which leaves room for retries and render_js
+# fetches within the 300 second timeout. Longer lists are split, see split_batch.
+SCRAPE_MAX_BATCH = int(os.environ.get("SCRAPE_MAX_BATCH", "200"))
+# none, gzip or zstd; the codec ends up in the object name and metadata
+RAW_COMPRESSION = os.environ.get("RAW_COMPRESSION", "none")
+RAW_CODECS = {
+    "none": ("", "text/html"),
+    "gzip": (".gz", "application/gzip"),
+    "zstd": (".zst", "application/zstd"),
+}
+
+# Shared by every invocation on this instance, so warm instances stay within the rate
+rate_limiter = batch_scraper.TokenBucket(batch_scraper.SCRAPE_RATE_PER_SECOND, batch_scraper.SCRAPE_BURST)
+_tier_store = {}
+
+clients.record_module_import("scrape_tiktok", _import_started)
+
+# --- Read Profile URLs from a Message ---
+# A message is either a single profile URL (one per line also works), a JSON
+# list of URLs, or a JSON object with "urls" and/or "url_file" (a gs:// or
+# local text file with one URL per line).
+def read_url_file(location):
+    if location.startswith("gs://"):
+        bucket_name, _, blob_name = location[len("gs://"):].partition("/")
+        return clients.get_storage_client().bucket(bucket_name).blob(blob_name).download_as_text()
+    with open(location, encoding="utf-8") as f:
+        return f.read()
+
+def _url_lines(text):
+    return [line.strip() for line in text.splitlines() if line.strip() and not line.strip().startswith("#")]
+
+def parse_profile_urls(message_text):
+    message_text = message_text.strip()
+    profile_urls = []
+    if message_text.startswith(("[", "{")):
+        payload = json.loads(message_text)
+        if isinstance(payload, list):
+            profile_urls.extend(payload)
+        else:
+            profile_urls.extend(payload.get("urls", []))
+            if payload.get("url_file"):
+                profile_urls.extend(_url_lines(read_url_file(payload["url_file"])))
+    else:
+        profile_urls.extend(_url_lines(message_text))
+    return list(dict.fromkeys(url.strip() for url in profile_urls if url and url.strip()))
+
+# --- Split Batches Too Big for One Invocation ---
+# The first SCRAPE_MAX_BATCH URLs are scraped here and the rest go back to
+# scrape-tiktok-topic as JSON lists of at most SCRAPE_MAX_BATCH, so a
+# watchlist of thousands never runs into the function timeout (after which
+# the redelivered message would start over). Publishing happens before any
+# scraping: if it fails, the message is redelivered with nothing scraped yet.
+def split_batch(profile_urls, max_batch=None):
+    max_batch = SCRAPE_MAX_BATCH if max_batch is None else max_batch
+    if len(profile_urls) <= max_batch:
+        return profile_urls
+    publisher = clients.get_publisher()
+    topic = publisher.topic_path(PROJECT_ID, SCRAPE_TOPIC)
+    futures = [
+        publisher.publish(topic, json.dumps(profile_urls[start:start + max_batch]).encode("utf-8"))
+        for start in range(max_batch, len(profile_urls), max_batch)
+    ]
+    for future in futures:
+        future.result()
+    logger.info(f"Republished {len(profile_urls) - max_batch} of {len(profile_urls)} URLs as {len(futures)} batch(es).")
+    return profile_urls[:max_batch]
+
+# --- Compress Raw HTML ---
+def encode_raw_page(html_content, codec):
+    data = html_content.encode("utf-8")
+    if codec == "gzip":
+        import gzip
+
+        return gzip.compress(data, compresslevel=6)
+    if codec == "zstd":
+        import zstandard
+
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    return data
+
+# --- Scrape One Profile ---
+# Built on first use, like the clients, and kept for the life of the instance
+def get_tier_store():
+    if "store" not in _tier_store:
+        _tier_store["store"] = fetch_tiers.tier_store_from_env(clients.get_storage_client())
+    return _tier_store["store"]
+
+# Each profile is one trace, logged as a "scrape_url" metric with its spans
+def scrape_profile(profile_url, scrapingbee_api_key):
+    with metrics.trace("scrape_tiktok", metric="scrape_url", url=profile_url) as trace:
+        result = _scrape_profile(profile_url, scrapingbee_api_key)
+        trace.set(**{key: value for key, value in result.items() if key not in ("metric", "url")})
+    return result
+
+def _scrape_profile(profile_url, scrapingbee_api_key):
+    started = time.perf_counter()
+    result = {"metric": "scrape_url", "url": profile_url, "ok": False, "status": None, "attempts": 0, "bytes": 0, "error": None}
+    try:
+        # Use ScrapingBee to fetch the page, without JS rendering when the plain page has the payload
+        with metrics.span("fetch"):
+            response, fetch = fetch_tiers.fetch_profile(
+                clients.get_scraper_session(), SCRAPINGBEE_URL, scrapingbee_api_key, profile_url,
+                rate_limiter=rate_limiter, store=get_tier_store(),
+            )
+        result["status"] = response.status_code
+        result.update(fetch)
+        html_content = response.text
+        logger.info(f"Successfully fetched {profile_url} using ScrapingBee ({fetch['tier']} tier, {fetch['credits']} credits).")
+
+        # Save the HTML to Google Cloud Storage
+        storage_client = clients.get_storage_client()
+        bucket = storage_client.bucket(RAW_BUCKET)
+        timestamp = time.strftime("%Y%m%d-%H%M%S")
+        username = fetch_tiers.username_for(profile_url)
+        extension, content_type = RAW_CODECS[RAW_COMPRESSION]
+        blob_path = f"profiles/{username}/{timestamp}.html{extension}"
+        blob = bucket.blob(blob_path)
+        # What the fetch cost, for the recrawl scheduler's credit ledger
+        blob.metadata = {"credits": str(fetch["credits"])}
+        if RAW_COMPRESSION == "none":
+            with metrics.span("gcs_upload"):
+                blob.upload_from_string(html_content, content_type=content_type)
+            stored_bytes = len(html_content)
+        else:
+            with metrics.span("compress"):
+                data = encode_raw_page(html_content, RAW_COMPRESSION)
+            blob.metadata.update({"codec": RAW_COMPRESSION, "uncompressed_bytes": str(len(html_content))})
+            with metrics.span("gcs_upload"):
+                blob.upload_from_string(data, content_type=content_type)
+            stored_bytes = len(data)
+        logger.info(f"Saved raw HTML to gs://{RAW_BUCKET}/{blob_path}")
+        result["ok"] = True
+        result["bytes"] = len(html_content)
+        result["stored_bytes"] = stored_bytes
+    except batch_scraper.FetchError as e:
+        result["status"] = e.status_code
+        result["attempts"] = e.attempts
+        result["error"] = str(e)
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["latency_seconds"] = round(time.perf_counter() - started, 4)
+    if not result["ok"]:
+        logger.error(f"Error scraping {profile_url}: {result['error']}")
+    return result
+
 @functions_framework.cloud_event
 def scrape_tiktok(cloud_event):
     try:
-        # Extract the TikTok profile URL from the Pub/Sub message
+        # Extract the TikTok profile URLs from the Pub/Sub message
         data = cloud_event.data["message"]["data"]
-        profile_url = base64.b64decode(data).decode("utf-8")
-        logger.info(f"Scraping profile: {profile_url}")
+        profile_urls = parse_profile_urls(base64.b64decode(data).decode("utf-8"))
+        if not profile_urls:
+            raise ValueError("No profile URLs in message")
+        logger.info(f"Scraping {len(profile_urls)} profile(s): {profile_urls[:5]}")
+        clients.log_cold_start("scrape_tiktok")
 
-        # Use ScrapingBee to fetch the page
         scrapingbee_api_key = os.environ.get("SCRAPINGBEE_API_KEY")
         if not scrapingbee_api_key:
             raise ValueError("SCRAPINGBEE_API_KEY environment variable not set")
-        scrapingbee_url = "https://app.scrapingbee.com/api/v1/"
-        params = {
-            "api_key": scrapingbee_api_key,
-            "url": profile_url,
-            "render_js": "true",
-            "wait": "5000",  # Increased to 5 seconds to ensure thumbnails load
-        }
-        response = requests.get(scrapingbee_url, params=params)
-        response.raise_for_status()
-        html_content = response.text
-        logger.info("Successfully fetched page using ScrapingBee.")
+        profile_urls = split_batch(profile_urls)
 
-        # Save the HTML to Google Cloud Storage
-        storage_client = storage.Client()
-        bucket = storage_client.bucket("tiktok-raw-data")
-        timestamp = time.strftime("%Y%m%d-%H%M%S")
-        username = profile_url.split('@')[-1]
-        blob_path = f"profiles/{username}/{timestamp}.html"
-        blob = bucket.blob(blob_path)
-        blob.upload_from_string(html_content, content_type="text/html")
-        logger.info(f"Saved raw HTML to gs://tiktok-raw-data/{blob_path}")
+        results, summary = batch_scraper.run_batch(
+            profile_urls, lambda profile_url: scrape_profile(profile_url, scrapingbee_api_key)
+        )
+        clients.log_client_init("scrape_tiktok")
+        # Partial failures are only logged: redelivering the message would
+        # re-scrape (and re-bill) every profile that already succeeded.
+        if not summary["succeeded"]:
+            raise RuntimeError(f"All {len(results)} profile scrapes failed, first error: {results[0]['error']}")
     except Exception as e:
         logger.error(f"Error in scrape_tiktok: {str(e)}")
-        raise
\ No newline at end of file
+        raise
@@ -0,0 +1,198 @@
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Lightweight per-invocation instrumentation. An invocation runs inside
+# trace(...); code anywhere below it times its stages with span(...), and the
+# trace is written as one structured JSON log line when it ends, e.g. for a
+# processed file:
+#
+#   {"metric": "trace", "function": "process_tiktok_data", "file": ...,
+#    "spans_ms": {"read_json": 12.1, "extract_json": 3.4, ...}, "total_ms": ...}
+#
+# Span durations also feed per-instance histograms, logged every
+# METRICS_SUMMARY_EVERY traces. METRICS_MODE=off turns all of it into no-ops.
+# Payload-sized log lines (whole record lists) are only written for a sample
+# of invocations, see sample_payload().
+#
+# Every function directory deploys its own copy of this file; edit them
+# together. tests/test_shared_modules.py fails when the copies differ.
+
+METRICS_MODE = os.environ.get("METRICS_MODE", "log")
+METRICS_SUMMARY_EVERY = int(os.environ.get("METRICS_SUMMARY_EVERY", "100"))
+PAYLOAD_LOG_SAMPLE_RATE = float(os.environ.get("PAYLOAD_LOG_SAMPLE_RATE", "0"))
+
+HISTOGRAM_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000, 5000, 30000)
+
+# --- Spans and Traces ---
+class _Span:
+    __slots__ = ("_trace", "_name", "_started")
+
+    def __init__(self, trace, name):
+        self._trace = trace
+        self._name = name
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._trace.record(self._name, time.perf_counter() - self._started)
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Trace:
+    def __init__(self, function_name, metric="trace", **labels):
+        self.function_name = function_name
+        self.metric = metric
+        self.labels = labels
+        self.attrs = {}
+        self.counters = {}
+        self.spans = {}
+        self._started = time.perf_counter()
+
+    def span(self, name):
+        return _Span(self, name)
+
+    # Repeated spans of the same name add up
+    def record(self, name, seconds):
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def incr(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def entry(self):
+        entry = {"metric": self.metric, "function": self.function_name}
+        entry.update(self.labels)
+        entry.update(self.attrs)
+        if self.counters:
+            entry["counters"] = self.counters
+        entry["spans_ms"] = {name: round(seconds * 1000, 3) for name, seconds in self.spans.items()}
+        entry["total_ms"] = round((time.perf_counter() - self._started) * 1000, 3)
+        return entry
+
+    def emit(self):
+        with _histogram_lock:
+            for name, seconds in self.spans.items():
+                _observe(self.function_name, name, seconds)
+            summary = _histograms_due(self.function_name)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps(self.entry(), default=str))
+        if summary is not None and logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps({"metric": "span_histograms", "function": self.function_name, "spans": summary}))
+
+
+class _NoopTrace:
+    __slots__ = ()
+
+    def span(self, name):
+        return _NOOP_SPAN
+
+    def record(self, name, seconds):
+        pass
+
+    def set(self, **attrs):
+        pass
+
+    def incr(self, name, value=1):
+        pass
+
+    def emit(self):
+        pass
+
+
+NOOP_TRACE = _NoopTrace()
+
+_current_trace = contextvars.ContextVar("metrics_trace", default=NOOP_TRACE)
+
+@contextlib.contextmanager
+def trace(function_name, metric="trace", **labels):
+    if METRICS_MODE == "off":
+        yield NOOP_TRACE
+        return
+    current = Trace(function_name, metric, **labels)
+    token = _current_trace.set(current)
+    try:
+        yield current
+    except Exception as e:
+        current.set(error=type(e).__name__)
+        raise
+    finally:
+        _current_trace.reset(token)
+        current.emit()
+
+def current_trace():
+    return _current_trace.get()
+
+def span(name):
+    return _current_trace.get().span(name)
+
+# --- Debug Sampling for Payload-Sized Logs ---
+def sample_payload():
+    return PAYLOAD_LOG_SAMPLE_RATE > 0 and random.random() < PAYLOAD_LOG_SAMPLE_RATE
+
+# --- Per-Instance Histograms ---
+_histograms = {}
+_traces_since_summary = {}
+_histogram_lock = threading.Lock()
+
+def _observe(function_name, name, seconds):
+    histogram = _histograms.setdefault((function_name, name), {
+        "count": 0, "sum_ms": 0.0, "max_ms": 0.0, "buckets": [0] * (len(HISTOGRAM_BUCKETS_MS) + 1),
+    })
+    milliseconds = seconds * 1000
+    histogram["count"] += 1
+    histogram["sum_ms"] += milliseconds
+    histogram["max_ms"] = max(histogram["max_ms"], milliseconds)
+    for index, bound in enumerate(HISTOGRAM_BUCKETS_MS):
+        if milliseconds <= bound:
+            histogram["buckets"][index] += 1
+            break
+    else:
+        histogram["buckets"][-1] += 1
+
+def histograms(function_name):
+    snapshot = {}
+    for (function, name), histogram in _histograms.items():
+        if function != function_name:
+            continue
+        labels = [f"le_{bound}" for bound in HISTOGRAM_BUCKETS_MS] + ["inf"]
+        snapshot[name] = {
+            "count": histogram["count"],
+            "sum_ms": round(histogram["sum_ms"], 3),
+            "max_ms": round(histogram["max_ms"], 3),
+            "buckets": dict(zip(labels, histogram["buckets"])),
+        }
+    return snapshot
+
+# Called with _histogram_lock held; returns a snapshot every METRICS_SUMMARY_EVERY traces
+def _histograms_due(function_name):
+    count = _traces_since_summary.get(function_name, 0) + 1
+    if count < METRICS_SUMMARY_EVERY:
+        _traces_since_summary[function_name] = count
+        return None
+    _traces_since_summary[function_name] = 0
+    return histograms(function_name)
@@ -0,0 +1,40 @@
+import os
+import sys
+
+import pytest
+
+# Tests live under tests/<function directory>/ and import that function's
+# modules as top-level siblings, as the deployed function does. main, clients
+# and metrics exist in every function directory, so before a function's test
+# modules are imported, and before each of its tests runs, its directory goes
+# to the front of sys.path and another function's copies of those modules are
+# dropped from sys.modules.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FUNCTIONS = ("process_tiktok_data", "recrawl_scheduler", "scrape_tiktok")
+SHARED_MODULES = ("main", "clients", "metrics")
+
+def _function_for(path):
+    parts = os.path.relpath(str(path), os.path.join(ROOT, "tests")).split(os.sep)
+    return parts[0] if parts[0] in FUNCTIONS else None
+
+def use_function(function):
+    directory = os.path.join(ROOT, function)
+    for name in SHARED_MODULES:
+        module = sys.modules.get(name)
+        if module is not None and os.path.dirname(os.path.abspath(module.__file__)) != directory:
+            del sys.modules[name]
+    if directory in sys.path:
+        sys.path.remove(directory)
+    sys.path.insert(0, directory)
+
+def pytest_collectstart(collector):
+    if isinstance(collector, pytest.Module):
+        function = _function_for(collector.path)
+        if function:
+            use_function(function)
+
+def pytest_runtest_setup(item):
+    function = _function_for(item.path)
+    if function:
+        use_function(function)
@@ -0,0 +1,90 @@
+import pytest
+from google.cloud import bigquery
+
+import batch_loader
+import records
+import schemas
+from local_gcp import LocalBigQueryClient, LocalStorageClient
+
+VIDEO_URL = "https://www.tiktok.com/@alice/video/1"
+
+@pytest.fixture
+def clients():
+    batch_loader.forget_tables()
+    storage_client = LocalStorageClient()
+    bq_client = LocalBigQueryClient(storage_client)
+    for table_id, fields in ((batch_loader.PROFILE_TABLE_ID, schemas.PROFILE_FIELDS), (batch_loader.VIDEO_TABLE_ID, schemas.VIDEO_FIELDS)):
+        bq_client.create_table(bigquery.Table(table_id, schema=schemas.to_schema(fields)))
+    yield storage_client, bq_client
+    batch_loader.forget_tables()
+
+def stage(storage_client, day, views):
+    timestamp = f"2024-01-0{day}T00:00:00Z"
+    profile = {"username": "alice", "follower_count": views, "scrape_timestamp": timestamp}
+    videos = records.VideoBatch.from_rows([{"url": VIDEO_URL, "views": views}], username="alice")
+    return batch_loader.stage_processed(storage_client, profile, videos, username="alice", scrape_timestamp=timestamp)
+
+def names(storage_client, prefix):
+    return [blob.name for blob in storage_client.list_blobs(batch_loader.PROCESSED_BUCKET, prefix=prefix)]
+
+def views(bq_client):
+    return {row["url"]: row["views"] for row in bq_client.rows(batch_loader.VIDEO_TABLE_ID)}
+
+def test_claimed_files_are_left_to_their_flush(clients):
+    storage_client, bq_client = clients
+    name = stage(storage_client, 1, 100)
+    bucket = storage_client.bucket(batch_loader.PROCESSED_BUCKET)
+    assert batch_loader._claim(bucket, name, "other_batch") is not None
+
+    assert batch_loader.flush_batch(storage_client, bq_client, [name]) is None
+    assert names(storage_client, batch_loader.PENDING_PREFIX) == [name]
+    assert views(bq_client) == {}
+
+def test_stale_claim_is_taken_over(clients, monkeypatch):
+    storage_client, bq_client = clients
+    name = stage(storage_client, 1, 100)
+    bucket = storage_client.bucket(batch_loader.PROCESSED_BUCKET)
+    batch_loader._claim(bucket, name, "crashed_batch")
+
+    monkeypatch.setattr(batch_loader, "BATCH_CLAIM_TIMEOUT_SECONDS", 0)
+    result = batch_loader.flush_batch(storage_client, bq_client, [name])
+    assert result["files"] == 1
+    assert views(bq_client) == {VIDEO_URL: 100}
+    assert names(storage_client, batch_loader.PENDING_PREFIX) == []
+    assert names(storage_client, batch_loader.CLAIMS_PREFIX) == []
+
+def test_claims_are_released_when_a_flush_fails(clients, monkeypatch):
+    storage_client, bq_client = clients
+    name = stage(storage_client, 1, 100)
+    query = bq_client.query
+
+    def failing_query(statement, job_config=None):
+        if "MERGE INTO" in statement:
+            raise RuntimeError("MERGE failed")
+        return query(statement, job_config=job_config)
+
+    monkeypatch.setattr(bq_client, "query", failing_query)
+    with pytest.raises(RuntimeError):
+        batch_loader.flush_batch(storage_client, bq_client, [name])
+    assert names(storage_client, batch_loader.PENDING_PREFIX) == [name]
+    assert names(storage_client, batch_loader.CLAIMS_PREFIX) == []
+
+    # The next flush picks the file up again at once
+    monkeypatch.setattr(bq_client, "query", query)
+    assert batch_loader.flush_batch(storage_client, bq_client, [name])["files"] == 1
+    assert views(bq_client) == {VIDEO_URL: 100}
+
+def test_older_scrape_in_the_same_batch_loses(clients):
+    storage_client, bq_client = clients
+    # The retry of an older scrape is staged after the newer one
+    pending = [stage(storage_client, 2, 200), stage(storage_client, 1, 100)]
+    batch_loader.flush_batch(storage_client, bq_client, pending)
+    assert views(bq_client) == {VIDEO_URL: 200}
+
+def test_older_scrape_in_a_later_batch_loses(clients):
+    storage_client, bq_client = clients
+    batch_loader.flush_batch(storage_client, bq_client, [stage(storage_client, 2, 200)])
+    batch_loader.flush_batch(storage_client, bq_client, [stage(storage_client, 1, 100)])
+    assert views(bq_client) == {VIDEO_URL: 200}
+    [profile] = bq_client.rows(batch_loader.PROFILE_TABLE_ID)
+    assert profile["follower_count"] == 200
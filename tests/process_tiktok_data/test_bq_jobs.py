@@ -0,0 +1,118 @@
+import threading
+import time
+
+import pytest
+
+import bq_jobs
+import metrics
+
+@pytest.fixture(autouse=True)
+def fast_polling(monkeypatch):
+    monkeypatch.setattr(bq_jobs, "POLL_INTERVAL_SECONDS", 0.001)
+    monkeypatch.setattr(bq_jobs, "MAX_POLL_INTERVAL_SECONDS", 0.005)
+
+class FakeJob:
+    def __init__(self, name, seconds=0.0, error=None):
+        self.name = name
+        self.error = error
+        self._finishes = time.monotonic() + seconds
+
+    def done(self):
+        return time.monotonic() >= self._finishes
+
+    def result(self):
+        while not self.done():
+            time.sleep(0.001)
+        if self.error is not None:
+            raise self.error
+        return self
+
+# A load then a MERGE, recording each step in events as (pipeline, step).
+# Run concurrently, a pipeline is only resumed once its job is done.
+def pipeline(name, events, load_seconds=0.0, merge_seconds=0.0, error=None, concurrent=True):
+    with metrics.span(f"{name}_upload"):
+        events.append((name, "upload"))
+    load_job = FakeJob("load", load_seconds)
+    events.append((name, "load submitted"))
+    resumed_with = yield load_job
+    assert resumed_with is load_job and (load_job.done() or not concurrent)
+    load_job.result()
+    events.append((name, "load done"))
+    merge_job = FakeJob("merge", merge_seconds, error)
+    resumed_with = yield merge_job
+    assert resumed_with is merge_job and (merge_job.done() or not concurrent)
+    merge_job.result()
+    events.append((name, "merge done"))
+    return name
+
+def steps(events, name):
+    return [step for pipeline_name, step in events if pipeline_name == name]
+
+def test_steps_keep_their_order_within_each_pipeline():
+    events = []
+    results = bq_jobs.run_pipelines({
+        "profiles": pipeline("profiles", events, load_seconds=0.2),
+        "videos": pipeline("videos", events, merge_seconds=0.02),
+    })
+    assert results == {"profiles": "profiles", "videos": "videos"}
+    for name in ("profiles", "videos"):
+        assert steps(events, name) == ["upload", "load submitted", "load done", "merge done"]
+    # The slow load did not hold the other pipeline back
+    assert events.index(("videos", "merge done")) < events.index(("profiles", "load done"))
+
+def test_one_failing_pipeline_does_not_stop_the_others():
+    events = []
+    with pytest.raises(RuntimeError, match="videos MERGE failed"):
+        bq_jobs.run_pipelines({
+            "profiles": pipeline("profiles", events, load_seconds=0.02),
+            "videos": pipeline("videos", events, error=RuntimeError("videos MERGE failed")),
+            "video_snapshots": pipeline("video_snapshots", events, merge_seconds=0.02),
+        })
+    assert steps(events, "profiles")[-1] == "merge done"
+    assert steps(events, "video_snapshots")[-1] == "merge done"
+    assert steps(events, "videos")[-1] == "load done"
+
+def test_first_error_in_the_given_order_is_raised():
+    events = []
+    with pytest.raises(RuntimeError, match="profiles"):
+        bq_jobs.run_pipelines({
+            "profiles": pipeline("profiles", events, load_seconds=0.03, error=RuntimeError("profiles")),
+            "videos": pipeline("videos", events, error=RuntimeError("videos")),
+        })
+
+def test_spans_land_on_the_callers_trace(monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_MODE", "log")
+    events = []
+    traces = {}
+    errors = []
+
+    # Two flushes at once, each with its own trace, as on one warm instance
+    def flush(label):
+        try:
+            with metrics.trace("process_tiktok_data", file=label) as trace:
+                with metrics.span("bq_jobs"):
+                    bq_jobs.run_pipelines({
+                        f"{label}_profiles": pipeline(f"{label}_profiles", events, load_seconds=0.02),
+                        f"{label}_videos": pipeline(f"{label}_videos", events, merge_seconds=0.02),
+                    })
+            traces[label] = trace
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=flush, args=(label,)) for label in ("first", "second")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    for label in ("first", "second"):
+        assert set(traces[label].spans) == {"bq_jobs", f"{label}_profiles_upload", f"{label}_videos_upload"}
+    assert metrics.current_trace() is metrics.NOOP_TRACE
+
+def test_serial_mode_runs_pipelines_one_after_another():
+    events = []
+    bq_jobs.run_pipelines({
+        "profiles": pipeline("profiles", events, load_seconds=0.02, concurrent=False),
+        "videos": pipeline("videos", events, concurrent=False),
+    }, mode="serial")
+    assert [name for name, _ in events] == ["profiles"] * 4 + ["videos"] * 4
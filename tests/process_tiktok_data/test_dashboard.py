@@ -0,0 +1,93 @@
+import pytest
+from google.cloud import bigquery
+
+import batch_loader
+import dashboard
+import records
+import schemas
+from local_gcp import LocalBigQueryClient, LocalStorageClient
+
+@pytest.fixture
+def clients(monkeypatch):
+    monkeypatch.setattr(dashboard, "DASHBOARD_TABLES", "incremental")
+    monkeypatch.setattr(dashboard, "DASHBOARD_TOP_VIDEOS", 2)
+    monkeypatch.setattr(batch_loader, "VIDEO_LOAD_MODE", "merge")
+    batch_loader.forget_tables()
+    storage_client = LocalStorageClient()
+    bq_client = LocalBigQueryClient(storage_client)
+    for table_id, fields in ((batch_loader.PROFILE_TABLE_ID, schemas.PROFILE_FIELDS), (batch_loader.VIDEO_TABLE_ID, schemas.VIDEO_FIELDS)):
+        bq_client.create_table(bigquery.Table(table_id, schema=schemas.to_schema(fields)))
+    yield storage_client, bq_client
+    batch_loader.forget_tables()
+
+def url(username, index):
+    return f"https://www.tiktok.com/@{username}/video/{index}"
+
+# Stages one scrape of username and flushes it as its own batch
+def flush(clients, username, day, followers, verified=False, views=None):
+    storage_client, bq_client = clients
+    timestamp = f"2024-01-{day:02d}T00:00:00Z"
+    profile = {"username": username, "follower_count": followers, "is_verified": verified, "scrape_timestamp": timestamp}
+    videos = records.VideoBatch.from_rows([{"url": url(username, index), "views": count} for index, count in (views or {}).items()])
+    pending = [batch_loader.stage_processed(storage_client, profile, videos, username=username, scrape_timestamp=timestamp)]
+    assert batch_loader.flush_batch(storage_client, bq_client, pending)["files"] == 1
+
+def creators(bq_client):
+    return {row["username"]: (row["follower_count"], row["is_verified"])
+            for row in bq_client.rows(batch_loader.DASHBOARD_TABLE_IDS["creators"])}
+
+def verified_share(bq_client):
+    return {row["is_verified"]: (row["creators"], row["follower_count"])
+            for row in bq_client.rows(batch_loader.DASHBOARD_TABLE_IDS["verified_share"])}
+
+def top_videos(bq_client):
+    return {row["url"]: row["views"] for row in bq_client.rows(batch_loader.DASHBOARD_TABLE_IDS["top_videos"])}
+
+def test_flush_updates_the_dashboard_incrementally(clients):
+    _, bq_client = clients
+    flush(clients, "alice", 1, 100, verified=True)
+    flush(clients, "bob", 1, 50)
+    assert creators(bq_client) == {"alice": (100, True), "bob": (50, False)}
+    assert verified_share(bq_client) == {True: (1, 100), False: (1, 50)}
+
+    flush(clients, "alice", 2, 150, verified=False)
+    assert creators(bq_client) == {"alice": (150, False), "bob": (50, False)}
+    assert verified_share(bq_client) == {True: (0, 0), False: (2, 200)}
+
+    # A late retry of alice's first scrape changes nothing
+    flush(clients, "alice", 1, 100, verified=True)
+    assert creators(bq_client) == {"alice": (150, False), "bob": (50, False)}
+    assert verified_share(bq_client) == {True: (0, 0), False: (2, 200)}
+
+def test_video_moves_between_top_buckets(clients):
+    _, bq_client = clients
+    flush(clients, "alice", 1, 100, views={1: 300, 2: 200, 3: 100})
+    assert top_videos(bq_client) == {url("alice", 1): 300, url("alice", 2): 200}
+
+    # Video 3 climbs past both, pushing video 2 out of the top 2
+    flush(clients, "alice", 2, 100, views={1: 310, 2: 210, 3: 400})
+    assert top_videos(bq_client) == {url("alice", 3): 400, url("alice", 1): 310}
+
+    # Another creator's video takes the first place
+    flush(clients, "bob", 2, 10, views={1: 500})
+    assert top_videos(bq_client) == {url("bob", 1): 500, url("alice", 3): 400}
+
+def test_reconciliation_corrects_drift(clients):
+    _, bq_client = clients
+    flush(clients, "alice", 1, 100, verified=True, views={1: 300, 2: 200, 3: 100})
+    flush(clients, "bob", 1, 50)
+    assert batch_loader.reconcile_dashboard(bq_client) == {"creators": 0, "verified_share": 0, "top_videos": 0}
+
+    # A listed video whose views drop keeps its place until the reconciliation
+    flush(clients, "alice", 2, 100, verified=True, views={1: 50})
+    assert top_videos(bq_client) == {url("alice", 1): 50, url("alice", 2): 200}
+    # and so does a creator row lost outside the pipeline
+    bq_client.query(f"DELETE FROM `{batch_loader.DASHBOARD_TABLE_IDS['creators']}` WHERE username = 'bob'").result()
+
+    corrected = batch_loader.reconcile_dashboard(bq_client)
+    assert corrected["creators"] == 1
+    assert corrected["top_videos"] > 0
+    assert top_videos(bq_client) == {url("alice", 2): 200, url("alice", 3): 100}
+    assert creators(bq_client) == {"alice": (100, True), "bob": (50, False)}
+    assert verified_share(bq_client) == {True: (1, 100), False: (1, 50)}
+    assert batch_loader.reconcile_dashboard(bq_client) == {"creators": 0, "verified_share": 0, "top_videos": 0}
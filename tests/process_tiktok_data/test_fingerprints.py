@@ -0,0 +1,44 @@
+import fingerprints
+import records
+
+CDN = "https://p16-sign-va.tiktokcdn.com/obj/tos-maliva-p-0068/cover.jpeg"
+
+def scrape(signature, views=100):
+    profile = {
+        "username": "alice",
+        "follower_count": 10,
+        "profile_pic_url": f"{CDN}?x-expires=1700000000&x-signature={signature}",
+        "scrape_timestamp": f"2024-01-0{signature}T00:00:00Z",
+    }
+    videos = records.VideoBatch.from_rows([
+        {"url": "https://www.tiktok.com/@alice/video/1", "views": views,
+         "thumbnail": f"{CDN}?x-expires=1700000000&x-signature={signature}"},
+        {"url": "https://www.tiktok.com/@alice/video/2", "views": 5, "thumbnail": None},
+    ], username="alice")
+    return profile, videos
+
+def test_columnar_digests_match_record_digest():
+    _, videos = scrape(1)
+    assert videos.digests() == [fingerprints.record_digest(row) for row in videos]
+
+def test_only_the_signature_changed_is_skipped():
+    store = fingerprints.SqliteDigestStore()
+    profile, videos = scrape(1)
+    first = fingerprints.detect_changes(store, "alice", profile, videos)
+    assert len(first.changed_videos) == 2
+    first.commit(store)
+
+    profile, videos = scrape(2)
+    second = fingerprints.detect_changes(store, "alice", profile, videos)
+    assert second.unchanged
+    assert second.unchanged_videos == 2
+
+def test_changed_counts_are_still_detected():
+    store = fingerprints.SqliteDigestStore()
+    profile, videos = scrape(1)
+    fingerprints.detect_changes(store, "alice", profile, videos).commit(store)
+
+    profile, videos = scrape(2, views=150)
+    changes = fingerprints.detect_changes(store, "alice", profile, videos)
+    assert changes.profile_data is None
+    assert list(changes.changed_videos.columns["url"]) == ["https://www.tiktok.com/@alice/video/1"]
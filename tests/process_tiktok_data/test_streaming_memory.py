@@ -0,0 +1,19 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+CHECK = os.path.join(os.path.dirname(__file__), "..", "..", "benchmarks", "check_streaming_memory.py")
+
+# Peak RSS is read from /proc (VmHWM), which only starts afresh at exec on Linux
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="needs /proc/self/status")
+def test_streaming_peak_rss_levels_off():
+    # Both sizes are past the point where the chunk buffers stop growing, so
+    # any growth between them is per-post memory that is never released
+    completed = subprocess.run(
+        [sys.executable, CHECK, "--sizes", "64000,128000", "--tolerance-mb", "4"],
+        capture_output=True, text=True, timeout=600,
+    )
+    assert completed.returncode == 0, completed.stdout + completed.stderr
+    assert completed.stdout.strip().splitlines()[-1].startswith("OK")
@@ -0,0 +1,72 @@
+import json
+
+import pytest
+
+import scheduler
+from local_pubsub import LocalPublisherClient
+
+NOW = 1_700_000_000.0
+HOUR = scheduler.HOUR
+
+@pytest.fixture(autouse=True)
+def budget(monkeypatch):
+    monkeypatch.setattr(scheduler, "RECRAWL_CREDIT_BUDGET_PER_HOUR", 10.0)
+    monkeypatch.setattr(scheduler, "RECRAWL_CREDITS_PER_SCRAPE", 5.0)
+    monkeypatch.setattr(scheduler, "RECRAWL_DEFAULT_INTERVAL_HOURS", 24.0)
+
+def url(username):
+    return f"https://www.tiktok.com/@{username}"
+
+def observation(username, hours_ago, credits=None):
+    return {"username": username, "profile_url": url(username), "scrape_timestamp": NOW - hours_ago * HOUR,
+            "follower_count": 100, "total_like_count": 1000, "credits": credits}
+
+class Run:
+    def __init__(self, observations=()):
+        self.store = scheduler.MemoryStateStore()
+        self.source = scheduler.MemoryObservationSource(observations)
+        self.publisher = LocalPublisherClient()
+        self.topic = self.publisher.topic_path("local", "scrape-tiktok-topic")
+
+    # The profile URLs published by one run at now
+    def __call__(self, now, add_urls=()):
+        self.publisher.pull(self.topic)
+        result = scheduler.run_scheduler(self.store, self.source, self.publisher, self.topic, now=now, add_urls=add_urls)
+        assert not result.get("conflict")
+        return [profile_url for message in self.publisher.pull(self.topic) for profile_url in json.loads(message.data)]
+
+def test_budget_runs_out_within_the_hour():
+    run = Run()
+    creators = [url(f"creator_{index}") for index in range(5)]
+    assert len(run(NOW, add_urls=creators)) == 2
+    # Half an hour later the 10 credits are still spent
+    assert run(NOW + 0.5 * HOUR) == []
+    state, _ = run.store.load()
+    assert [entry[1] for entry in state["ledger"]] == [5.0, 5.0]
+    assert scheduler.RecrawlScheduler(state).due_count(NOW + 0.5 * HOUR) == 3
+
+def test_ledger_rolls_over_after_an_hour():
+    run = Run()
+    creators = [url(f"creator_{index}") for index in range(5)]
+    first = run(NOW, add_urls=creators)
+    second = run(NOW + HOUR + 1)
+    assert len(second) == 2
+    assert not set(first) & set(second)
+    state, _ = run.store.load()
+    # Only the publishes of the last hour are left in the ledger
+    assert [entry[0] for entry in state["ledger"]] == [NOW + HOUR + 1] * 2
+    assert state["totals"]["credits"] == 20.0
+
+def test_most_overdue_creators_go_first():
+    # Each is due 24 hours after its last scrape: alice 6 hours ago, carol 4, dave 3, bob 2
+    run = Run([observation("bob", 26), observation("alice", 30), observation("carol", 28), observation("dave", 27)])
+    assert run(NOW) == [url("alice"), url("carol")]
+    assert run(NOW + HOUR + 1) == [url("dave"), url("bob")]
+
+def test_expensive_creator_does_not_hold_back_cheaper_ones():
+    run = Run([observation("alice", 30, credits=1), observation("bob", 29, credits=5), observation("carol", 28, credits=5),
+               observation("dave", 27, credits=1), observation("erin", 26, credits=1)])
+    # After alice and bob, 4 credits are left: carol is skipped, dave and erin still fit
+    assert run(NOW) == [url("alice"), url("bob"), url("dave"), url("erin")]
+    # carol stayed queued and is first once the hour has passed
+    assert run(NOW + HOUR + 1)[0] == url("carol")
@@ -0,0 +1,63 @@
+import pytest
+import requests
+
+import batch_scraper
+import fetch_tiers
+from local_scrapingbee import APP_SHELL, synthetic_page
+
+PROFILE_URL = "https://www.tiktok.com/@alice"
+
+def response(status_code, text=""):
+    page = requests.Response()
+    page.status_code = status_code
+    page._content = text.encode("utf-8")
+    page.url = "https://app.scrapingbee.com/api/v1/"
+    return page
+
+# Answers each tier with the given status and page, recording the tiers asked for
+class TieredSession:
+    def __init__(self, plain, render):
+        self.answers = {"false": plain, "true": render}
+        self.tiers = []
+
+    def get(self, url, params=None, timeout=None):
+        self.tiers.append("plain" if params["render_js"] == "false" else "render")
+        return response(*self.answers[params["render_js"]])
+
+@pytest.fixture(autouse=True)
+def no_retries(monkeypatch):
+    monkeypatch.setattr(batch_scraper, "SCRAPE_MAX_RETRIES", 0)
+    monkeypatch.setattr(fetch_tiers, "SCRAPE_FETCH_MODE", "tiered")
+
+def fetch(session, store=None):
+    return fetch_tiers.fetch_profile(session, "https://app.scrapingbee.com/api/v1/", "key", PROFILE_URL, store=store)
+
+def test_username_ignores_a_trailing_slash():
+    assert fetch_tiers.username_for(PROFILE_URL) == "alice"
+    assert fetch_tiers.username_for(PROFILE_URL + "/") == "alice"
+
+def test_plain_page_with_payload_stops_there():
+    session = TieredSession((200, synthetic_page(PROFILE_URL)), (200, synthetic_page(PROFILE_URL)))
+    _, summary = fetch(session)
+    assert session.tiers == ["plain"]
+    assert summary["credits"] == 1 and summary["payload"]
+
+@pytest.mark.parametrize("plain", [(403, "Forbidden"), (503, "Unavailable"), (200, APP_SHELL)])
+def test_plain_failure_escalates_to_render(plain):
+    session = TieredSession(plain, (200, synthetic_page(PROFILE_URL)))
+    store = fetch_tiers.MemoryTierStore()
+    page, summary = fetch(session, store)
+    assert session.tiers == ["plain", "render"]
+    assert page.status_code == 200
+    assert summary["tier"] == "render" and summary["payload"]
+    # A failed plain request is not billed; a plain page without the payload is
+    assert summary["credits"] == (5 if plain[0] != 200 else 6)
+    assert store.get("alice")["tier"] == "render"
+
+def test_failed_render_after_failed_plain_raises():
+    session = TieredSession((403, "Forbidden"), (503, "Unavailable"))
+    with pytest.raises(batch_scraper.FetchError) as raised:
+        fetch(session)
+    assert session.tiers == ["plain", "render"]
+    assert raised.value.status_code == 503
+    assert raised.value.attempts == 2
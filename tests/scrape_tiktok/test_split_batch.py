@@ -0,0 +1,38 @@
+import json
+
+import clients
+import main
+
+class RecordingPublisher:
+    def __init__(self):
+        self.messages = []
+
+    def topic_path(self, project, topic):
+        return f"projects/{project}/topics/{topic}"
+
+    def publish(self, topic, data):
+        self.messages.append((topic, json.loads(data)))
+        return self
+
+    def result(self, timeout=None):
+        return str(len(self.messages))
+
+def urls(count):
+    return [f"https://www.tiktok.com/@creator_{index}" for index in range(count)]
+
+def test_small_batch_is_scraped_whole(monkeypatch):
+    publisher = RecordingPublisher()
+    monkeypatch.setitem(clients._clients, "publisher", publisher)
+    assert main.split_batch(urls(200), max_batch=200) == urls(200)
+    assert publisher.messages == []
+
+def test_big_batch_is_split_and_republished(monkeypatch):
+    publisher = RecordingPublisher()
+    monkeypatch.setitem(clients._clients, "publisher", publisher)
+    kept = main.split_batch(urls(450), max_batch=200)
+    assert kept == urls(200)
+    topic = publisher.topic_path(main.PROJECT_ID, main.SCRAPE_TOPIC)
+    assert [published_topic for published_topic, _ in publisher.messages] == [topic, topic]
+    assert [batch for _, batch in publisher.messages] == [urls(450)[200:400], urls(450)[400:]]
+    # Each republished message parses back to its own batch
+    assert main.parse_profile_urls(json.dumps(publisher.messages[-1][1])) == urls(450)[400:]
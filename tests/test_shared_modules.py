@@ -0,0 +1,17 @@
+import filecmp
+import os
+
+import pytest
+
+# Each Cloud Function deploys only its own directory, so modules shared by
+# all of them are copied into each one. The copies must stay identical.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FUNCTIONS = ("process_tiktok_data", "recrawl_scheduler", "scrape_tiktok")
+COPIED_MODULES = ("clients", "metrics")
+
+@pytest.mark.parametrize("module", COPIED_MODULES)
+def test_copies_are_identical(module):
+    first, *others = [os.path.join(ROOT, function, f"{module}.py") for function in FUNCTIONS]
+    differing = [path for path in others if not filecmp.cmp(first, path, shallow=False)]
+    assert not differing, f"{module}.py differs from {os.path.relpath(first, ROOT)} in: " + ", ".join(
+        os.path.relpath(path, ROOT) for path in differing)